@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML MHC-I Binding Scorer
+===============================
+In-process, position-specific scoring matrices (PSSMs) for fast MHC-I
+binding triage, so the IC50 < 500 nM criterion can be applied without
+shelling out to NetMHCpan per allele.
+
+Matrices are built from TumorAgDB: for every allele and peptide length
+(8-11), the peptides NetMHCpan ranked as binders (mutantRankNetMHCpan <= 2)
+give position-wise residue log-odds against the background composition of
+all TumorAgDB peptides. Alleles with too few binders of a length use the
+pan-allele matrix of that length.
+
+Scoring is a NumPy gather-and-sum: peptides are encoded once as a residue
+index matrix, and for each position the (alleles x 22) matrix column block
+is gathered by residue index and summed, giving a peptides x alleles score
+matrix for all of a patient's alleles at once. Scores are turned into
+percentile ranks against random background peptides of the same length, and
+ranks into an approximate IC50 through the usual NetMHCpan anchors
+(rank 0.5% ~ 50 nM, rank 2% ~ 500 nM, log-log interpolated). The IC50 is a
+triage estimate, not a measured affinity.
+
+Usage:
+    python binding.py --build [--data ../tumordb/tumoragdb_data.csv]
+    python binding.py <peptides_file> --hla HLA-A*02:01 [--hla ...] [--output FILE]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import dump, load
+
+from peptide_score import encode_residues, read_peptides
+from schema import DEFAULT_DATA_PATH, load_table
+
+
+MODEL_PATH = Path(__file__).parent / 'output' / 'Binding' / 'pssm.joblib'
+
+LENGTHS = range(8, 12)
+
+# NetMHCpan %rank at or below which a TumorAgDB peptide counts as a binder
+BINDER_RANK = 2.0
+
+# Fewer binders than this for an allele/length falls back to the pan-allele matrix
+MIN_BINDERS = 20
+
+PSEUDOCOUNT = 1.0
+
+# Random background peptides per allele/length for the rank calibration
+N_BACKGROUND = 10_000
+
+# (rank %, IC50 nM) anchors for the approximate affinity
+RANK_ANCHORS = ((0.5, 50.0), (2.0, 500.0))
+IC50_RANGE = (1.0, 50_000.0)
+
+PAN_ALLELE = 'pan'
+
+# Residue index columns: 20 amino acids, unknown (20), padding (21)
+N_CODES = 22
+
+
+def residue_frequencies(peptides):
+    """Background amino-acid composition of a peptide collection."""
+    idx, _ = encode_residues(peptides)
+    counts = np.bincount(idx[idx < 20].astype(np.int64), minlength=20) + PSEUDOCOUNT
+    return counts / counts.sum()
+
+
+def log_odds(peptides, background, length):
+    """
+    Position-wise log2 odds matrix of equal-length peptides.
+
+    Returns:
+        float32 array (length, N_CODES); unknown and padding columns are 0
+    """
+    idx, _ = encode_residues(peptides)
+    idx = idx[:, :length].astype(np.int64)
+    matrix = np.zeros((length, N_CODES), dtype=np.float32)
+    for position in range(length):
+        counts = np.bincount(idx[:, position], minlength=N_CODES)[:20]
+        freqs = (counts + PSEUDOCOUNT * background * 20) / (counts.sum() + PSEUDOCOUNT * 20)
+        matrix[position, :20] = np.log2(freqs / background)
+    return matrix
+
+
+def rank_to_ic50(rank):
+    """Approximate IC50 (nM) from a percentile rank, log-log through RANK_ANCHORS."""
+    (r1, ic1), (r2, ic2) = RANK_ANCHORS
+    slope = (np.log10(ic2) - np.log10(ic1)) / (np.log10(r2) - np.log10(r1))
+    rank = np.maximum(np.asarray(rank, dtype=np.float64), 1e-3)
+    ic50 = 10 ** (np.log10(ic1) + slope * (np.log10(rank) - np.log10(r1)))
+    return np.clip(ic50, *IC50_RANGE)
+
+
+class BindingModel:
+    """Per-allele PSSMs with background score distributions"""
+
+    def __init__(self, alleles, matrices, backgrounds, n_binders):
+        # alleles: list of names (PAN_ALLELE last)
+        # matrices[length]: float32 (n_alleles, length, N_CODES)
+        # backgrounds[length]: float32 (n_alleles, N_BACKGROUND), sorted per allele
+        self.alleles = list(alleles)
+        self.matrices = matrices
+        self.backgrounds = backgrounds
+        self.n_binders = n_binders
+        self._index = pd.Index(self.alleles)
+
+    def allele_rows(self, alleles):
+        """Matrix rows for allele names; unknown alleles use the pan-allele row."""
+        rows = self._index.get_indexer([str(a).strip() for a in alleles])
+        rows[rows < 0] = self.alleles.index(PAN_ALLELE)
+        return rows
+
+    def score(self, peptides, alleles, batch_size=1_000_000):
+        """
+        Score every peptide against every allele.
+
+        Args:
+            peptides: Sequence of peptide strings (8-11-mers; others get NaN)
+            alleles: Sequence of HLA alleles (e.g. the patient's six)
+            batch_size: Peptides encoded per batch
+
+        Returns:
+            (scores, ranks, ic50) float32/float64 arrays of shape
+            (len(peptides), len(alleles))
+        """
+        rows = self.allele_rows(alleles)
+        n = len(peptides)
+        scores = np.full((n, len(rows)), np.nan, dtype=np.float32)
+        ranks = np.full((n, len(rows)), np.nan, dtype=np.float32)
+
+        for start in range(0, n, batch_size):
+            batch = list(peptides[start:start + batch_size])
+            idx, lengths = encode_residues(batch)
+            for length in LENGTHS:
+                members = np.flatnonzero(lengths == length)
+                if not len(members):
+                    continue
+                block = self._score_block(idx[members, :length], rows, length)
+                scores[start + members] = block
+                ranks[start + members] = self._rank(block, rows, length)
+        return scores, ranks, rank_to_ic50(ranks)
+
+    def _score_block(self, idx, rows, length):
+        # Gather-and-sum: one (n x alleles) gather per position
+        matrices = self.matrices[length][rows]            # (a, L, N_CODES)
+        total = np.zeros((len(idx), len(rows)), dtype=np.float32)
+        for position in range(length):
+            total += matrices[:, position, :].T[idx[:, position]]
+        return total
+
+    def _rank(self, scores, rows, length):
+        background = self.backgrounds[length]
+        ranks = np.empty_like(scores)
+        for j, row in enumerate(rows):
+            above = len(background[row]) - np.searchsorted(background[row], scores[:, j],
+                                                          side='right')
+            ranks[:, j] = 100.0 * above / len(background[row])
+        return ranks
+
+
+def build_binding_model(data, rank_threshold=BINDER_RANK, min_binders=MIN_BINDERS,
+                        n_background=N_BACKGROUND, random_state=42):
+    """
+    Build per-allele PSSMs from a TumorAgDB table.
+
+    Args:
+        data: DataFrame with peptide, mhcAllele and mutantRankNetMHCpan
+        rank_threshold: NetMHCpan %rank defining binders
+        min_binders: Minimum binders per allele/length for an own matrix
+        n_background: Random peptides per allele/length for rank calibration
+
+    Returns:
+        BindingModel
+    """
+    data = data.dropna(subset=['peptide', 'mhcAllele'])
+    peptides = data['peptide'].astype(str).str.strip().str.upper()
+    background = residue_frequencies(peptides.unique().tolist())
+
+    rank = pd.to_numeric(data['mutantRankNetMHCpan'], errors='coerce')
+    binders = pd.DataFrame({
+        'peptide': peptides,
+        'allele': data['mhcAllele'].astype(str).str.strip(),
+        'length': peptides.str.len(),
+    })[rank.le(rank_threshold).to_numpy()]
+    binders = binders[binders['length'].isin(LENGTHS)].drop_duplicates()
+
+    counts = binders.groupby(['allele', 'length']).size()
+    alleles = sorted(counts[counts >= min_binders].index.get_level_values(0).unique())
+    alleles.append(PAN_ALLELE)
+
+    rng = np.random.default_rng(random_state)
+    matrices, backgrounds = {}, {}
+    n_binders = {}
+    for length in LENGTHS:
+        of_length = binders[binders['length'] == length]
+        pan = log_odds(of_length['peptide'].tolist(), background, length) \
+            if len(of_length) else np.zeros((length, N_CODES), dtype=np.float32)
+
+        stack = []
+        for allele in alleles:
+            own = of_length.loc[of_length['allele'] == allele, 'peptide'].tolist()
+            n_binders[(allele, length)] = len(own) if allele != PAN_ALLELE else len(of_length)
+            stack.append(log_odds(own, background, length)
+                         if allele != PAN_ALLELE and len(own) >= min_binders else pan)
+        matrices[length] = np.stack(stack)
+
+        # Background score distribution from composition-matched random peptides
+        random_idx = rng.choice(20, size=(n_background, length), p=background)
+        scores = np.zeros((len(alleles), n_background), dtype=np.float32)
+        for position in range(length):
+            scores += matrices[length][:, position, random_idx[:, position]]
+        backgrounds[length] = np.sort(scores, axis=1)
+
+    return BindingModel(alleles, matrices, backgrounds, n_binders)
+
+
+def predict_binding(model, peptides, alleles):
+    """
+    Long-format binding predictions for every peptide x allele pair.
+
+    Returns:
+        DataFrame with peptide, mhcAllele, binding_score, binding_rank, ic50
+    """
+    scores, ranks, ic50 = model.score(peptides, alleles)
+    return pd.DataFrame({
+        'peptide': np.repeat(np.asarray(peptides, dtype=object), len(alleles)),
+        'mhcAllele': np.tile(np.asarray(alleles, dtype=object), len(peptides)),
+        'binding_score': scores.ravel(),
+        'binding_rank': ranks.ravel(),
+        'ic50': ic50.ravel(),
+    })
+
+
+def score_pairs(model, peptides, alleles):
+    """
+    Score aligned peptide/allele pairs (one allele per peptide).
+
+    Returns:
+        (ranks, ic50) arrays of len(peptides)
+    """
+    # Group rows by allele and score each group against its own allele only,
+    # so the work is one column per row whatever the number of alleles
+    peptides = np.asarray(peptides, dtype=object)
+    alleles = np.asarray(alleles, dtype=str)
+    ranks = np.full(len(peptides), np.nan, dtype=np.float32)
+    ic50 = np.full(len(peptides), np.nan, dtype=np.float64)
+    order = np.argsort(alleles, kind='stable')
+    unique, starts = np.unique(alleles[order], return_index=True)
+    for allele, members in zip(unique, np.split(order, starts[1:])):
+        _, group_ranks, group_ic50 = model.score(peptides[members], [allele])
+        ranks[members] = group_ranks[:, 0]
+        ic50[members] = group_ic50[:, 0]
+    return ranks, ic50
+
+
+def add_ic50(data, model, peptide_column='peptide', allele_column='mhcAllele'):
+    """
+    Fill an 'ic50' column for candidate rows from their own peptide and allele.
+
+    Rows that already have an IC50 (e.g. from NetMHCpan) keep it.
+
+    Returns:
+        DataFrame with ic50 (and binding_rank) columns
+    """
+    data = data.copy()
+    ranks, ic50 = score_pairs(model, data[peptide_column].astype(str).tolist(),
+                              data[allele_column].astype(str).to_numpy())
+    estimated = pd.Series(ic50, index=data.index)
+
+    data['binding_rank'] = ranks
+    if 'ic50' in data.columns:
+        data['ic50'] = pd.to_numeric(data['ic50'], errors='coerce').fillna(estimated)
+    else:
+        data['ic50'] = estimated
+    return data
+
+
+def load_binding_model(path=MODEL_PATH):
+    """Load the saved BindingModel."""
+    if not Path(path).exists():
+        raise FileNotFoundError(f"Binding model not found: {path} (run binding.py --build)")
+    return load(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Score peptides against HLA alleles with built-in MHC-I PSSMs'
+    )
+    parser.add_argument('input_file', nargs='?', help='Peptide list or CSV with a peptide column')
+    parser.add_argument('--hla', action='append',
+                        help='HLA allele to score against (repeatable, e.g. HLA-A*02:01)')
+    parser.add_argument('--output', default='binding_predictions.csv',
+                        help='Output CSV file (default: binding_predictions.csv)')
+    parser.add_argument('--build', action='store_true',
+                        help='Build the PSSMs from TumorAgDB instead of scoring')
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH,
+                        help=f'TumorAgDB table for --build (default: {DEFAULT_DATA_PATH})')
+
+    args = parser.parse_args()
+
+    if args.build:
+        print(f"\nBuilding PSSMs from {args.data}...")
+        model = build_binding_model(load_table(args.data))
+        MODEL_PATH.parent.mkdir(parents=True, exist_ok=True)
+        dump(model, MODEL_PATH)
+        print(f"✓ {len(model.alleles) - 1} alleles with own matrices (+ pan-allele fallback)")
+        print(f"✓ Saved PSSMs to: {MODEL_PATH}")
+        return
+
+    if not args.input_file or not args.hla:
+        parser.error('input_file and at least one --hla are required unless --build is given')
+
+    try:
+        model = load_binding_model()
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    peptides = read_peptides(args.input_file)['peptide'].tolist()
+    fallback = [a for a in args.hla if a not in model.alleles]
+    if fallback:
+        print(f"⚠ No own matrix for {', '.join(fallback)} - using the pan-allele matrix")
+
+    start = time.perf_counter()
+    results = predict_binding(model, peptides, args.hla)
+    elapsed = time.perf_counter() - start
+    print(f"✓ Scored {len(results):,} peptide x allele pairs in {elapsed:.2f}s "
+          f"({len(results) / max(elapsed, 1e-9):,.0f} pairs/s)")
+    print(f"✓ {(results['ic50'] < 500).sum():,} pairs with estimated IC50 < 500 nM")
+
+    results.to_csv(args.output, index=False)
+    print(f"✓ Saved predictions to: {args.output}")
+
+
+if __name__ == '__main__':
+    # Pickle as binding.BindingModel (not __main__.BindingModel, which
+    # cascade.py and dai.py cannot load); pickle checks that the name
+    # resolves to this class, so register this module under that name too
+    BindingModel.__module__ = 'binding'
+    sys.modules.setdefault('binding', sys.modules[__name__])
+    main()
@@ -0,0 +1,169 @@
+"""
+NeoTImmuML Calibration
+======================
+Out-of-fold probabilities, probability calibrators and precomputed
+operating-point tables for the trained models.
+
+train_models.py stores, per model, output/<Model>/calibration.joblib with:
+- 'method': 'isotonic' or 'sigmoid' (Platt scaling)
+- 'calibrator': fitted calibrator mapping raw to calibrated probabilities
+- 'oof': out-of-fold raw probabilities and labels used for fitting
+- 'table': precision/recall/F1 per threshold on calibrated scores
+
+predict.py applies the calibrator and picks operating points from the table
+by lookup, so nothing is refitted at inference.
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.isotonic import IsotonicRegression
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import precision_recall_curve
+from sklearn.model_selection import StratifiedKFold
+
+
+METHODS = ['isotonic', 'sigmoid']
+
+# Operating-point tables are thinned to at most this many thresholds
+TABLE_SIZE = 1000
+
+_EPS = 1e-6
+
+
+def out_of_fold_probabilities(model, X, y, folds=5, random_state=42, splits=None):
+    """
+    Cross-validated positive-class probabilities for every training row.
+
+    Args:
+        model: Unfitted (or fitted) estimator, cloned for every fold
+        X: Feature matrix
+        y: Labels
+        folds: Number of stratified folds (ignored when splits is given)
+        random_state: Seed for fold assignment
+        splits: Optional iterable of (train_idx, valid_idx) pairs
+
+    Returns:
+        numpy array of probabilities aligned with y
+    """
+    y = np.asarray(y)
+    if splits is None:
+        splits = StratifiedKFold(n_splits=folds, shuffle=True,
+                                 random_state=random_state).split(np.zeros(len(y)), y)
+
+    oof = np.full(len(y), np.nan)
+    for train_idx, valid_idx in splits:
+        fold_model = clone(model)
+        fold_model.fit(X[train_idx], y[train_idx])
+        oof[valid_idx] = fold_model.predict_proba(X[valid_idx])[:, 1]
+    return oof
+
+
+class PlattCalibrator:
+    """Logistic regression on the log-odds of the raw probability"""
+
+    def fit(self, probabilities, y):
+        self.model = LogisticRegression(C=1e6).fit(_logit(probabilities)[:, None], y)
+        return self
+
+    def predict(self, probabilities):
+        return self.model.predict_proba(_logit(probabilities)[:, None])[:, 1]
+
+
+def _logit(p):
+    p = np.clip(np.asarray(p, dtype=np.float64), _EPS, 1 - _EPS)
+    return np.log(p / (1 - p))
+
+
+def fit_calibrator(probabilities, y, method='isotonic'):
+    """
+    Fit a calibrator on out-of-fold probabilities.
+
+    Args:
+        probabilities: Raw positive-class probabilities
+        y: Labels
+        method: 'isotonic' or 'sigmoid'
+
+    Returns:
+        Fitted calibrator with a predict(probabilities) method
+    """
+    if method not in METHODS:
+        raise ValueError(f"Invalid calibration method: {method}")
+    mask = ~np.isnan(probabilities)
+    if method == 'isotonic':
+        return IsotonicRegression(out_of_bounds='clip', y_min=0.0, y_max=1.0).fit(
+            probabilities[mask], np.asarray(y)[mask])
+    return PlattCalibrator().fit(probabilities[mask], np.asarray(y)[mask])
+
+
+def operating_points(probabilities, y, size=TABLE_SIZE):
+    """
+    Precision/recall/F1 per decision threshold.
+
+    Args:
+        probabilities: Positive-class probabilities
+        y: Labels
+        size: Maximum number of rows kept
+
+    Returns:
+        DataFrame sorted by ascending threshold
+    """
+    precision, recall, thresholds = precision_recall_curve(y, probabilities)
+    table = pd.DataFrame({
+        'threshold': thresholds,
+        'precision': precision[:-1],
+        'recall': recall[:-1],
+    })
+    table['f1'] = (2 * table['precision'] * table['recall']
+                   / (table['precision'] + table['recall']).replace(0, np.nan)).fillna(0.0)
+    if len(table) > size:
+        keep = np.unique(np.linspace(0, len(table) - 1, size).astype(int))
+        table = table.iloc[keep]
+    return table.reset_index(drop=True)
+
+
+def build_calibration(model, X, y, method='isotonic', folds=5, random_state=42, splits=None):
+    """
+    Compute out-of-fold probabilities, fit a calibrator and the operating table.
+
+    Returns:
+        calibration dict (see module docstring)
+    """
+    oof = out_of_fold_probabilities(model, X, y, folds, random_state, splits)
+    calibrator = fit_calibrator(oof, y, method)
+    mask = ~np.isnan(oof)
+    calibrated = calibrator.predict(oof[mask])
+    return {
+        'method': method,
+        'calibrator': calibrator,
+        'oof': pd.DataFrame({'prob_raw': oof, 'label': np.asarray(y)}),
+        'table': operating_points(calibrated, np.asarray(y)[mask]),
+    }
+
+
+def choose_threshold(table, target_precision=None, target_recall=None):
+    """
+    Pick a decision threshold from an operating-point table.
+
+    Args:
+        table: Output of operating_points
+        target_precision: Lowest threshold reaching this precision
+        target_recall: Highest threshold keeping at least this recall
+        (with neither, the F1-optimal threshold is returned)
+
+    Returns:
+        float threshold
+    """
+    if target_precision is not None:
+        reached = table.index[table['precision'].to_numpy() >= target_precision]
+        if not len(reached):
+            raise ValueError(f"No threshold reaches precision {target_precision}")
+        return float(table.loc[reached[0], 'threshold'])
+    if target_recall is not None:
+        # Recall falls as the threshold rises, so search the reversed column
+        recall = table['recall'].to_numpy()[::-1]
+        position = np.searchsorted(recall, target_recall, side='left')
+        if position >= len(recall):
+            raise ValueError(f"No threshold keeps recall {target_recall}")
+        return float(table['threshold'].to_numpy()[::-1][position])
+    return float(table.loc[table['f1'].idxmax(), 'threshold'])
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Qualification Cascade
+================================
+Applies the filtering cascade from docs/neoantigen_qualification_guide.md
+(Matrix 3) to a candidate table before the ML scorer runs.
+
+Cheap vectorised filters (MHC binding, expression, clonality, DAI, self
+proteome, anchor position) are evaluated first, ordered by cost and measured
+selectivity, so each stage only sees the survivors of the previous one (and
+only the columns its filter reads). The NeoTImmuML model is then called on
+the remaining candidates and the final list is ranked by predicted
+immunogenicity.
+
+Usage:
+    python cascade.py <candidates_csv> [--model lightgbm|xgboost|randomforest]
+                      [--output ranked.csv] [--no-score] [--binding]
+                      [--self-index output/SelfProteome/kmers.npy]
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+# Declarative cascade. Each filter names the column it reads, a comparison and
+# a relative cost; 'keep_missing' decides what happens to rows without a value.
+DEFAULT_CASCADE = [
+    {'name': 'mhc_binding', 'column': 'ic50', 'op': '<', 'value': 500.0, 'cost': 1.0},
+    {'name': 'expression', 'column': 'rnaseqTPM', 'op': '>', 'value': 10.0, 'cost': 1.0},
+    {'name': 'clonality', 'column': 'vaf', 'op': '>', 'value': 0.3, 'cost': 1.0},
+    # dai.py leaves DAI empty without a wild-type match (indels, frameshifts)
+    {'name': 'dai', 'column': 'dai', 'op': '>', 'value': 0.0, 'cost': 1.0,
+     'keep_missing': True},
+    {'name': 'self_tolerance', 'column': 'in_self_proteome', 'op': '==', 'value': 0.0,
+     'cost': 1.0, 'keep_missing': True},
+    {'name': 'anchor_position', 'check': 'anchor', 'column': 'pepMutStart',
+     'cost': 2.0, 'keep_missing': True},
+]
+
+OPERATORS = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+
+# Sample size used to estimate how selective each filter is
+SELECTIVITY_SAMPLE = 10_000
+
+
+def _numeric(series):
+    """Return a float64 view of a column, coercing unparsable values to NaN."""
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+
+
+def anchor_mask(data, position_column='pepMutStart', length_column='lengthOfPeptide',
+                peptide_column='peptide', keep_missing=True):
+    """
+    Flag candidates whose mutation sits on an MHC-I anchor residue.
+
+    Anchors are position 2 and the C-terminal position (PΩ). Mutations there
+    change binding rather than the TCR-facing surface, so they are dropped.
+
+    Args:
+        data: Candidate DataFrame
+        position_column: 1-based mutation position within the peptide
+        length_column: Peptide length column (falls back to len(peptide))
+        peptide_column: Peptide sequence column
+        keep_missing: Keep rows with no recorded mutation position
+
+    Returns:
+        Boolean numpy array, True for rows that pass the check
+    """
+    position = _numeric(data[position_column])
+
+    if length_column in data.columns:
+        length = _numeric(data[length_column])
+    else:
+        length = data[peptide_column].astype(str).str.len().to_numpy(dtype=np.float64)
+
+    passed = (position != 2) & (position != length)
+    missing = np.isnan(position) | np.isnan(length)
+    passed[missing] = keep_missing
+    return passed
+
+
+def evaluate_filter(data, spec):
+    """
+    Evaluate one cascade filter on a DataFrame.
+
+    Args:
+        data: Candidate DataFrame
+        spec: Filter specification (see DEFAULT_CASCADE)
+
+    Returns:
+        Boolean numpy array, True for rows that pass
+    """
+    keep_missing = spec.get('keep_missing', False)
+
+    if spec.get('check') == 'anchor':
+        return anchor_mask(data, position_column=spec.get('column', 'pepMutStart'),
+                           keep_missing=keep_missing)
+
+    values = _numeric(data[spec['column']])
+    with np.errstate(invalid='ignore'):
+        passed = OPERATORS[spec['op']](values, spec['value'])
+    passed[np.isnan(values)] = keep_missing
+    return passed
+
+
+def filter_columns(data, spec):
+    """Columns of data that a filter reads (see evaluate_filter)."""
+    if spec.get('check') == 'anchor':
+        length = 'lengthOfPeptide' if 'lengthOfPeptide' in data.columns else 'peptide'
+        return [spec.get('column', 'pepMutStart'), length]
+    return [spec['column']]
+
+
+def order_filters(data, filters, sample_size=SELECTIVITY_SAMPLE, random_state=42):
+    """
+    Order filters so the cheapest, most selective ones run first.
+
+    Selectivity is measured on a random sample. Filters are sorted by
+    rejection rate per unit cost, the classic rank for independent predicates.
+
+    Args:
+        data: Candidate DataFrame
+        filters: List of filter specifications
+        sample_size: Number of rows used to estimate selectivity
+        random_state: Seed for the sample
+
+    Returns:
+        List of (spec, pass_rate) tuples in execution order
+    """
+    sample = data
+    if len(data) > sample_size:
+        sample = data.sample(n=sample_size, random_state=random_state)
+
+    ranked = []
+    for spec in filters:
+        pass_rate = float(evaluate_filter(sample, spec).mean()) if len(sample) else 1.0
+        ranked.append((spec, pass_rate))
+
+    ranked.sort(key=lambda item: (1.0 - item[1]) / item[0].get('cost', 1.0), reverse=True)
+    return ranked
+
+
+def run_cascade(data, filters=None, scorer=None, reorder=True):
+    """
+    Run the qualification cascade and rank the survivors.
+
+    Args:
+        data: Candidate DataFrame
+        filters: List of filter specifications (default: DEFAULT_CASCADE)
+        scorer: Callable taking the surviving DataFrame and returning an array
+            of immunogenicity probabilities. If None, rows are only filtered.
+        reorder: Order filters by cost and selectivity before running
+
+    Returns:
+        ranked DataFrame, funnel DataFrame (one row per stage)
+    """
+    filters = DEFAULT_CASCADE if filters is None else filters
+
+    runnable = []
+    funnel = []
+    for spec in filters:
+        if spec.get('column', 'pepMutStart') not in data.columns:
+            print(f"⚠ Skipping filter '{spec['name']}': column '{spec.get('column')}' not found")
+            funnel.append({'stage': spec['name'], 'rows_in': len(data),
+                           'rows_out': len(data), 'seconds': 0.0, 'skipped': True})
+            continue
+        runnable.append(spec)
+
+    if reorder:
+        ordered = [spec for spec, _ in order_filters(data, runnable)]
+    else:
+        ordered = runnable
+
+    # Track survivors as positional indices; each filter gets only its own
+    # columns at those rows rather than a copy of every column
+    survivors = np.arange(len(data))
+    for spec in ordered:
+        start = time.perf_counter()
+        rows_in = len(survivors)
+        if rows_in:
+            columns = {column: data[column].to_numpy()[survivors]
+                       for column in filter_columns(data, spec)}
+            passed = evaluate_filter(pd.DataFrame(columns), spec)
+            survivors = survivors[passed]
+        funnel.append({'stage': spec['name'], 'rows_in': rows_in,
+                       'rows_out': len(survivors),
+                       'seconds': time.perf_counter() - start, 'skipped': False})
+
+    result = data.iloc[survivors].reset_index(drop=True)
+
+    if scorer is not None and len(result):
+        start = time.perf_counter()
+        result['prob_positive'] = np.asarray(scorer(result), dtype=np.float64)
+        result = result.sort_values('prob_positive', ascending=False, kind='stable')
+        result = result.reset_index(drop=True)
+        funnel.append({'stage': 'immunogenicity_score', 'rows_in': len(result),
+                       'rows_out': len(result),
+                       'seconds': time.perf_counter() - start, 'skipped': False})
+
+    result.insert(0, 'rank', np.arange(1, len(result) + 1))
+    return result, pd.DataFrame(funnel)
+
+
+def model_scorer(encoder, model, calibration=None, keep=None):
+    """
+    Build a cascade scorer from a fitted encoder and model.
+
+    Args:
+        encoder: Fitted encoder (see predict.load_model_and_encoder)
+        model: Trained classification model
+        calibration: Optional calibration bundle (see predict.load_calibration)
+        keep: Kept column indices (see predict.load_feature_selection)
+
+    Returns:
+        Callable mapping a DataFrame to positive-class probabilities
+    """
+    from predict import predict_immunogenicity
+
+    def score(data):
+        features = data.reindex(columns=list(encoder.feature_names_in_))
+        results = predict_immunogenicity(features, encoder, model, calibration=calibration,
+                                         keep=keep)
+        return results['prob_positive'].to_numpy()
+
+    return score
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Filter and rank neoantigen candidates through the qualification cascade'
+    )
+    parser.add_argument('input_file', help='Path to CSV file with candidate neoantigens')
+    parser.add_argument(
+        '--model',
+        choices=['lightgbm', 'xgboost', 'randomforest'],
+        default='lightgbm',
+        help='Model used to score the survivors (default: lightgbm)'
+    )
+    parser.add_argument('--output', default='ranked_candidates.csv',
+                        help='Output CSV file (default: ranked_candidates.csv)')
+    parser.add_argument('--ic50', type=float, default=500.0,
+                        help='Maximum MHC-I IC50 in nM (default: 500)')
+    parser.add_argument('--tpm', type=float, default=10.0,
+                        help='Minimum tumor expression in TPM (default: 10)')
+    parser.add_argument('--vaf', type=float, default=0.3,
+                        help='Minimum variant allele fraction (default: 0.3)')
+    parser.add_argument('--no-score', action='store_true',
+                        help='Only apply the filters, skip the ML scorer')
+    parser.add_argument('--binding', action='store_true',
+                        help='Estimate missing IC50 values with the built-in PSSM scorer '
+                             '(see binding.py)')
+    parser.add_argument('--self-index',
+                        help='Drop candidates found in this self-proteome k-mer index '
+                             '(see self_filter.py)')
+
+    args = parser.parse_args()
+
+    print(f"\n{'='*60}")
+    print("NeoTImmuML Qualification Cascade")
+    print(f"{'='*60}")
+
+    try:
+        data = pd.read_csv(args.input_file)
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        sys.exit(1)
+    print(f"✓ Loaded {len(data):,} candidates")
+
+    if args.binding:
+        from binding import add_ic50, load_binding_model
+        try:
+            data = add_ic50(data, load_binding_model())
+        except Exception as e:
+            print(f"Error estimating binding: {e}")
+            sys.exit(1)
+        print(f"✓ Estimated IC50 for {len(data):,} candidates (PSSM)")
+
+    if args.self_index:
+        from self_filter import SelfIndex, add_self_column
+        try:
+            data = add_self_column(data, SelfIndex(args.self_index))
+        except Exception as e:
+            print(f"Error checking the self proteome: {e}")
+            sys.exit(1)
+
+    thresholds = {'mhc_binding': args.ic50, 'expression': args.tpm, 'clonality': args.vaf}
+    filters = [dict(spec, value=thresholds[spec['name']]) if spec['name'] in thresholds else spec
+               for spec in DEFAULT_CASCADE]
+
+    scorer = None
+    if not args.no_score:
+        from predict import load_calibration, load_feature_selection, load_model_and_encoder
+        try:
+            from registry import artifact_dir
+            base_path = artifact_dir()
+            encoder, model = load_model_and_encoder(args.model, base_path)
+            calibration = load_calibration(args.model, base_path)
+            keep = load_feature_selection(base_path)
+        except Exception as e:
+            print(f"Error loading model: {e}")
+            sys.exit(1)
+        scorer = model_scorer(encoder, model, calibration, keep)
+
+    ranked, funnel = run_cascade(data, filters, scorer=scorer)
+
+    print(f"\n{'='*60}")
+    print("Funnel")
+    print(f"{'='*60}")
+    for stage in funnel.itertuples():
+        note = " (skipped)" if stage.skipped else ""
+        print(f"  {stage.stage:22s} {stage.rows_in:>10,} → {stage.rows_out:>10,}"
+              f"  {stage.seconds*1000:8.1f} ms{note}")
+
+    ranked.to_csv(args.output, index=False)
+    print(f"\n✓ Saved {len(ranked):,} ranked candidates to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
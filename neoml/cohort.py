@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Cohort Runner
+========================
+Scores a whole cohort - one candidate file per patient - in one process pool
+instead of one predict.py invocation per patient.
+
+The manifest is a CSV with one row per patient:
+
+    patient_id,input,hla
+    PT001,PT001_candidates.csv,HLA-A*02:01;HLA-A*24:02;HLA-B*07:02;HLA-B*35:01;HLA-C*07:01
+    PT002,PT002_candidates.csv,
+
+input paths are relative to the manifest. With an hla list every candidate
+is scored against each of the patient's alleles (expansion.py); without one
+the rows are scored as they are, like predict.py.
+
+- The encoder, model, calibration and feature selection are loaded once in
+  the parent; with the fork start method the workers inherit them
+  copy-on-write (elsewhere each worker loads them once in its initializer).
+  Each worker's model is limited to --threads threads, so workers do not
+  oversubscribe the cores.
+- Each input file is cut into --chunk-size row chunks by byte offset, found
+  in one scan; workers read only their slice.
+- Tasks are queued largest first and handed out one at a time, so idle
+  workers keep pulling chunks (a big patient is spread over all workers)
+  and the tail of the run is short.
+- Chunk results are written as part files and merged into
+  <output-dir>/<patient_id>.csv as soon as a patient's last chunk is done;
+  <output-dir>/cohort_summary.csv has one row per patient.
+
+Usage:
+    python cohort.py <manifest_csv> [--output-dir cohort_predictions] [--workers N]
+                     [--chunk-size 20000] [--model lightgbm] [--version V]
+                     [--top-k N] [--threshold 0.5]
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from expansion import PairExpansion, allele_table, score_pairs
+from predict import (TopK, load_calibration, load_feature_selection, load_model_and_encoder,
+                     predict_immunogenicity)
+from registry import artifact_dir
+
+
+CHUNK_SIZE = 20_000
+
+SUMMARY_FILE = 'cohort_summary.csv'
+
+# Artifacts of this process: set in the parent before the pool forks, or by
+# the worker initializer
+_ARTIFACTS = None
+
+
+def read_manifest(path):
+    """
+    Load a cohort manifest.
+
+    Returns:
+        DataFrame with patient_id, input (absolute path) and alleles (list,
+        empty when the patient has no HLA typing)
+    """
+    manifest = pd.read_csv(path, dtype=str)
+    missing = {'patient_id', 'input'} - set(manifest.columns)
+    if missing:
+        raise ValueError(f"Manifest needs columns: {', '.join(sorted(missing))}")
+    if manifest['patient_id'].duplicated().any():
+        raise ValueError("Manifest lists a patient more than once")
+    root = Path(path).resolve().parent
+    manifest['input'] = [str(root / p) for p in manifest['input']]
+    hla = manifest['hla'] if 'hla' in manifest.columns else pd.Series('', index=manifest.index)
+    manifest['alleles'] = [list(dict.fromkeys(a for a in re.split(r'[;,\s]+', h) if a))
+                           if isinstance(h, str) else [] for h in hla]
+    return manifest
+
+
+def safe_name(patient_id):
+    """File name stem for a patient id."""
+    return re.sub(r'[^\w.-]', '_', str(patient_id))
+
+
+def chunk_offsets(path, chunk_size=CHUNK_SIZE):
+    """
+    Byte ranges of consecutive chunk_size-row chunks of a CSV, in one scan.
+
+    Like jobqueue.count_rows, rows are newline-delimited (no quoted line
+    breaks).
+
+    Returns:
+        list of (first row, byte offset, byte length, rows)
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as handle:
+        header = len(handle.readline())
+        starts, position = [], header
+        for block in iter(lambda: handle.read(1 << 24), b''):
+            newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10)
+            starts.append(position + newlines + 1)
+            position += len(block)
+    # Start offset of every data row (a trailing newline starts no row)
+    starts = np.concatenate([[header], *starts]) if size > header else np.zeros(0, np.int64)
+    starts = starts[starts < size]
+
+    chunks = []
+    for first in range(0, len(starts), chunk_size):
+        last = min(first + chunk_size, len(starts))
+        end = starts[last] if last < len(starts) else size
+        chunks.append((first, int(starts[first]), int(end - starts[first]), last - first))
+    return chunks
+
+
+def read_chunk(path, offset, length):
+    """Rows of a CSV byte range, parsed with the file's header."""
+    with open(path, 'rb') as handle:
+        header = handle.readline()
+        handle.seek(offset)
+        body = handle.read(length)
+    return pd.read_csv(io.BytesIO(header + body), dtype={'peptide': str})
+
+
+def _limit_threads(model, threads):
+    """Cap a model's prediction threads (LightGBM/XGBoost/RandomForest n_jobs)."""
+    try:
+        model.set_params(n_jobs=threads)
+    except (AttributeError, ValueError):
+        pass
+    return model
+
+
+def load_artifacts(base_path, model_type, threads=1, uncalibrated=False):
+    """Encoder, model, calibration and feature selection of one registry version."""
+    encoder, model = load_model_and_encoder(model_type, base_path)
+    return {
+        'encoder': encoder,
+        'model': _limit_threads(model, threads),
+        'calibration': None if uncalibrated else load_calibration(model_type, base_path),
+        'keep': load_feature_selection(base_path),
+    }
+
+
+def _init_worker(base_path, model_type, threads, uncalibrated):
+    global _ARTIFACTS
+    if _ARTIFACTS is None:
+        # Spawned worker: nothing inherited, load once for this process
+        with open(os.devnull, 'w') as sink:
+            stdout, sys.stdout = sys.stdout, sink
+            try:
+                _ARTIFACTS = load_artifacts(base_path, model_type, threads, uncalibrated)
+            finally:
+                sys.stdout = stdout
+
+
+def score_chunk(task):
+    """
+    Score one chunk of a patient's candidates in a worker.
+
+    Args:
+        task: dict with patient_id, input, alleles, first, offset, length,
+            part (output path), threshold and top_k
+
+    Returns:
+        dict with patient_id, part, rows, scored, positive, max_prob,
+        unknown_rate, seconds and error (None on success)
+    """
+    start = time.perf_counter()
+    result = {'patient_id': task['patient_id'], 'part': task['part'], 'rows': 0, 'scored': 0,
+              'positive': 0, 'max_prob': np.nan, 'unknown_rate': np.nan, 'error': None}
+    try:
+        artifacts = _ARTIFACTS
+        data = read_chunk(task['input'], task['offset'], task['length'])
+        result['rows'] = len(data)
+        with open(os.devnull, 'w') as sink:
+            stdout, sys.stdout = sys.stdout, sink
+            try:
+                if task['alleles']:
+                    expansion = PairExpansion(data, allele_table(task['alleles']),
+                                              artifacts['encoder'], artifacts['keep'])
+                    batches = list(score_pairs(expansion, artifacts['model'],
+                                               artifacts['calibration'], task['threshold']))
+                    scored = pd.concat(batches, ignore_index=True) if batches else pd.DataFrame()
+                    if len(scored):
+                        scored['candidate_row'] += task['first']
+                    result['unknown_rate'] = expansion.peptide_drift['unknown_rate']
+                else:
+                    scored = predict_immunogenicity(data, artifacts['encoder'], artifacts['model'],
+                                                    threshold=task['threshold'],
+                                                    calibration=artifacts['calibration'],
+                                                    keep=artifacts['keep'])
+                    scored.insert(0, 'candidate_row', task['first'] + np.arange(len(scored)))
+                    result['unknown_rate'] = scored.attrs['drift']['unknown_rate']
+            finally:
+                sys.stdout = stdout
+
+        result['scored'] = len(scored)
+        if len(scored):
+            result['positive'] = int(scored['prediction'].sum())
+            result['max_prob'] = float(scored['prob_positive'].max())
+        if task['top_k'] and len(scored):
+            top = TopK(task['top_k'])
+            top.update(scored)
+            scored = top.result().drop(columns=['row', 'rank'])
+        scored.to_csv(task['part'], index=False)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def merge_parts(parts, output, top_k=None):
+    """Concatenate a patient's part files in chunk order (re-ranking with top_k)."""
+    frames = [pd.read_csv(part, dtype={'peptide': str}) for part in parts
+              if os.path.getsize(part) > 1]
+    merged = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if top_k and len(merged):
+        top = TopK(top_k)
+        top.update(merged)
+        merged = top.result().drop(columns=['row'])
+    merged.to_csv(output, index=False)
+    return len(merged)
+
+
+def plan_tasks(manifest, parts_dir, chunk_size=CHUNK_SIZE, threshold=0.5, top_k=None):
+    """
+    Cut every patient's input into chunk tasks, largest first.
+
+    Returns:
+        (tasks, {patient_id: [part paths in chunk order]}, {patient_id: error})
+    """
+    tasks, parts, errors = [], {}, {}
+    for patient in manifest.itertuples(index=False):
+        if not os.path.exists(patient.input):
+            errors[patient.patient_id] = f"input not found: {patient.input}"
+            continue
+        chunks = chunk_offsets(patient.input, chunk_size)
+        parts[patient.patient_id] = []
+        for i, (first, offset, length, rows) in enumerate(chunks):
+            part = str(Path(parts_dir) / f"{safe_name(patient.patient_id)}.{i:05d}.csv")
+            parts[patient.patient_id].append(part)
+            tasks.append({'patient_id': patient.patient_id, 'input': patient.input,
+                          'alleles': patient.alleles, 'first': first, 'offset': offset,
+                          'length': length, 'part': part, 'threshold': threshold,
+                          'top_k': top_k, 'cost': rows * max(len(patient.alleles), 1)})
+    tasks.sort(key=lambda task: task['cost'], reverse=True)
+    return tasks, parts, errors
+
+
+def run_cohort(manifest, output_dir, base_path, model_type='lightgbm', workers=None,
+               chunk_size=CHUNK_SIZE, threads=1, threshold=0.5, top_k=None, uncalibrated=False,
+               progress=None):
+    """
+    Score every patient of a manifest and write per-patient outputs.
+
+    Args:
+        manifest: Output of read_manifest
+        output_dir: Directory for <patient_id>.csv files and the summary
+        base_path: Artifact directory (registry version)
+        workers: Worker processes (default: CPU count)
+        threads: Model threads per worker
+        progress: Optional callable(done_tasks, total_tasks)
+
+    Returns:
+        summary DataFrame, one row per patient
+    """
+    global _ARTIFACTS
+    output_dir = Path(output_dir)
+    parts_dir = output_dir / '.parts'
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    tasks, parts, errors = plan_tasks(manifest, parts_dir, chunk_size, threshold, top_k)
+    pending = {patient: len(files) for patient, files in parts.items()}
+    stats = {patient_id: {'rows': 0, 'scored': 0, 'positive': 0, 'max_prob': np.nan,
+                          'unknown_weighted': 0.0, 'seconds': 0.0}
+             for patient_id in manifest['patient_id']}
+
+    def finish(patient):
+        if patient not in errors:
+            output = output_dir / f"{safe_name(patient)}.csv"
+            stats[patient]['written'] = merge_parts(parts[patient], output, top_k)
+        for part in parts[patient]:
+            Path(part).unlink(missing_ok=True)
+
+    # Empty inputs have no tasks
+    for patient in [p for p, n in pending.items() if n == 0]:
+        finish(patient)
+
+    # fork shares the already loaded artifacts; elsewhere workers load their own
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    _ARTIFACTS = load_artifacts(base_path, model_type, threads, uncalibrated) \
+        if context.get_start_method() == 'fork' else None
+
+    with context.Pool(workers, initializer=_init_worker,
+                      initargs=(str(base_path), model_type, threads, uncalibrated)) as pool:
+        for done, result in enumerate(pool.imap_unordered(score_chunk, tasks), start=1):
+            patient = result['patient_id']
+            if result['error'] and patient not in errors:
+                errors[patient] = result['error']
+            record = stats[patient]
+            for key in ('rows', 'scored', 'positive', 'seconds'):
+                record[key] += result[key]
+            record['max_prob'] = np.fmax(record['max_prob'], result['max_prob'])
+            if result['rows'] and not np.isnan(result['unknown_rate']):
+                record['unknown_weighted'] += result['unknown_rate'] * result['rows']
+            pending[patient] -= 1
+            if pending[patient] == 0:
+                finish(patient)
+            if progress:
+                progress(done, len(tasks))
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+    rows = []
+    for patient in manifest.itertuples(index=False):
+        record = stats[patient.patient_id]
+        rows.append({
+            'patient_id': patient.patient_id,
+            'status': 'failed' if patient.patient_id in errors else 'done',
+            'candidates': record['rows'],
+            'alleles': len(patient.alleles),
+            'scored': record['scored'],
+            'written': record.get('written', 0),
+            'predicted_positive': record['positive'],
+            'max_prob_positive': record['max_prob'],
+            'unknown_rate': record['unknown_weighted'] / record['rows'] if record['rows'] else np.nan,
+            'cpu_seconds': round(record['seconds'], 3),
+            'error': errors.get(patient.patient_id),
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Score a cohort of patients in one process pool'
+    )
+    parser.add_argument('manifest', help='CSV with patient_id, input and optional hla columns')
+    parser.add_argument('--output-dir', default='cohort_predictions',
+                        help='Directory for per-patient predictions and the summary '
+                             '(default: cohort_predictions)')
+    parser.add_argument('--workers', type=int,
+                        help=f'Worker processes (default: all {os.cpu_count()} cores)')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='Model threads per worker (default: 1)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f'Candidate rows per task (default: {CHUNK_SIZE:,})')
+    parser.add_argument('--model', choices=['lightgbm', 'xgboost', 'randomforest'],
+                        default='lightgbm', help='Model to use (default: lightgbm)')
+    parser.add_argument('--version', help='Registry version to use (default: the promoted one)')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='Probability threshold for positive class (default: 0.5)')
+    parser.add_argument('--uncalibrated', action='store_true',
+                        help='Ignore the calibration bundle and use raw model probabilities')
+    parser.add_argument('--top-k', type=int,
+                        help='Write only the N best rows per patient')
+
+    args = parser.parse_args()
+
+    try:
+        manifest = read_manifest(args.manifest)
+        base_path = artifact_dir(args.version)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"✓ {len(manifest):,} patients in {args.manifest}, artifacts from {base_path}")
+
+    def progress(done, total):
+        print(f"  {done:,}/{total:,} chunks scored", end='\r', flush=True)
+
+    start = time.perf_counter()
+    summary = run_cohort(manifest, args.output_dir, base_path, args.model, args.workers,
+                         args.chunk_size, args.threads, args.threshold, args.top_k,
+                         args.uncalibrated, progress)
+    elapsed = time.perf_counter() - start
+    summary.to_csv(Path(args.output_dir) / SUMMARY_FILE, index=False)
+
+    done = summary[summary['status'] == 'done']
+    print(f"\n✓ Scored {summary['scored'].sum():,} rows for {len(done):,} patients in "
+          f"{elapsed:.1f}s ({summary['scored'].sum() / max(elapsed, 1e-9):,.0f} rows/s)")
+    for row in summary[summary['status'] == 'failed'].itertuples(index=False):
+        print(f"  ✗ {row.patient_id}: {row.error}")
+    print(f"✓ Saved per-patient predictions and {SUMMARY_FILE} to: {args.output_dir}")
+    if len(done) < len(summary):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
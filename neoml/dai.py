@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Differential Agretopicity
+====================================
+Scores every mutant peptide together with its wild-type counterpart and adds
+the differential agretopicity index (DAI) and fold change, parameter 5 of the
+quick reference in docs/neoantigen_qualification_guide.md.
+
+Mutant and wild-type peptides are pooled into one set of (peptide, allele)
+keys, deduplicated (neighbouring windows and variants of the same protein
+share many wild-type peptides), scored in a single batched call and mapped
+back, so the cost is about one scoring pass over the distinct peptides.
+
+Scorers:
+- binding: estimated IC50 from the built-in PSSMs (binding.py)
+      dai = WT_IC50 - mutant_IC50, fold change = WT_IC50 / mutant_IC50
+- peptide: peptide-only immunogenicity probability (peptide_score.py)
+      dai = mutant - WT probability, fold change = mutant / WT probability
+
+Positive DAI means the mutant is the better binder / more immunogenic. Rows
+without a wild-type match (peptides.py leaves wt_peptide empty across
+insertions, deletions and frameshifts) get NaN.
+
+Usage:
+    python dai.py <candidates_csv> [--scorer binding|peptide] [--hla ALLELE ...]
+                  [--output FILE]
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+SCORERS = ['binding', 'peptide']
+
+# Scored column per scorer, and whether lower values are better
+SCORE_COLUMNS = {
+    'binding': ('ic50', True),
+    'peptide': ('prob_positive', False),
+}
+
+FOLD_FLOOR = 1e-6
+
+
+def load_scorer(name):
+    """
+    Load a pair scorer: a function (peptides, alleles) -> scores.
+
+    Args:
+        name: One of SCORERS
+
+    Returns:
+        callable scoring aligned peptide/allele arrays
+    """
+    if name == 'binding':
+        from binding import load_binding_model, score_pairs
+        model = load_binding_model()
+        return lambda peptides, alleles: score_pairs(model, peptides, alleles)[1]
+    if name == 'peptide':
+        from joblib import load
+        from peptide_score import MODEL_PATH, score_peptides
+        if not MODEL_PATH.exists():
+            raise FileNotFoundError(f"Model not found: {MODEL_PATH} "
+                                    "(run peptide_score.py --train first)")
+        bundle = load(MODEL_PATH)
+        return lambda peptides, alleles: score_peptides(bundle, peptides, alleles)
+    raise ValueError(f"Unknown scorer: {name}")
+
+
+def paired_scores(mutant, wild_type, alleles, score_fn):
+    """
+    Score mutant and wild-type peptides in one deduplicated batch.
+
+    Args:
+        mutant: Sequence of mutant peptides
+        wild_type: Sequence of wild-type peptides ('' or NaN when unmatched)
+        alleles: Sequence of HLA alleles, one per row
+        score_fn: callable (peptides, alleles) -> scores
+
+    Returns:
+        (mutant_scores, wild_type_scores, n_scored) - float64 arrays and the
+        number of distinct pairs actually scored
+    """
+    n = len(mutant)
+    wild_type = pd.Series(wild_type, dtype=object).fillna('').astype(str).to_numpy()
+    peptides = np.concatenate([np.asarray(mutant, dtype=str), wild_type])
+    alleles = np.asarray(alleles, dtype=str)
+    pair_alleles = np.concatenate([alleles, alleles])
+
+    has_peptide = peptides != ''
+    keys = pd.MultiIndex.from_arrays([peptides[has_peptide], pair_alleles[has_peptide]])
+    codes, unique = pd.factorize(keys)
+
+    scores = np.full(2 * n, np.nan)
+    if len(unique):
+        unique_scores = np.asarray(score_fn(unique.get_level_values(0).tolist(),
+                                            unique.get_level_values(1).to_numpy()),
+                                   dtype=np.float64)
+        scores[has_peptide] = unique_scores[codes]
+    return scores[:n], scores[n:], len(unique)
+
+
+def add_dai(data, score_fn, lower_is_better=True, score_column='ic50',
+            peptide_column='peptide', wt_column='wt_peptide', allele_column='mhcAllele'):
+    """
+    Add mutant/wild-type scores, DAI and fold change to a candidate table.
+
+    Args:
+        data: Candidates with peptide, wt_peptide and mhcAllele columns
+        score_fn: Pair scorer (see load_scorer)
+        lower_is_better: True for affinities (IC50), False for probabilities
+        score_column: Name of the mutant score column; the wild-type score is
+            written to 'wt_' + score_column
+
+    Returns:
+        DataFrame copy with the score columns, 'dai' and 'dai_fold_change';
+        attrs['dai_pairs_scored'] holds the number of distinct pairs scored
+    """
+    data = data.copy()
+    mutant, wild_type, n_scored = paired_scores(
+        data[peptide_column].astype(str).to_numpy(), data[wt_column].to_numpy(),
+        data[allele_column].astype(str).to_numpy(), score_fn)
+
+    better, worse = (wild_type, mutant) if lower_is_better else (mutant, wild_type)
+    data[score_column] = mutant
+    data['wt_' + score_column] = wild_type
+    data['dai'] = better - worse
+    data['dai_fold_change'] = np.maximum(better, FOLD_FLOOR) / np.maximum(worse, FOLD_FLOOR)
+    data.attrs['dai_pairs_scored'] = n_scored
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Add differential agretopicity (mutant vs wild-type scores) to candidates'
+    )
+    parser.add_argument('input_file',
+                        help='Candidate CSV with peptide and wt_peptide columns (peptides.py output)')
+    parser.add_argument('--scorer', choices=SCORERS, default='binding',
+                        help='Scorer applied to both peptides (default: binding)')
+    parser.add_argument('--hla', action='append',
+                        help='HLA allele to pair with every candidate when the file has no '
+                             'mhcAllele column (repeatable)')
+    parser.add_argument('--output', default='candidates_dai.csv',
+                        help='Output CSV file (default: candidates_dai.csv)')
+
+    args = parser.parse_args()
+
+    try:
+        data = pd.read_csv(args.input_file, dtype={'peptide': str, 'wt_peptide': str})
+        score_fn = load_scorer(args.scorer)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"✓ Loaded {len(data):,} candidates")
+
+    if 'wt_peptide' not in data.columns:
+        print("Error: input needs a wt_peptide column (see peptides.py)")
+        sys.exit(1)
+    if args.hla:
+        # One row per candidate x requested allele
+        data = data.drop(columns=['mhcAllele'], errors='ignore').merge(
+            pd.DataFrame({'mhcAllele': args.hla}), how='cross')
+    elif 'mhcAllele' not in data.columns:
+        print("Error: input has no mhcAllele column; pass --hla")
+        sys.exit(1)
+
+    score_column, lower_is_better = SCORE_COLUMNS[args.scorer]
+    start = time.perf_counter()
+    data = add_dai(data, score_fn, lower_is_better, score_column)
+    elapsed = time.perf_counter() - start
+    print(f"✓ Scored {data.attrs['dai_pairs_scored']:,} distinct peptide x allele pairs "
+          f"for {len(data):,} mutant/wild-type rows in {elapsed:.2f}s")
+    print(f"✓ {(data['dai'] > 0).sum():,} candidates with positive DAI")
+
+    data.to_csv(args.output, index=False)
+    print(f"✓ Saved candidates to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+NeoTImmuML Distributed Training
+===============================
+Optional Dask backend for the gradient-boosted models in train_models.py.
+
+The encoded sparse training matrix is cut into row partitions (one or more
+per worker) and scattered to the cluster; LightGBM trains through
+lightgbm.DaskLGBMClassifier and XGBoost through xgboost.dask. The fitted
+models are converted back to ordinary LGBMClassifier/XGBClassifier objects,
+so output/<Model>/model.joblib is the same artifact the in-process path
+writes and predict.py needs no cluster.
+
+RandomForest has no distributed implementation here and keeps training
+in-process.
+
+Runs on a multi-process LocalCluster on one machine, or against an existing
+scheduler (e.g. started with `dask scheduler` / `dask worker` on each node):
+
+    python train_models.py --backend dask --workers 4
+    python train_models.py --backend dask --scheduler tcp://head-node:8786
+
+Requirements:
+    pip install "dask[distributed]"
+"""
+
+from contextlib import contextmanager
+
+import numpy as np
+from scipy import sparse
+
+try:
+    import dask.array as da
+    from dask.distributed import Client, LocalCluster, wait
+    HAS_DASK = True
+except ImportError:
+    HAS_DASK = False
+
+
+BACKENDS = ['local', 'dask']
+
+
+@contextmanager
+def dask_client(workers=2, scheduler=None, threads_per_worker=1):
+    """
+    Connect to a Dask scheduler, or start a multi-process LocalCluster.
+
+    Args:
+        workers: Worker processes for the LocalCluster
+        scheduler: Address of an existing scheduler (skips the LocalCluster)
+        threads_per_worker: Threads per LocalCluster worker
+
+    Yields:
+        dask.distributed.Client
+    """
+    if not HAS_DASK:
+        raise ImportError('The dask backend requires dask[distributed] '
+                          '(pip install "dask[distributed]")')
+    if scheduler:
+        client = Client(scheduler)
+        cluster = None
+    else:
+        cluster = LocalCluster(n_workers=workers, threads_per_worker=threads_per_worker,
+                               processes=True)
+        client = Client(cluster)
+    try:
+        yield client
+    finally:
+        client.close()
+        if cluster is not None:
+            cluster.close()
+
+
+def partition(client, X, y, partitions=None):
+    """
+    Split a sparse matrix and labels into row partitions held on the workers.
+
+    Args:
+        client: Dask client
+        X: scipy sparse matrix (CSR)
+        y: Labels
+        partitions: Number of row partitions (default: one per worker)
+
+    Returns:
+        (dask array of CSR blocks, dask array of labels)
+    """
+    X = sparse.csr_matrix(X)
+    y = np.asarray(y)
+    partitions = partitions or max(len(client.scheduler_info()['workers']), 1)
+    chunk = -(-X.shape[0] // partitions)
+
+    X_dask = da.from_array(X, chunks=(chunk, X.shape[1]), asarray=False,
+                           meta=sparse.csr_matrix((0, X.shape[1]), dtype=X.dtype))
+    y_dask = da.from_array(y, chunks=(chunk,))
+    X_dask, y_dask = client.persist([X_dask, y_dask])
+    wait([X_dask, y_dask])
+    return X_dask, y_dask
+
+
+def fit_lightgbm(client, X, y, params):
+    """
+    Train LightGBM across the cluster.
+
+    Returns:
+        local lightgbm.LGBMClassifier
+    """
+    from lightgbm import DaskLGBMClassifier
+
+    X_dask, y_dask = partition(client, X, y)
+    model = DaskLGBMClassifier(client=client, **params)
+    model.fit(X_dask, y_dask)
+    return model.to_local()
+
+
+def fit_xgboost(client, X, y, params):
+    """
+    Train XGBoost across the cluster.
+
+    Returns:
+        local xgboost.XGBClassifier
+    """
+    from xgboost import XGBClassifier
+    from xgboost.dask import DaskXGBClassifier
+
+    X_dask, y_dask = partition(client, X, y)
+    model = DaskXGBClassifier(**params)
+    model.client = client
+    model.fit(X_dask, y_dask)
+
+    # Rebuild the plain sklearn wrapper around the trained booster
+    local = XGBClassifier(**params)
+    local.load_model(model.get_booster().save_raw('json'))
+    return local
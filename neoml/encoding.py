@@ -0,0 +1,431 @@
+"""
+NeoTImmuML Feature Encoding
+===========================
+Single-pass sparse one-hot encoding against a fitted encoder, with input
+validation collected during the same pass over each column:
+
+- unknown categories per column (encoded as all-zero by handle_unknown='ignore')
+- expected columns missing from the input
+- numeric values outside the range seen in training
+
+The output matrix is identical to encoder.transform(data.astype(str)), or to
+its surviving columns when a feature-selection keep index is given.
+
+SparseCategoryEncoder is the encoder train_models.py fits on tables loaded
+with schema.load_tumoragdb: categories are kept as typed values (strings for
+categoricals, float32 for numerics) and categorical columns are mapped by
+their integer codes, so no column is ever cast to strings. It can be extended
+with new categories (update_models.py); added categories get output columns
+after all existing ones, so trained models keep their column indices.
+"""
+
+import copy
+import json
+import weakref
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from feature_selection import remap_table
+
+
+class SparseCategoryEncoder:
+    """
+    One-hot encoder over categorical codes and typed numeric values.
+
+    Exposes feature_names_in_ and categories_ like sklearn's OneHotEncoder
+    (handle_unknown='ignore', missing values as their own category), so
+    encode_features, drift checks and feature selection treat both alike.
+    """
+
+    def fit(self, data):
+        """
+        Learn the categories of every column.
+
+        Args:
+            data: DataFrame with categorical and numeric columns
+                (e.g. from schema.load_tumoragdb)
+
+        Returns:
+            self
+        """
+        self.feature_names_in_ = np.array(data.columns, dtype=object)
+        self.numeric_ = []
+        self.categories_ = []
+        self.positions_ = None
+        for name in data.columns:
+            column = data[name]
+            numeric = not isinstance(column.dtype, pd.CategoricalDtype) and \
+                pd.api.types.is_numeric_dtype(column.dtype)
+            if numeric:
+                values = _as_float32(column)
+                present = np.unique(values[~np.isnan(values)])
+                categories = present.astype(object)
+            elif isinstance(column.dtype, pd.CategoricalDtype):
+                codes = column.cat.codes.to_numpy()
+                present = np.unique(codes[codes >= 0])
+                categories = np.asarray(column.cat.categories[present], dtype=object)
+            else:
+                categories = np.asarray(pd.unique(column.dropna().astype(str)), dtype=object)
+                categories.sort()
+            if column.isna().any():
+                categories = np.append(categories, np.nan)
+            self.numeric_.append(numeric)
+            self.categories_.append(categories)
+        self._indexes = None
+        return self
+
+    def _lookup(self, i):
+        if self._indexes is None:
+            self._indexes = []
+            for categories, numeric in zip(self.categories_, self.numeric_):
+                present = [c for c in categories if not (isinstance(c, float) and np.isnan(c))]
+                index = pd.Index(np.array(present, dtype=np.float32)) if numeric \
+                    else pd.Index(present, dtype=object)
+                nan_code = len(categories) - 1 if len(present) < len(categories) else -1
+                self._indexes.append((index, nan_code))
+        return self._indexes[i]
+
+    def column_codes(self, i, column):
+        """
+        Category position of every value of column i (-1 for unknown).
+
+        Categorical input is mapped through its category table (one lookup
+        per category, then a take on the integer codes); numeric input is
+        matched as float32.
+        """
+        index, nan_code = self._lookup(i)
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            table = column.cat.categories
+            if self.numeric_[i]:
+                table = pd.to_numeric(pd.Series(np.asarray(table, dtype=object)),
+                                      errors='coerce').to_numpy(dtype=np.float32)
+            else:
+                table = table.astype(str)
+            lookup = np.append(index.get_indexer(table), nan_code)
+            # Missing values have code -1, which picks the appended nan_code
+            return lookup[column.cat.codes.to_numpy()]
+
+        missing = column.isna().to_numpy()
+        if self.numeric_[i]:
+            codes = index.get_indexer(_as_float32(column))
+        else:
+            codes = index.get_indexer(column.astype(str))
+            if pd.api.types.is_float_dtype(column.dtype):
+                # Integral floats may have been stored without the trailing .0
+                retry = (codes < 0) & ~missing
+                if retry.any():
+                    values = column[retry]
+                    integral = values == np.floor(values)
+                    codes[np.flatnonzero(retry)[integral.to_numpy()]] = index.get_indexer(
+                        values[integral].astype(np.int64).astype(str))
+        codes[missing] = nan_code
+        return codes
+
+    def column_positions(self):
+        """Output column of every category, per input column."""
+        if getattr(self, 'positions_', None) is not None:
+            return self.positions_
+        sizes = [len(c) for c in self.categories_]
+        offsets = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64)
+        return [offset + np.arange(size, dtype=np.int64) for offset, size in zip(offsets, sizes)]
+
+    def extend(self, data):
+        """
+        Copy of the encoder with the unseen categories of data added.
+
+        Existing categories keep their output columns; added ones are
+        numbered after the current last column, in input column order.
+
+        Args:
+            data: DataFrame typed like the training data
+
+        Returns:
+            (extended encoder, int64 array of the added output columns)
+        """
+        positions = [p.copy() for p in self.column_positions()]
+        n_columns = int(max((p.max() for p in positions if len(p)), default=-1)) + 1
+        categories = list(self.categories_)
+        added = []
+
+        for i, name in enumerate(self.feature_names_in_):
+            if name not in data.columns:
+                continue
+            column = data[name]
+            unseen = column[self.column_codes(i, column) < 0]
+            if not len(unseen):
+                continue
+            if self.numeric_[i]:
+                values = _as_float32(unseen)
+                new = np.unique(values[~np.isnan(values)]).astype(object)
+            else:
+                new = np.sort(pd.unique(unseen.dropna().astype(str))).astype(object)
+            # NaN is unseen only if the column had no missing values in training
+            new_nan = bool(unseen.isna().any())
+
+            columns = np.arange(n_columns, n_columns + len(new) + new_nan, dtype=np.int64)
+            n_columns += len(columns)
+            added.append(columns)
+
+            has_nan = len(categories[i]) and pd.isna(categories[i][-1])
+            if has_nan:
+                # Keep NaN last (and on its original column)
+                categories[i] = np.concatenate([categories[i][:-1], new, categories[i][-1:]])
+                positions[i] = np.concatenate([positions[i][:-1], columns, positions[i][-1:]])
+            else:
+                categories[i] = np.concatenate([categories[i], new,
+                                                [np.nan] if new_nan else []]).astype(object)
+                positions[i] = np.concatenate([positions[i], columns])
+
+        extended = copy.copy(self)
+        extended.categories_ = categories
+        extended.positions_ = positions
+        extended._indexes = None
+        added = np.concatenate(added) if added else np.zeros(0, dtype=np.int64)
+        return extended, added
+
+    def transform(self, data):
+        """Encode a DataFrame to a CSR matrix (see encode_features)."""
+        return encode_features(data, self)[0]
+
+    def fit_transform(self, data):
+        return self.fit(data).transform(data)
+
+
+def _as_float32(column):
+    """Numeric values of a column as float32 with NaN for missing."""
+    return pd.to_numeric(column, errors='coerce').to_numpy(dtype=np.float32, na_value=np.nan)
+
+
+# Column profiles per encoder; entries go away with their encoder
+_PROFILES = weakref.WeakKeyDictionary()
+
+
+def _column_profiles(encoder):
+    """
+    Per-column lookup indexes, output columns and numeric training ranges.
+
+    Cached per encoder for as long as its fitted categories are unchanged
+    (fit and extend assign new ones, so a refitted encoder is re-profiled).
+    """
+    fitted = (encoder.categories_, getattr(encoder, 'positions_', None))
+    cached = _PROFILES.get(encoder)
+    if cached is not None and all(a is b for a, b in zip(cached[0], fitted)):
+        return cached[1]
+    profiles = _build_profiles(encoder)
+    _PROFILES[encoder] = (fitted, profiles)
+    return profiles
+
+
+def _build_profiles(encoder):
+    if hasattr(encoder, 'column_positions'):
+        positions = encoder.column_positions()
+    else:
+        sizes = np.array([len(c) for c in encoder.categories_], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        positions = [offset + np.arange(size) for offset, size in zip(offsets, sizes)]
+    flat = np.concatenate(positions) if positions else np.zeros(0, dtype=np.int64)
+    n_features = int(flat.max()) + 1 if len(flat) else 0
+
+    indexes, nan_strings, ranges = [], [], []
+    for categories in encoder.categories_:
+        index = pd.Index(categories, dtype=object)
+        indexes.append(index)
+        # Older pandas turned NaN into the string 'nan' under astype(str)
+        nan_strings.append('nan' in index)
+
+        present = index[~index.isna() & (index != 'nan')]
+        numeric = pd.to_numeric(pd.Series(present), errors='coerce')
+        # Only columns whose every category parses as a number get a range check
+        if len(present) and numeric.notna().all():
+            ranges.append((float(numeric.min()), float(numeric.max())))
+        else:
+            ranges.append(None)
+    return tuple(positions), n_features, tuple(indexes), tuple(nan_strings), tuple(ranges)
+
+
+def encode_cells(data, encoder, keep=None, columns=None):
+    """
+    Output column of every (row, feature) cell, -1 where unknown.
+
+    The per-column half of encode_features: expansion.py encodes peptide and
+    allele tables separately and gathers pair rows from their cells.
+
+    Args:
+        data: DataFrame with (a superset or subset of) the encoder's columns
+        encoder: Fitted OneHotEncoder with handle_unknown='ignore'
+        keep: Optional sorted column indices from feature selection
+        columns: Encoder features to encode (default: all); the others stay
+            -1 and are left out of the drift report
+
+    Returns:
+        (cells array of shape (rows, encoder features), number of output
+        columns, drift report dict)
+    """
+    positions, n_features, indexes, nan_strings, ranges = _column_profiles(encoder)
+    names = list(encoder.feature_names_in_)
+    selected = set(names if columns is None else columns)
+    n_rows = len(data)
+
+    report = {
+        'rows': n_rows,
+        'columns': len(selected),
+        'missing_columns': [],
+        'unknown': {},
+        'out_of_range': {},
+    }
+
+    # Global output column of every (row, feature) cell, -1 where unknown
+    # int32 indices (scipy's native choice) whenever columns and non-zeros fit
+    largest = max(n_features, n_rows * len(names))
+    index_dtype = np.int32 if largest < np.iinfo(np.int32).max else np.int64
+    cells = np.full((n_rows, len(names)), -1, dtype=index_dtype)
+    for i, name in enumerate(names):
+        if name not in selected:
+            continue
+        if name not in data.columns:
+            report['missing_columns'].append(name)
+            report['unknown'][name] = n_rows
+            continue
+
+        column = data[name]
+        if hasattr(encoder, 'column_codes'):
+            codes = encoder.column_codes(i, column)
+        else:
+            values = column.astype(str).astype(object)
+            if nan_strings[i]:
+                values = values.where(column.notna(), 'nan')
+            codes = indexes[i].get_indexer(values)
+        unknown = codes < 0
+        n_unknown = int(unknown.sum())
+        if n_unknown:
+            report['unknown'][name] = n_unknown
+        if len(positions[i]):
+            cells[:, i] = np.where(unknown, -1, positions[i][codes])
+
+        if ranges[i] is not None and n_unknown:
+            low, high = ranges[i]
+            values = pd.to_numeric(np.asarray(column[unknown], dtype=object),
+                                   errors='coerce').astype(np.float64)
+            n_out = int(np.count_nonzero((values < low) | (values > high)))
+            if n_out:
+                report['out_of_range'][name] = n_out
+
+    if keep is not None:
+        # Pruned categories are still known (no drift), they just have no column
+        remap = remap_table(n_features, keep).astype(index_dtype)
+        cells[cells >= 0] = remap[cells[cells >= 0]]
+        n_features = len(keep)
+
+    total_cells = max(n_rows * len(selected), 1)
+    report['unknown_rate'] = float(sum(report['unknown'].values()) / total_cells)
+    report['empty_rows'] = int(np.count_nonzero((cells >= 0).sum(axis=1) == 0))
+    return cells, n_features, report
+
+
+def cells_to_csr(cells, n_features):
+    """
+    Sparse one-hot matrix from an encode_cells array (-1 cells are skipped).
+
+    Returns:
+        CSR matrix of shape (rows, n_features) with sorted indices
+    """
+    known = cells >= 0
+    per_row = known.sum(axis=1)
+    indptr = np.concatenate(([0], np.cumsum(per_row))).astype(cells.dtype)
+    # Row-major order keeps indices sorted unless an extended encoder put new
+    # categories after later columns; sort_indices() only checks otherwise
+    indices = cells[known]
+    X = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float64), indices, indptr),
+        shape=(len(cells), n_features)
+    )
+    X.sort_indices()
+    return X
+
+
+def encode_features(data, encoder, keep=None):
+    """
+    One-hot encode a DataFrame and collect drift statistics in one pass.
+
+    Args:
+        data: DataFrame with (a superset or subset of) the encoder's columns
+        encoder: Fitted OneHotEncoder with handle_unknown='ignore'
+        keep: Optional sorted column indices from feature selection; only
+            these columns are materialised, in this order
+
+    Returns:
+        (CSR matrix, drift report dict)
+    """
+    cells, n_features, report = encode_cells(data, encoder, keep)
+    return cells_to_csr(cells, n_features), report
+
+
+def check_drift(report, max_unknown_rate=None):
+    """
+    Reject a batch whose drift exceeds the threshold.
+
+    High-cardinality identifier columns (peptide, iedbId, ...) are unseen for
+    most new samples, so a normal batch sits well above zero; a batch with
+    shifted or mostly unseen columns approaches 1.
+
+    Args:
+        report: Drift report from encode_features
+        max_unknown_rate: Maximum fraction of unknown cells (None disables)
+
+    Raises:
+        ValueError: if the batch is over the threshold
+    """
+    if max_unknown_rate is None:
+        return
+    if report['unknown_rate'] > max_unknown_rate:
+        raise ValueError(
+            f"Input drift: {report['unknown_rate']:.1%} of feature values are unseen "
+            f"(limit {max_unknown_rate:.1%}); missing columns: "
+            f"{len(report['missing_columns'])}, empty rows: {report['empty_rows']:,}"
+        )
+
+
+def merge_drift(total, report):
+    """Combine the drift reports of two batches (total may be None)."""
+    if total is None:
+        return {**report, 'unknown': dict(report['unknown']),
+                'out_of_range': dict(report['out_of_range'])}
+    merged = {
+        'rows': total['rows'] + report['rows'],
+        'columns': report['columns'],
+        'missing_columns': sorted(set(total['missing_columns']) | set(report['missing_columns'])),
+        'unknown': dict(total['unknown']),
+        'out_of_range': dict(total['out_of_range']),
+        'empty_rows': total['empty_rows'] + report['empty_rows'],
+    }
+    for key in ('unknown', 'out_of_range'):
+        for name, count in report[key].items():
+            merged[key][name] = merged[key].get(name, 0) + count
+    cells = max(merged['rows'] * merged['columns'], 1)
+    merged['unknown_rate'] = float(sum(merged['unknown'].values()) / cells)
+    return merged
+
+
+def print_drift_summary(report, top=5):
+    """Print a short drift summary."""
+    print(f"  Unseen feature values: {report['unknown_rate']:.1%}")
+    if report['missing_columns']:
+        print(f"  ⚠ Missing columns ({len(report['missing_columns'])}): "
+              f"{', '.join(report['missing_columns'][:top])}")
+    if report['empty_rows']:
+        print(f"  ⚠ {report['empty_rows']:,} rows have no known feature values")
+    worst = sorted(report['unknown'].items(), key=lambda kv: kv[1], reverse=True)[:top]
+    if worst:
+        rows = max(report['rows'], 1)
+        print("  Most unseen: " + ", ".join(f"{k} {v / rows:.0%}" for k, v in worst))
+    if report['out_of_range']:
+        print("  ⚠ Out of training range: " + ", ".join(
+            f"{k} ({v:,})" for k, v in report['out_of_range'].items()))
+
+
+def save_drift_report(report, path):
+    """Write a drift report as JSON."""
+    with open(path, 'w') as handle:
+        json.dump(report, handle, indent=2)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Vaccine Epitope Selection
+====================================
+Picks the epitope set for a personalised vaccine construct from a scored
+candidate table (predict.py / cascade.py output), following the vaccine
+design constraints in docs/neoantigen_qualification_guide.md:
+
+- at most 34 epitopes per construct
+- HLA coverage: every allele of the patient should present something
+- clonality: clonal mutations (high VAF) are preferred
+- no near-duplicates: overlapping windows of the same mutation or peptides
+  differing in one residue are redundant
+- total construct length (epitopes plus linkers) within budget
+
+The objective is monotone submodular: each epitope contributes its predicted
+immunogenicity times clonality, plus an HLA coverage bonus that halves with
+every epitope already covering that allele. Lazy greedy maximisation
+(re-evaluate only the top of a max-heap, since gains can only shrink) gives
+the usual (1 - 1/e) guarantee and runs in milliseconds per patient; the
+constraints are enforced when an epitope is popped.
+
+Usage:
+    python epitope_select.py <predictions_csv> [--patient-column patient_id]
+                             [--max-epitopes 34] [--max-residues N]
+                             [--output vaccine_epitopes.csv]
+"""
+
+import argparse
+import heapq
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+MAX_EPITOPES = 34
+
+# Residues added per epitope in the construct (linker / flanking sequence)
+LINKER_LENGTH = 3
+
+# HLA coverage bonus for the first epitope on an allele; multiplied by
+# COVERAGE_DECAY for every further epitope on the same allele
+COVERAGE_WEIGHT = 0.2
+COVERAGE_DECAY = 0.5
+
+# Peptides sharing a k-mer of this length are near-duplicates
+OVERLAP_LENGTH = 7
+
+# Equal-length peptides with at most this many mismatches are near-duplicates
+MAX_MISMATCHES = 1
+
+# Only alleles the peptide is predicted to bind count for coverage
+BINDING_IC50 = 500.0
+
+
+def clonality_weight(data):
+    """
+    Clonality factor in [0, 1] per row.
+
+    Uses 'ccf' (cancer cell fraction) when present, otherwise 2 x VAF capped
+    at 1 (a heterozygous clonal mutation in a pure tumour has VAF 0.5), and 1
+    when neither column exists.
+    """
+    if 'ccf' in data.columns:
+        values = pd.to_numeric(data['ccf'], errors='coerce')
+    elif 'vaf' in data.columns:
+        values = 2 * pd.to_numeric(data['vaf'], errors='coerce')
+    else:
+        return np.ones(len(data))
+    return values.fillna(1.0).clip(0.0, 1.0).to_numpy()
+
+
+def collapse_candidates(data, score_column='prob_positive', allele_column='mhcAllele',
+                        variant_column='variant_id', ic50_threshold=BINDING_IC50):
+    """
+    One row per peptide with its weight, covered alleles and variant.
+
+    Candidate tables have one row per peptide x allele; a peptide's weight is
+    its best score times clonality, and it covers every allele it binds
+    (ic50 below ic50_threshold when an ic50 column exists, otherwise every
+    allele it was scored for).
+
+    Returns:
+        DataFrame with peptide, weight, alleles (tuple), variant and length
+    """
+    data = data.dropna(subset=['peptide'])
+    weight = pd.to_numeric(data[score_column], errors='coerce').fillna(0.0).to_numpy() \
+        * clonality_weight(data)
+    frame = pd.DataFrame({'peptide': data['peptide'].astype(str).str.strip().str.upper(),
+                          'weight': weight}, index=data.index)
+
+    if allele_column in data.columns:
+        binds = np.ones(len(data), dtype=bool)
+        if 'ic50' in data.columns:
+            ic50 = pd.to_numeric(data['ic50'], errors='coerce').to_numpy()
+            binds = ~(ic50 >= ic50_threshold)
+        frame['allele'] = data[allele_column].astype(str).where(binds)
+    else:
+        frame['allele'] = np.nan
+    frame['variant'] = data[variant_column].astype(str) if variant_column in data.columns \
+        else frame['peptide']
+
+    peptides = frame.groupby('peptide', sort=False).agg(
+        weight=('weight', 'max'), variant=('variant', 'first')).reset_index()
+
+    # Distinct (peptide, allele) pairs gathered into one tuple per peptide
+    pairs = frame.dropna(subset=['allele']).drop_duplicates(['peptide', 'allele'])
+    codes = pd.Index(peptides['peptide']).get_indexer(pairs['peptide'])
+    alleles = [[] for _ in range(len(peptides))]
+    for code, allele in zip(codes, pairs['allele']):
+        alleles[code].append(allele)
+    peptides['alleles'] = [tuple(sorted(a)) for a in alleles]
+    peptides['length'] = peptides['peptide'].str.len()
+    return peptides
+
+
+def _kmers(peptide, k):
+    return {peptide[i:i + k] for i in range(max(len(peptide) - k + 1, 1))}
+
+
+def select_epitopes(candidates, max_epitopes=MAX_EPITOPES, max_residues=None,
+                    linker_length=LINKER_LENGTH, coverage_weight=COVERAGE_WEIGHT,
+                    coverage_decay=COVERAGE_DECAY, overlap_length=OVERLAP_LENGTH,
+                    max_mismatches=MAX_MISMATCHES, one_per_variant=True):
+    """
+    Lazy greedy selection of a vaccine epitope set.
+
+    Args:
+        candidates: Output of collapse_candidates
+        max_epitopes: Maximum number of epitopes in the construct
+        max_residues: Construct length budget (epitope + linker residues),
+            None for no limit
+        linker_length: Residues added per epitope
+        coverage_weight: Bonus for the first epitope covering an allele
+        coverage_decay: Bonus factor for every further epitope on that allele
+        overlap_length: Shared k-mer length that makes peptides near-duplicates
+        max_mismatches: Hamming distance (equal lengths) for near-duplicates
+        one_per_variant: At most one epitope per mutation
+
+    Returns:
+        DataFrame of the selected candidates in selection order, with gain
+        and selection_rank columns
+    """
+    peptides = candidates['peptide'].tolist()
+    weights = candidates['weight'].to_numpy(dtype=np.float64)
+    alleles = candidates['alleles'].tolist()
+    variants = candidates['variant'].tolist()
+    lengths = candidates['length'].to_numpy()
+
+    coverage = {}
+
+    def gain(i):
+        return weights[i] + coverage_weight * sum(coverage_decay ** coverage.get(a, 0)
+                                                  for a in alleles[i])
+
+    # Upper bounds start at the gain with nothing selected
+    heap = [(-gain(i), i) for i in range(len(peptides))]
+    heapq.heapify(heap)
+
+    selected, gains = [], []
+    used_kmers, used_variants = set(), set()
+    by_length = {}
+    residues = 0
+
+    def redundant(i):
+        if one_per_variant and variants[i] in used_variants:
+            return True
+        if _kmers(peptides[i], overlap_length) & used_kmers:
+            return True
+        same = by_length.get(lengths[i])
+        if same:
+            encoded = np.frombuffer(peptides[i].encode(), dtype=np.uint8)
+            mismatches = (np.array(same) != encoded).sum(axis=1)
+            return bool((mismatches <= max_mismatches).any())
+        return False
+
+    while heap and len(selected) < max_epitopes:
+        bound, i = heapq.heappop(heap)
+        cost = lengths[i] + linker_length
+        if (max_residues is not None and residues + cost > max_residues) or redundant(i):
+            continue
+
+        current = gain(i)
+        if heap and current < -heap[0][0] - 1e-12:
+            # Stale bound: the gain shrank, re-queue with the fresh value
+            heapq.heappush(heap, (-current, i))
+            continue
+
+        selected.append(i)
+        gains.append(current)
+        residues += cost
+        for allele in alleles[i]:
+            coverage[allele] = coverage.get(allele, 0) + 1
+        used_variants.add(variants[i])
+        used_kmers |= _kmers(peptides[i], overlap_length)
+        by_length.setdefault(lengths[i], []).append(
+            np.frombuffer(peptides[i].encode(), dtype=np.uint8))
+
+    result = candidates.iloc[selected].copy()
+    result['gain'] = gains
+    result['selection_rank'] = np.arange(1, len(selected) + 1)
+    return result.reset_index(drop=True)
+
+
+def coverage_summary(selection, patient_alleles):
+    """Number of selected epitopes per allele (0 for uncovered alleles)."""
+    counts = pd.Series([a for alleles in selection['alleles'] for a in alleles],
+                       dtype=object).value_counts()
+    return counts.reindex(sorted(patient_alleles), fill_value=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Select the vaccine epitope set from scored candidates'
+    )
+    parser.add_argument('input_file', help='Scored candidates (predictions.csv / ranked_candidates.csv)')
+    parser.add_argument('--output', default='vaccine_epitopes.csv',
+                        help='Output CSV file (default: vaccine_epitopes.csv)')
+    parser.add_argument('--patient-column',
+                        help='Select one construct per value of this column (e.g. patient_id)')
+    parser.add_argument('--score-column', default='prob_positive',
+                        help='Immunogenicity score column (default: prob_positive)')
+    parser.add_argument('--max-epitopes', type=int, default=MAX_EPITOPES,
+                        help=f'Maximum epitopes per construct (default: {MAX_EPITOPES})')
+    parser.add_argument('--max-residues', type=int,
+                        help='Construct length budget in residues, linkers included')
+    parser.add_argument('--linker-length', type=int, default=LINKER_LENGTH,
+                        help=f'Linker residues per epitope (default: {LINKER_LENGTH})')
+    parser.add_argument('--coverage-weight', type=float, default=COVERAGE_WEIGHT,
+                        help=f'HLA coverage bonus (default: {COVERAGE_WEIGHT})')
+    parser.add_argument('--allow-same-variant', action='store_true',
+                        help='Allow several epitopes from the same mutation')
+
+    args = parser.parse_args()
+
+    try:
+        data = pd.read_csv(args.input_file)
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        sys.exit(1)
+    if args.score_column not in data.columns:
+        print(f"Error: score column '{args.score_column}' not found")
+        sys.exit(1)
+    print(f"✓ Loaded {len(data):,} scored candidates")
+
+    if args.patient_column:
+        groups = data.groupby(args.patient_column, sort=False)
+    else:
+        groups = [(None, data)]
+
+    selections, timings = [], []
+    for patient, rows in groups:
+        start = time.perf_counter()
+        candidates = collapse_candidates(rows, args.score_column)
+        selection = select_epitopes(candidates, args.max_epitopes, args.max_residues,
+                                    args.linker_length, args.coverage_weight,
+                                    one_per_variant=not args.allow_same_variant)
+        timings.append(time.perf_counter() - start)
+
+        patient_alleles = set(rows['mhcAllele'].dropna().astype(str)) \
+            if 'mhcAllele' in rows.columns else set()
+        covered = coverage_summary(selection, patient_alleles)
+        label = f"{patient}: " if patient is not None else ""
+        print(f"  {label}{len(selection)} epitopes from {len(candidates):,} peptides, "
+              f"{(covered > 0).sum()}/{len(covered)} alleles covered, "
+              f"{(selection['length'] + args.linker_length).sum()} residues "
+              f"({timings[-1] * 1000:.1f} ms)")
+
+        if patient is not None:
+            selection.insert(0, args.patient_column, patient)
+        selections.append(selection)
+
+    result = pd.concat(selections, ignore_index=True)
+    result['alleles'] = result['alleles'].map(';'.join)
+    result.to_csv(args.output, index=False)
+    print(f"\n✓ Selected {len(result):,} epitopes for {len(selections):,} construct(s), "
+          f"max {max(timings) * 1000:.1f} ms per construct")
+    print(f"✓ Saved selection to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Peptide x Allele Expansion
+=====================================
+Scores every candidate peptide of a patient against every HLA allele of that
+patient without materialising the cross product as a DataFrame.
+
+The peptide table and the allele table are encoded separately, once each
+(encoding.encode_cells): peptide-level columns (gene, mutation, expression,
+...) per candidate row, and the allele columns (mhcAllele, mhcType,
+hlaFrequency) per allele. Pair rows are generated lazily in batches: a batch
+of pair indices is mapped to (peptide row, allele row), their encoded cells
+are gathered and turned into the sparse matrix directly, so memory depends on
+the batch size rather than on peptides x alleles, and no peptide column is
+encoded more than once.
+
+Allele-dependent prediction columns (binding ranks, DAI; PAIR_COLUMNS) are
+missing unless a pair_features callback provides them per batch.
+
+Usage:
+    python expansion.py <candidates_csv> --hla ALLELE [--hla ALLELE ...]
+    python expansion.py <candidates_csv> --alleles hla_typing.csv [--patient-column patient_id]
+                        [--model lightgbm] [--top-k N] [--batch-size 100000]
+                        [--output pair_predictions.csv]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from encoding import cells_to_csr, encode_cells
+from ingest_excel import normalise_allele
+from predict import TopK, load_calibration, load_feature_selection, load_model_and_encoder
+from registry import artifact_dir
+
+
+BATCH_SIZE = 100_000
+
+# Encoder features taken from the allele table
+ALLELE_COLUMNS = ['mhcAllele', 'mhcType', 'hlaFrequency']
+
+# Encoder features that depend on the peptide/allele pair
+PAIR_COLUMNS = [
+    'mutantRank', 'mutantRankNetMHCpan', 'mutantRankPRIME', 'mutRankStab',
+    'mutBindingScore', 'daiNetMHC', 'daiMixMHC', 'daiNetStab',
+]
+
+
+def allele_table(alleles, patient_column=None):
+    """
+    Normalised allele table with mhcAllele and mhcType columns.
+
+    Args:
+        alleles: List of allele names, or a DataFrame in long format (an
+            mhcAllele column, optionally a patient column) or wide format
+            (one row per patient, every other column an allele, e.g.
+            HLA-A_1 ... HLA-C_2)
+        patient_column: Patient column of a DataFrame input
+
+    Returns:
+        DataFrame with one row per distinct (patient, allele)
+    """
+    if not isinstance(alleles, pd.DataFrame):
+        alleles = pd.DataFrame({'mhcAllele': list(alleles)})
+    elif 'mhcAllele' not in alleles.columns:
+        ids = [patient_column] if patient_column else []
+        alleles = alleles.melt(id_vars=ids, value_name='mhcAllele').drop(columns='variable')
+
+    alleles = alleles.dropna(subset=['mhcAllele']).copy()
+    alleles['mhcAllele'] = alleles['mhcAllele'].astype(str).map(normalise_allele)
+    alleles['mhcAllele'] = alleles['mhcAllele'].where(
+        alleles['mhcAllele'].str.startswith('HLA-'), 'HLA-' + alleles['mhcAllele'])
+    if 'mhcType' not in alleles.columns:
+        # 'HLA-A*02:01' -> 'HLA-A', the gene level used by the encoder
+        alleles['mhcType'] = alleles['mhcAllele'].str.split('*').str[0]
+    if 'hlaFrequency' not in alleles.columns:
+        alleles['hlaFrequency'] = np.nan
+    keys = [patient_column, 'mhcAllele'] if patient_column else ['mhcAllele']
+    return alleles.drop_duplicates(keys).reset_index(drop=True)
+
+
+class PairExpansion:
+    """
+    Lazily encoded peptide x allele cross product, per patient.
+
+    Pairs are numbered patient by patient, peptide-major (the alleles of one
+    peptide are consecutive); pair i is mapped to its peptide and allele rows
+    with a few vectorised index operations.
+    """
+
+    def __init__(self, peptides, alleles, encoder, keep=None, patient_column=None,
+                 pair_features=None):
+        """
+        Args:
+            peptides: Candidate table (one row per peptide, TumorAgDB columns)
+            alleles: Output of allele_table
+            encoder: Fitted encoder (see encoding.encode_features)
+            keep: Optional feature-selection column indices
+            patient_column: Column pairing candidates with alleles; None
+                crosses every candidate with every allele
+            pair_features: Optional callable (peptides, alleles) ->
+                DataFrame with (some of) the PAIR_COLUMNS for those pairs
+        """
+        self.peptides = peptides.reset_index(drop=True)
+        self.alleles = alleles.reset_index(drop=True)
+        self.patient_column = patient_column
+        self.pair_features = pair_features
+        self.encoder, self.keep = encoder, keep
+
+        names = list(encoder.feature_names_in_)
+        self.allele_features = [names.index(c) for c in ALLELE_COLUMNS if c in names]
+        self.pair_feature_names = [c for c in PAIR_COLUMNS if c in names]
+        self.pair_feature_index = [names.index(c) for c in self.pair_feature_names]
+        peptide_columns = [c for c in names if c not in ALLELE_COLUMNS and c not in PAIR_COLUMNS]
+
+        # Each side is encoded once; pair rows only gather from these
+        self.peptide_cells, self.n_features, self.peptide_drift = encode_cells(
+            self.peptides, encoder, keep, columns=peptide_columns)
+        if pair_features is None:
+            # No binding predictions: the pair columns are missing values, as
+            # in training records without them
+            blank = pd.DataFrame({c: [np.nan] for c in self.pair_feature_names})
+            blank_cells, _, _ = encode_cells(blank, encoder, keep, columns=self.pair_feature_names)
+            self.peptide_cells[:, self.pair_feature_index] = blank_cells[0, self.pair_feature_index]
+        allele_cells, _, self.allele_drift = encode_cells(
+            self.alleles, encoder, keep, columns=ALLELE_COLUMNS)
+        self.allele_cells = allele_cells[:, self.allele_features]
+
+        self.unmatched = []
+        if patient_column is None:
+            groups = [(None, np.arange(len(self.peptides)), np.arange(len(self.alleles)))]
+        else:
+            peptide_rows = self.peptides.groupby(patient_column, sort=False).indices
+            allele_rows = self.alleles.groupby(patient_column, sort=False).indices
+            groups = [(patient, rows, allele_rows[patient])
+                      for patient, rows in peptide_rows.items() if patient in allele_rows]
+            self.unmatched = sorted(set(peptide_rows) - set(allele_rows), key=str)
+        self.patients = [patient for patient, _, _ in groups]
+
+        n_peptides = np.array([len(p) for _, p, _ in groups], dtype=np.int64)
+        self.n_alleles = np.array([len(a) for _, _, a in groups], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(n_peptides * self.n_alleles)))
+        self.peptide_rows = np.concatenate([p for _, p, _ in groups] or [np.zeros(0, np.int64)])
+        self.allele_rows = np.concatenate([a for _, _, a in groups] or [np.zeros(0, np.int64)])
+        self.peptide_start = np.concatenate(([0], np.cumsum(n_peptides)[:-1]))
+        self.allele_start = np.concatenate(([0], np.cumsum(self.n_alleles)[:-1]))
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def pairs(self, start, stop):
+        """(group, peptide row, allele row) arrays of pairs start..stop-1."""
+        index = np.arange(start, stop, dtype=np.int64)
+        group = np.searchsorted(self.offsets, index, side='right') - 1
+        local = index - self.offsets[group]
+        width = self.n_alleles[group]
+        peptide = self.peptide_rows[self.peptide_start[group] + local // width]
+        allele = self.allele_rows[self.allele_start[group] + local % width]
+        return group, peptide, allele
+
+    def encode(self, peptide, allele):
+        """Sparse matrix of the given (peptide row, allele row) pairs."""
+        cells = self.peptide_cells[peptide]
+        cells[:, self.allele_features] = self.allele_cells[allele]
+        if self.pair_features is not None:
+            frame = self.pair_features(self.peptides['peptide'].to_numpy()[peptide],
+                                       self.alleles['mhcAllele'].to_numpy()[allele])
+            # Columns the callback does not provide are missing values
+            frame = frame.reindex(columns=self.pair_feature_names)
+            pair_cells, _, _ = encode_cells(frame, self.encoder, self.keep,
+                                            columns=self.pair_feature_names)
+            cells[:, self.pair_feature_index] = pair_cells[:, self.pair_feature_index]
+        return cells_to_csr(cells, self.n_features)
+
+    def batches(self, batch_size=BATCH_SIZE):
+        """
+        Yield (group, peptide row, allele row, sparse matrix) per batch of pairs.
+        """
+        for start in range(0, len(self), batch_size):
+            group, peptide, allele = self.pairs(start, min(start + batch_size, len(self)))
+            yield group, peptide, allele, self.encode(peptide, allele)
+
+
+def score_pairs(expansion, model, calibration=None, threshold=0.5, batch_size=BATCH_SIZE):
+    """
+    Score the expansion batch by batch.
+
+    Yields:
+        DataFrame per batch with the patient column (if any), candidate_row,
+        peptide, mhcAllele, prediction, prob_positive (and prob_raw when
+        calibrated)
+    """
+    peptides = expansion.peptides['peptide'].astype(str).to_numpy()
+    alleles = expansion.alleles['mhcAllele'].to_numpy()
+    patients = np.array(expansion.patients, dtype=object)
+    for group, peptide, allele, X in expansion.batches(batch_size):
+        raw = model.predict_proba(X)[:, 1]
+        positive = calibration['calibrator'].predict(raw) if calibration else raw
+        batch = pd.DataFrame({'candidate_row': peptide, 'peptide': peptides[peptide],
+                              'mhcAllele': alleles[allele],
+                              'prediction': (positive >= threshold).astype(int),
+                              'prob_positive': positive})
+        if calibration:
+            batch['prob_raw'] = raw
+        if expansion.patient_column:
+            batch.insert(0, expansion.patient_column, patients[group])
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Score candidate peptides against every HLA allele of their patient'
+    )
+    parser.add_argument('input_file', help='Candidate CSV, one row per peptide')
+    parser.add_argument('--hla', action='append',
+                        help='Allele for all candidates (repeatable, e.g. "HLA-A*02:01")')
+    parser.add_argument('--alleles',
+                        help='HLA typing CSV: patient + mhcAllele columns, or one row per '
+                             'patient with one column per allele')
+    parser.add_argument('--patient-column',
+                        help='Column linking candidates and typing (e.g. patient_id)')
+    parser.add_argument('--model', choices=['lightgbm', 'xgboost', 'randomforest'],
+                        default='lightgbm', help='Model to use (default: lightgbm)')
+    parser.add_argument('--version', help='Registry version to use (default: the promoted one)')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='Probability threshold for positive class (default: 0.5)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f'Pairs encoded and scored per batch (default: {BATCH_SIZE:,})')
+    parser.add_argument('--top-k', type=int,
+                        help='Keep only the N best pairs (per patient with --patient-column)')
+    parser.add_argument('--output', default='pair_predictions.csv',
+                        help='Output CSV file (default: pair_predictions.csv)')
+
+    args = parser.parse_args()
+    if bool(args.hla) == bool(args.alleles):
+        parser.error('pass either --hla or --alleles')
+    if args.patient_column and not args.alleles:
+        parser.error('--patient-column needs --alleles')
+
+    try:
+        candidates = pd.read_csv(args.input_file)
+        typing = pd.read_csv(args.alleles) if args.alleles else args.hla
+        alleles = allele_table(typing, args.patient_column)
+        base_path = artifact_dir(args.version)
+        encoder, model = load_model_and_encoder(args.model, base_path)
+        calibration = load_calibration(args.model, base_path)
+        keep = load_feature_selection(base_path)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if args.patient_column and args.patient_column not in candidates.columns:
+        print(f"Error: candidates have no '{args.patient_column}' column")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    expansion = PairExpansion(candidates, alleles, encoder, keep, args.patient_column)
+    print(f"✓ {len(candidates):,} candidates, {len(alleles):,} typed alleles -> "
+          f"{len(expansion):,} peptide x allele pairs (each side encoded once in "
+          f"{time.perf_counter() - start:.2f}s)")
+    if args.patient_column and expansion.unmatched:
+        print(f"  ⚠ {len(expansion.unmatched):,} patients without HLA typing skipped")
+    print(f"  Unseen peptide-level values: {expansion.peptide_drift['unknown_rate']:.1%}, "
+          f"allele-level: {expansion.allele_drift['unknown_rate']:.1%}")
+
+    output = Path(args.output)
+    output.unlink(missing_ok=True)
+    top = TopK(args.top_k, args.patient_column) if args.top_k else None
+    n_scored = n_positive = 0
+    start = time.perf_counter()
+    for batch in score_pairs(expansion, model, calibration, args.threshold, args.batch_size):
+        n_scored += len(batch)
+        n_positive += int(batch['prediction'].sum())
+        if top is not None:
+            top.update(batch)
+        else:
+            batch.to_csv(output, mode='a', header=not output.exists(), index=False)
+        print(f"  {n_scored:,} pairs scored", end='\r', flush=True)
+    elapsed = time.perf_counter() - start
+    if top is not None:
+        top.result().to_csv(output, index=False)
+    elif not output.exists():
+        pd.DataFrame(columns=['candidate_row', 'peptide', 'mhcAllele']).to_csv(output, index=False)
+
+    print(f"\n✓ Scored {n_scored:,} pairs in {elapsed:.2f}s "
+          f"({n_scored / max(elapsed, 1e-9):,.0f} pairs/s), {n_positive:,} predicted positive")
+    print(f"✓ Saved {'top-ranked ' if top is not None else ''}pairs to: {output}")
+
+
+if __name__ == '__main__':
+    main()
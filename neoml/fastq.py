@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML FASTQ Ingestion
+==========================
+Streams FASTQ reads (plain or gzip) in fixed-size chunks and computes read QC
+statistics with NumPy, so memory stays constant regardless of file size.
+
+Plain files are memory-mapped, gzip files are decompressed chunk by chunk and
+in-memory uploads (e.g. marimo's mo.ui.file contents) are sliced through a
+memoryview, so only the chunk being split into records is copied. Lines cut
+at a chunk boundary are carried over on their own rather than re-joined with
+the next chunk. QC can run in a background thread so an interactive UI stays
+responsive.
+
+Usage:
+    python fastq.py <reads.fastq[.gz]> [<reads2.fastq[.gz]> ...]
+"""
+
+import argparse
+import gzip
+import io
+import json
+import mmap
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+
+CHUNK_SIZE = 8 * 1024 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+PHRED_OFFSET = 33
+
+# Histogram caps keep QC state constant-size for any input
+MAX_READ_LENGTH = 1000
+MAX_QUALITY = 60
+
+# Reads with a mean Phred quality below this count as low quality
+LOW_READ_QUALITY = 20
+
+# Lookup tables over raw bytes
+_GC_TABLE = np.zeros(256, dtype=np.uint8)
+_GC_TABLE[list(b'GCgc')] = 1
+_N_TABLE = np.zeros(256, dtype=np.uint8)
+_N_TABLE[list(b'Nn')] = 1
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _is_gzip(head):
+    return head[:2] == GZIP_MAGIC
+
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Yield raw byte chunks from a FASTQ source.
+
+    Args:
+        source: Path, raw bytes, or binary file object (plain or gzip)
+        chunk_size: Bytes per chunk (before decompression)
+        progress: Optional one-element list updated with compressed bytes read
+
+    Yields:
+        bytes or memoryview chunks
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        if _is_gzip(bytes(view[:2])):
+            yield from iter_chunks(io.BytesIO(view), chunk_size, progress)
+            return
+        for offset in range(0, len(view), chunk_size):
+            chunk = view[offset:offset + chunk_size]
+            if progress is not None:
+                progress[0] += len(chunk)
+            yield chunk
+        return
+
+    if isinstance(source, (str, Path)):
+        with open(source, 'rb') as handle:
+            head = handle.read(2)
+            handle.seek(0)
+            if _is_gzip(head) or Path(source).stat().st_size == 0:
+                yield from iter_chunks(handle, chunk_size, progress)
+                return
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for offset in range(0, len(mapped), chunk_size):
+                    chunk = mapped[offset:offset + chunk_size]
+                    if progress is not None:
+                        progress[0] += len(chunk)
+                    yield chunk
+        return
+
+    # Binary file object
+    raw = source
+    head = raw.peek(2)[:2] if hasattr(raw, 'peek') else b''
+    if not head and raw.seekable():
+        head = raw.read(2)
+        raw.seek(0)
+    stream = gzip.GzipFile(fileobj=raw) if _is_gzip(head) else raw
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if progress is not None:
+            progress[0] = raw.tell() if raw.seekable() else progress[0] + len(chunk)
+        yield chunk
+
+
+def iter_batches(source, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Parse a FASTQ source into batches of complete records.
+
+    Records split across chunk boundaries are carried over to the next batch.
+
+    Args:
+        source: Path, raw bytes, or binary file object
+        chunk_size: Bytes per chunk
+        progress: Optional one-element list updated with bytes read
+
+    Yields:
+        (headers, sequences, qualities) lists of bytes for each batch
+    """
+    # Lines of the unfinished record; the last one may be cut mid-line
+    carry = [b'']
+    for chunk in iter_chunks(source, chunk_size, progress):
+        lines = (chunk if isinstance(chunk, bytes) else bytes(chunk)).split(b'\n')
+        lines[0] = carry[-1] + lines[0]
+        lines[:0] = carry[:-1]
+        n_complete = (len(lines) - 1) // 4 * 4
+        carry = lines[n_complete:]
+        if n_complete:
+            yield _split_records(lines[:n_complete])
+
+    lines = carry
+    while lines and not lines[-1].strip():
+        lines.pop()
+    if lines:
+        if len(lines) % 4:
+            raise ValueError(f"Truncated FASTQ: {len(lines) % 4} trailing line(s)")
+        yield _split_records(lines)
+
+
+def _split_records(lines):
+    headers = lines[0::4]
+    for header, separator in zip(headers, lines[2::4]):
+        if not header.startswith(b'@') or not separator.startswith(b'+'):
+            raise ValueError(f"Malformed FASTQ record: {header[:50]!r}")
+    sequences = [line.rstrip(b'\r') for line in lines[1::4]]
+    qualities = [line.rstrip(b'\r') for line in lines[3::4]]
+    mismatch = np.flatnonzero(_lengths(sequences) != _lengths(qualities))
+    if len(mismatch):
+        raise ValueError(f"Sequence and quality lengths differ: {headers[mismatch[0]][:50]!r}")
+    return headers, sequences, qualities
+
+
+def _lengths(lines):
+    return np.fromiter(map(len, lines), dtype=np.int64, count=len(lines))
+
+
+def iter_records(source, chunk_size=CHUNK_SIZE):
+    """
+    Yield (name, sequence, quality) string tuples from a FASTQ source.
+
+    Args:
+        source: Path, raw bytes, or binary file object
+        chunk_size: Bytes per chunk
+
+    Yields:
+        (name, sequence, quality) tuples
+    """
+    for headers, sequences, qualities in iter_batches(source, chunk_size):
+        for header, sequence, quality in zip(headers, sequences, qualities):
+            yield (header[1:].rstrip(b'\r').decode(), sequence.decode(), quality.decode())
+
+
+class FastqQC:
+    """Running read QC statistics with constant memory"""
+
+    def __init__(self):
+        self.reads = 0
+        self.bases = 0
+        self.gc_bases = 0
+        self.n_bases = 0
+        self.q30_bases = 0
+        self.quality_sum = 0
+        self.length_hist = np.zeros(MAX_READ_LENGTH + 1, dtype=np.int64)
+        self.mean_quality_hist = np.zeros(MAX_QUALITY + 1, dtype=np.int64)
+
+    def update(self, sequences, qualities):
+        """Fold one batch of reads into the running statistics."""
+        lengths = _lengths(sequences)
+        if not np.array_equal(lengths, _lengths(qualities)):
+            raise ValueError("Sequence and quality lengths differ")
+        seq = np.frombuffer(b''.join(sequences), dtype=np.uint8)
+        qual = np.frombuffer(b''.join(qualities), dtype=np.uint8).astype(np.int64) - PHRED_OFFSET
+
+        self.reads += len(lengths)
+        self.bases += len(seq)
+        self.gc_bases += int(_GC_TABLE[seq].sum(dtype=np.int64))
+        self.n_bases += int(_N_TABLE[seq].sum(dtype=np.int64))
+        self.q30_bases += int(np.count_nonzero(qual >= 30))
+        self.quality_sum += int(qual.sum())
+        self.length_hist += np.bincount(np.minimum(lengths, MAX_READ_LENGTH),
+                                        minlength=MAX_READ_LENGTH + 1)
+
+        nonempty = lengths > 0
+        if nonempty.any():
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))[nonempty]
+            per_read = np.add.reduceat(qual, offsets) / lengths[nonempty]
+            self.mean_quality_hist += np.bincount(
+                np.clip(per_read.astype(np.int64), 0, MAX_QUALITY), minlength=MAX_QUALITY + 1)
+
+    def summary(self):
+        """Return QC statistics as a plain dict."""
+        bases = max(self.bases, 1)
+        lengths = np.nonzero(self.length_hist)[0]
+        return {
+            'reads': self.reads,
+            'bases': self.bases,
+            'mean_length': self.bases / self.reads if self.reads else 0.0,
+            'min_length': int(lengths[0]) if len(lengths) else 0,
+            'max_length': int(lengths[-1]) if len(lengths) else 0,
+            'gc_content': self.gc_bases / bases,
+            'n_fraction': self.n_bases / bases,
+            'q30_fraction': self.q30_bases / bases,
+            'mean_quality': self.quality_sum / bases,
+            'low_quality_reads': (int(self.mean_quality_hist[:LOW_READ_QUALITY].sum())
+                                  / self.reads if self.reads else 0.0),
+        }
+
+
+def compute_qc(source, chunk_size=CHUNK_SIZE, qc=None, progress=None):
+    """
+    Stream a FASTQ source and compute read QC statistics.
+
+    Args:
+        source: Path, raw bytes, or binary file object
+        chunk_size: Bytes per chunk
+        qc: Optional FastqQC to update in place (lets callers poll progress)
+        progress: Optional one-element list updated with bytes read
+
+    Returns:
+        FastqQC
+    """
+    qc = qc or FastqQC()
+    for _, sequences, qualities in iter_batches(source, chunk_size, progress):
+        qc.update(sequences, qualities)
+    return qc
+
+
+class QCJob:
+    """Background QC run whose partial statistics can be polled"""
+
+    def __init__(self, name, source, size=None):
+        self.name = name
+        self.size = size
+        self.qc = FastqQC()
+        self.progress = [0]
+        self.future = _get_executor().submit(compute_qc, source, CHUNK_SIZE,
+                                             self.qc, self.progress)
+
+    @property
+    def done(self):
+        return self.future.done()
+
+    def status(self):
+        """Return a one-row status dict (partial while running)."""
+        state = 'running'
+        error = ''
+        if self.done:
+            exc = self.future.exception()
+            state, error = ('failed', str(exc)) if exc else ('done', '')
+        row = {'file': self.name, 'status': state}
+        if self.size:
+            row['progress'] = f"{min(self.progress[0] / self.size, 1.0) * 100:.0f}%"
+        row.update(self.qc.summary())
+        if error:
+            row['error'] = error
+        return row
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='fastq-qc')
+    return _executor
+
+
+def submit_qc(source, name=None):
+    """
+    Start QC for a FASTQ source in a background worker.
+
+    Args:
+        source: Path, raw bytes, or binary file object
+        name: Display name (defaults to the file name)
+
+    Returns:
+        QCJob
+    """
+    size = None
+    if isinstance(source, (str, Path)):
+        name = name or Path(source).name
+        size = Path(source).stat().st_size
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        size = len(source)
+    return QCJob(name or 'upload', source, size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream FASTQ files and report read QC')
+    parser.add_argument('files', nargs='+', help='FASTQ files (plain or gzip)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f'Bytes per chunk (default: {CHUNK_SIZE})')
+
+    args = parser.parse_args()
+
+    for path in args.files:
+        try:
+            qc = compute_qc(path, args.chunk_size)
+        except Exception as e:
+            print(f"Error reading {path}: {e}")
+            sys.exit(1)
+        print(json.dumps({'file': path, **qc.summary()}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+NeoTImmuML Feature Selection
+============================
+Prunes the one-hot feature space after encoding. Most of the 262,228 encoded
+columns are categories seen once or twice; no tree can split on them under
+the leaf-size limits used in train_models.py, yet they widen every matrix.
+
+Methods:
+- 'frequency': keep columns with at least min_count non-zeros in training
+  (min_count=4 matches RandomForest's min_samples_leaf; LightGBM and XGBoost
+  need even more rows per leaf, so these columns are almost never split on)
+- 'importance': keep columns a first-pass LightGBM split on at least once
+- 'chi2': keep columns whose chi² test against the label has p < alpha
+
+The result is a sorted array of surviving column indices, saved as
+output/feature_selection.joblib. encoding.encode_features takes it as keep=
+and maps cells straight to the pruned column space, so inference never
+materialises the dropped columns.
+"""
+
+import io
+import time
+
+import numpy as np
+from joblib import dump
+from scipy import sparse
+
+
+METHODS = ['frequency', 'importance', 'chi2']
+
+
+def column_counts(X):
+    """Number of non-zeros per column of a sparse matrix."""
+    X = sparse.csr_matrix(X)
+    return np.bincount(X.indices, minlength=X.shape[1])
+
+
+def first_pass_model(X, y, random_state=42):
+    """Small LightGBM fitted on the full feature space for split importance."""
+    from lightgbm import LGBMClassifier
+
+    model = LGBMClassifier(
+        n_estimators=100,
+        learning_rate=0.1,
+        num_leaves=31,
+        min_child_samples=50,
+        colsample_bytree=0.8,
+        random_state=random_state,
+        verbose=-1
+    )
+    return model.fit(X, y)
+
+
+def select_features(X, y, method='frequency', min_count=4, alpha=0.05, model=None,
+                    random_state=42):
+    """
+    Choose the encoded columns to keep.
+
+    Args:
+        X: Sparse training matrix (full encoded width)
+        y: Training labels
+        method: One of METHODS
+        min_count: Minimum non-zeros per column for 'frequency'
+        alpha: p-value cut-off for 'chi2'
+        model: Fitted first-pass model for 'importance' (fitted here if None)
+        random_state: Seed for the first-pass model
+
+    Returns:
+        sorted int64 numpy array of column indices
+    """
+    if method not in METHODS:
+        raise ValueError(f"Invalid selection method: {method}")
+
+    if method == 'frequency':
+        keep = column_counts(X) >= min_count
+    elif method == 'importance':
+        model = model if model is not None else first_pass_model(X, y, random_state)
+        keep = model.booster_.feature_importance(importance_type='split') > 0
+    else:
+        from sklearn.feature_selection import chi2
+        _, p_values = chi2(X, y)
+        keep = np.nan_to_num(p_values, nan=1.0) < alpha
+
+    return np.flatnonzero(keep).astype(np.int64)
+
+
+def remap_table(n_features, keep):
+    """Full column index -> pruned column index (-1 for dropped columns)."""
+    remap = np.full(n_features, -1, dtype=np.int64)
+    remap[keep] = np.arange(len(keep), dtype=np.int64)
+    return remap
+
+
+def model_size(model):
+    """Serialised size of a model in bytes."""
+    buffer = io.BytesIO()
+    dump(model, buffer)
+    return buffer.tell()
+
+
+def time_predict(model, X, repeats=3):
+    """Best-of-n wall time of predict_proba on X in seconds."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict_proba(X)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compare(full, pruned):
+    """
+    Print a size/latency comparison of full vs pruned feature spaces.
+
+    Args:
+        full, pruned: dicts with 'width', 'nnz', 'model_bytes', 'predict_s'
+            and optionally 'auc'
+    """
+    print(f"  {'':14s} {'Full':>14s} {'Pruned':>14s} {'Ratio':>8s}")
+    rows = [('Columns', 'width', '{:,}'), ('Non-zeros', 'nnz', '{:,}'),
+            ('Model size', 'model_bytes', '{:,} B'), ('Predict', 'predict_s', '{:.4f} s'),
+            ('Test AUC', 'auc', '{:.4f}')]
+    for label, key, fmt in rows:
+        if key not in full or key not in pruned:
+            continue
+        ratio = pruned[key] / full[key] if full[key] else float('nan')
+        print(f"  {label:14s} {fmt.format(full[key]):>14s} {fmt.format(pruned[key]):>14s} "
+              f"{ratio:>8.3f}")
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Excel Ingestion
+==========================
+Streams the validated neoantigen workbooks in ../data/ into the TumorAgDB
+schema, deduplicates them against the existing dataset by peptide/HLA key and
+writes a merged Parquet training set for train_models.py.
+
+Workbooks are opened in openpyxl read-only mode and read row by row in
+batches, so whole sheets are never held in memory as cell objects.
+
+Usage:
+    python ingest_excel.py [workbook.xlsx ...] [--existing ../tumordb/tumoragdb_data.csv]
+                           [--output training_data.parquet]
+
+Requirements:
+    pip install openpyxl pyarrow
+"""
+
+import argparse
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from schema import DEFAULT_DATA_PATH, KEY_COLUMNS, LABEL_COLUMN, TUMORAGDB_COLUMNS, load_table
+
+try:
+    from openpyxl import load_workbook
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+
+DEFAULT_WORKBOOKS = [
+    "../data/Validated Immunogenic Neoantigen Data.xlsx",
+    "../data/immunogenic Neo-peptide Dataset.xlsx",
+]
+
+BATCH_SIZE = 50_000
+
+# Workbook headers that do not match a schema column after normalisation
+COLUMN_ALIASES = {
+    'wtpeptide': 'wtSeq',
+    'mutantseq': 'peptide',
+    'neoantigentype': None,
+    'normaltumor': 'sample',
+    'cancertype': 'sample',
+    'sampletissue': 'tissue',
+    'mutationtype': 'type',
+    'mutantbestalleles': 'mhcAllele',
+}
+
+# Placeholder strings used for missing values in the workbooks
+MISSING_VALUES = {'None', 'none', 'NA', 'N/A', '', '-'}
+
+_NORMALISED = {re.sub(r'[^a-z0-9]', '', c.lower()): c for c in TUMORAGDB_COLUMNS}
+
+
+def _normalise(name):
+    return re.sub(r'[^a-z0-9]', '', str(name).lower())
+
+
+def map_columns(headers):
+    """
+    Map workbook headers onto TumorAgDB column names.
+
+    Args:
+        headers: Header row of a sheet
+
+    Returns:
+        dict mapping header position -> schema column (unmapped headers omitted)
+    """
+    mapping = {}
+    for position, header in enumerate(headers):
+        if header is None:
+            continue
+        key = _normalise(header)
+        column = COLUMN_ALIASES[key] if key in COLUMN_ALIASES else _NORMALISED.get(key)
+        # First header wins when several map to the same column
+        if column and column not in mapping.values():
+            mapping[position] = column
+    return mapping
+
+
+def normalise_allele(value):
+    """
+    Convert compact allele lists (e.g. 'B1401,C0701') to 'HLA-B*14:01'.
+
+    Only the first allele of a list is kept; values already in HLA notation
+    are returned unchanged.
+    """
+    if not isinstance(value, str):
+        return value
+    first = value.split(',')[0].strip()
+    match = re.fullmatch(r'([ABC])(\d{2})(\d{2})', first)
+    if match:
+        return f"HLA-{match.group(1)}*{match.group(2)}:{match.group(3)}"
+    return first
+
+
+def iter_workbook(path, batch_size=BATCH_SIZE):
+    """
+    Stream a workbook's data sheets as schema-mapped DataFrame batches.
+
+    Sheets without a peptide and a label column (e.g. feature description
+    sheets) are skipped.
+
+    Args:
+        path: Path to .xlsx file
+        batch_size: Rows per yielded batch
+
+    Yields:
+        DataFrame batches with TumorAgDB columns
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            headers = next(rows, None)
+            if headers is None:
+                continue
+            mapping = map_columns(headers)
+            if not set(KEY_COLUMNS[:1] + [LABEL_COLUMN]) <= set(mapping.values()):
+                print(f"  ⚠ Skipping sheet '{sheet.title}' (no peptide/label columns)")
+                continue
+
+            positions = list(mapping)
+            batch = []
+            for row in rows:
+                batch.append([row[p] if p < len(row) else None for p in positions])
+                if len(batch) >= batch_size:
+                    yield _to_frame(batch, mapping)
+                    batch = []
+            if batch:
+                yield _to_frame(batch, mapping)
+    finally:
+        workbook.close()
+
+
+def _to_frame(batch, mapping):
+    frame = pd.DataFrame(batch, columns=list(mapping.values()), dtype=object)
+    frame = frame.replace(list(MISSING_VALUES), np.nan)
+    frame = frame.dropna(how='all')
+    if 'mhcAllele' in frame:
+        frame['mhcAllele'] = frame['mhcAllele'].map(normalise_allele)
+    if 'peptide' in frame:
+        frame['peptide'] = frame['peptide'].astype(str).str.strip().str.upper()
+    return frame.reindex(columns=TUMORAGDB_COLUMNS)
+
+
+def record_keys(frame):
+    """Return the peptide/HLA dedup key of each row as a string Series."""
+    parts = [frame[c].astype(str).str.strip() for c in KEY_COLUMNS]
+    return parts[0].str.cat(parts[1:], sep='|')
+
+
+def ingest(workbooks, existing_file, output_file, batch_size=BATCH_SIZE):
+    """
+    Ingest workbooks, deduplicate against the existing dataset and merge.
+
+    Args:
+        workbooks: List of .xlsx paths
+        existing_file: Existing TumorAgDB dataset (CSV or Parquet), may be None
+        output_file: Parquet file to write
+        batch_size: Rows per streamed batch
+
+    Returns:
+        dict with ingestion statistics
+    """
+    existing = None
+    seen = set()
+    if existing_file and Path(existing_file).exists():
+        existing = load_table(existing_file)
+        seen = set(record_keys(existing))
+        print(f"✓ Loaded {len(existing):,} existing records ({len(seen):,} unique keys)")
+
+    stats = {'read': 0, 'duplicates': 0, 'added': 0}
+    frames = []
+    for path in workbooks:
+        print(f"  Reading {path}...")
+        for batch in iter_workbook(path, batch_size):
+            stats['read'] += len(batch)
+            keys = record_keys(batch)
+            fresh = ~keys.isin(seen) & ~keys.duplicated()
+            stats['duplicates'] += int((~fresh).sum())
+            seen.update(keys[fresh])
+            frames.append(batch[fresh.to_numpy()])
+
+    new_records = pd.concat(frames, ignore_index=True) if frames else \
+        pd.DataFrame(columns=TUMORAGDB_COLUMNS)
+    new_records[LABEL_COLUMN] = pd.to_numeric(new_records[LABEL_COLUMN], errors='coerce')
+    new_records = new_records.dropna(subset=[LABEL_COLUMN])
+    stats['added'] = len(new_records)
+
+    merged = new_records if existing is None else \
+        pd.concat([existing, new_records], ignore_index=True)
+    # Match pd.read_csv typing: fully numeric columns become float, the rest strings
+    for column in merged.columns:
+        if merged[column].dtype != object:
+            continue
+        numeric = pd.to_numeric(merged[column], errors='coerce')
+        if numeric.notna().sum() == merged[column].notna().sum():
+            merged[column] = numeric.astype(np.float64)
+        else:
+            merged[column] = merged[column].map(lambda v: v if pd.isna(v) else str(v))
+    merged[LABEL_COLUMN] = merged[LABEL_COLUMN].astype(np.uint8)
+
+    merged.to_parquet(output_file, index=False)
+    stats['total'] = len(merged)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Ingest validated neoantigen workbooks into the TumorAgDB training set'
+    )
+    parser.add_argument('workbooks', nargs='*', default=DEFAULT_WORKBOOKS,
+                        help='Excel workbooks to ingest (default: ../data/*.xlsx)')
+    parser.add_argument('--existing', default=DEFAULT_DATA_PATH,
+                        help=f'Existing TumorAgDB dataset (default: {DEFAULT_DATA_PATH})')
+    parser.add_argument('--output', default='training_data.parquet',
+                        help='Merged Parquet output (default: training_data.parquet)')
+
+    args = parser.parse_args()
+
+    if not HAS_OPENPYXL:
+        print("Error: openpyxl is required (pip install openpyxl)")
+        sys.exit(1)
+
+    print(f"\n{'='*60}")
+    print("NeoTImmuML Excel Ingestion")
+    print(f"{'='*60}")
+
+    try:
+        stats = ingest(args.workbooks, args.existing, args.output)
+    except Exception as e:
+        print(f"Error during ingestion: {e}")
+        sys.exit(1)
+
+    print(f"\n✓ Read {stats['read']:,} workbook rows")
+    print(f"✓ Skipped {stats['duplicates']:,} duplicates (peptide/HLA key)")
+    print(f"✓ Added {stats['added']:,} new labelled records")
+    print(f"✓ Saved {stats['total']:,} records to: {args.output}")
+    print(f"\nTrain on it with: python train_models.py --data {args.output}")
+
+
+if __name__ == '__main__':
+    main()
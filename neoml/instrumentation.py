@@ -0,0 +1,124 @@
+"""
+NeoTImmuML Instrumentation
+==========================
+Stage timers for the training and inference scripts. Each stage records wall
+time, CPU time, peak RSS, rows/s and (when given) sparse matrix nnz, and is
+appended as one JSON line to a metrics file so runs can be compared.
+
+Profiling hooks:
+- 'cprofile': each stage is profiled in-process and dumped to
+  <profile_dir>/<run>_<stage>.prof (open with snakeviz or pstats)
+- 'pyspy': nothing runs in-process; the PID is printed and recorded so
+  `py-spy record --pid <PID>` can attach, and stage timestamps in the metrics
+  file line up with the flame graph
+
+Example:
+    instr = Instrumentation('metrics.jsonl', run='predict')
+    with instr.stage('encode', rows=len(data)) as record:
+        X = encoder.transform(data)
+        record['nnz'] = X.nnz
+"""
+
+import cProfile
+import json
+import os
+import socket
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+
+PROFILERS = ['cprofile', 'pyspy']
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None if unavailable)."""
+    if not HAS_RESOURCE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / 1024 if os.uname().sysname != 'Darwin' else peak / (1024 * 1024)
+
+
+class Instrumentation:
+    """Collects per-stage metrics and writes them as JSON lines"""
+
+    def __init__(self, metrics_file=None, run='run', profiler=None, profile_dir='profiles'):
+        if profiler is not None and profiler not in PROFILERS:
+            raise ValueError(f"Invalid profiler: {profiler}")
+        self.metrics_file = Path(metrics_file) if metrics_file else None
+        self.run = run
+        self.run_id = uuid.uuid4().hex[:12]
+        self.profiler = profiler
+        self.profile_dir = Path(profile_dir)
+        self.records = []
+
+        if profiler == 'cprofile':
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+        elif profiler == 'pyspy':
+            print(f"ℹ️  PID {os.getpid()} - attach with: py-spy record --pid {os.getpid()} -o {run}.svg")
+
+    @contextmanager
+    def stage(self, name, rows=None, **fields):
+        """
+        Time a stage. The yielded dict can be updated with extra fields
+        (e.g. nnz, n_features) before the stage ends.
+
+        Args:
+            name: Stage name (load, encode, fit, predict, save, ...)
+            rows: Number of rows processed, used for rows/s
+            **fields: Extra fields recorded with the stage
+        """
+        record = {'stage': name, 'rows': rows, **fields}
+        profile = cProfile.Profile() if self.profiler == 'cprofile' else None
+
+        started = datetime.now(timezone.utc).isoformat()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        if profile:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile:
+                profile.disable()
+                profile.dump_stats(self.profile_dir / f"{self.run}_{name}.prof")
+            seconds = time.perf_counter() - wall
+            record.update({
+                'started': started,
+                'seconds': round(seconds, 6),
+                'cpu_seconds': round(time.process_time() - cpu, 6),
+                'peak_rss_mb': peak_rss_mb(),
+            })
+            if record.get('rows'):
+                record['rows_per_s'] = round(record['rows'] / max(seconds, 1e-9), 1)
+            self._emit(record)
+
+    def _emit(self, record):
+        record = {'run': self.run, 'run_id': self.run_id, 'host': socket.gethostname(),
+                  'pid': os.getpid(), **record}
+        self.records.append(record)
+        if self.metrics_file:
+            self.metrics_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.metrics_file, 'a') as handle:
+                handle.write(json.dumps(record, default=str) + '\n')
+
+    def summary(self):
+        """Print a per-stage timing table."""
+        if not self.records:
+            return
+        print(f"\n{'Stage':24s} {'Seconds':>10s} {'Rows/s':>14s} {'Peak RSS':>12s}")
+        for record in self.records:
+            rate = f"{record['rows_per_s']:,.0f}" if record.get('rows_per_s') else '-'
+            rss = f"{record['peak_rss_mb']:,.0f} MB" if record.get('peak_rss_mb') else '-'
+            print(f"{record['stage']:24s} {record['seconds']:10.3f} {rate:>14s} {rss:>12s}")
+        if self.metrics_file:
+            print(f"✓ Metrics appended to: {self.metrics_file}")
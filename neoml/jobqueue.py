@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Job Queue
+====================
+Local scoring queue around predict_immunogenicity, backed by one SQLite file
+(no external service).
+
+- Jobs carry a priority class; workers always claim the most urgent queued
+  job first (interactive < normal < batch, then submission order).
+- Inputs are read and scored in chunks. After each chunk the result rows
+  are appended to the output CSV and progress (rows, output size) is
+  committed, so `status` shows live progress and a partial result file is
+  usable while the job runs.
+- Between chunks a worker yields its job back to the queue when a more
+  urgent job is waiting, so a handful of peptides never waits behind a
+  whole cohort. The job resumes later from its last committed chunk.
+- A job interrupted by a crash is resumed the same way: the output file is
+  truncated to the last committed size and scoring continues from there.
+- Rows are counted and skipped as physical lines, so inputs must not have
+  line breaks inside quoted fields (TumorAgDB exports and predict.py inputs
+  have none).
+
+Each worker process loads the promoted model version once (registry.py) and
+follows later promotions for new jobs. A job is pinned to the version it
+started with (jobs.model_version), also across yields and restarts, so its
+output never mixes rows from two versions.
+
+Usage:
+    python jobqueue.py submit <input_csv> [--priority interactive|normal|batch]
+                       [--model lightgbm] [--output FILE]
+    python jobqueue.py work [--workers 2] [--exit-when-idle]
+    python jobqueue.py status [JOB_ID]
+    python jobqueue.py cancel JOB_ID
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+
+DEFAULT_DB = Path(__file__).parent / 'jobs' / 'queue.sqlite'
+
+PRIORITIES = {'interactive': 0, 'normal': 1, 'batch': 2}
+
+CHUNK_SIZE = 50_000
+
+POLL_INTERVAL = 1.0
+
+# model_version recorded for jobs scored with the legacy output/ artifacts
+LEGACY_VERSION = 'legacy'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    input_file TEXT NOT NULL,
+    output_file TEXT NOT NULL,
+    model TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    chunk_size INTEGER NOT NULL,
+    rows_total INTEGER,
+    rows_done INTEGER NOT NULL DEFAULT 0,
+    output_bytes INTEGER NOT NULL DEFAULT 0,
+    submitted TEXT NOT NULL,
+    started TEXT,
+    finished TEXT,
+    worker TEXT,
+    error TEXT,
+    model_version TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority, id);
+"""
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def connect(db_path=DEFAULT_DB):
+    """Open the queue database, creating it if needed."""
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    # Queues created before jobs recorded their model version
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+    if 'model_version' not in columns:
+        conn.execute('ALTER TABLE jobs ADD COLUMN model_version TEXT')
+    return conn
+
+
+def count_rows(path):
+    """
+    Number of data rows in a CSV (newlines minus header), read in blocks.
+
+    Quoted fields with line breaks are miscounted; resuming (skiprows) relies
+    on the same line-per-row assumption.
+    """
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    return max(lines - 1, 0)
+
+
+def submit(input_file, output_file=None, priority='normal', model='lightgbm',
+           chunk_size=CHUNK_SIZE, options=None, db_path=DEFAULT_DB):
+    """
+    Queue a scoring job.
+
+    Args:
+        input_file: CSV with neoantigen features
+        output_file: Result CSV (default: <input>.predictions.csv)
+        priority: One of PRIORITIES
+        model: Model type (lightgbm, xgboost, randomforest)
+        chunk_size: Rows scored per chunk
+        options: Extra predict_immunogenicity keyword arguments
+            (threshold, max_unknown_rate)
+
+    Returns:
+        job id
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Invalid priority: {priority}")
+    input_file = Path(input_file).resolve()
+    if not input_file.exists():
+        raise FileNotFoundError(f"Input not found: {input_file}")
+    output_file = Path(output_file).resolve() if output_file else \
+        input_file.with_name(input_file.stem + '.predictions.csv')
+
+    conn = connect(db_path)
+    try:
+        cursor = conn.execute(
+            'INSERT INTO jobs (priority, input_file, output_file, model, options, '
+            'chunk_size, rows_total, submitted) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (PRIORITIES[priority], str(input_file), str(output_file), model,
+             json.dumps(options or {}), chunk_size, count_rows(input_file), _now()))
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+
+def claim(conn, worker):
+    """Atomically mark the most urgent queued job as running and return it."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        job = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority, id LIMIT 1"
+        ).fetchone()
+        if job is not None:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, "
+                "started = COALESCE(started, ?) WHERE id = ?",
+                (worker, _now(), job['id']))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return job
+
+
+def _more_urgent_waiting(conn, priority):
+    return conn.execute(
+        "SELECT 1 FROM jobs WHERE status = 'queued' AND priority < ? LIMIT 1", (priority,)
+    ).fetchone() is not None
+
+
+def pinned_bundle(scorer, job):
+    """
+    (bundle, version) to score a job with.
+
+    A job that already has a model version (it was yielded or interrupted)
+    finishes with that version even if another one has been promoted since,
+    so one output file never mixes versions; a new job takes the scorer's
+    current version.
+    """
+    bundle, version = scorer.current
+    version = version or LEGACY_VERSION
+    started = job['model_version']
+    if started and started != version:
+        from registry import LEGACY_DIR, artifact_dir, load_bundle
+        directory = LEGACY_DIR if started == LEGACY_VERSION \
+            else artifact_dir(started, scorer.registry)
+        bundle, version = load_bundle(directory, job['model']), started
+    return bundle, version
+
+
+def run_job(conn, job, scorer_for):
+    """
+    Score a claimed job chunk by chunk, resuming from its committed progress.
+
+    Args:
+        conn: Queue connection
+        job: Row returned by claim
+        scorer_for: Callable model type -> registry.HotSwapScorer
+
+    Returns:
+        final status ('done', 'queued' when yielded, 'cancelled')
+    """
+    options = json.loads(job['options'])
+    output = Path(job['output_file'])
+    rows_done, output_bytes = job['rows_done'], job['output_bytes']
+
+    # Drop anything written after the last committed chunk
+    if rows_done == 0:
+        output.unlink(missing_ok=True)
+    elif output.exists() and output.stat().st_size > output_bytes:
+        os.truncate(output, output_bytes)
+
+    scorer = scorer_for(job['model'])
+    bundle, version = pinned_bundle(scorer, job)
+    conn.execute('UPDATE jobs SET model_version = ? WHERE id = ?', (version, job['id']))
+    reader = pd.read_csv(job['input_file'], chunksize=job['chunk_size'],
+                         skiprows=range(1, rows_done + 1))
+    for chunk in reader:
+        with redirect_stdout(io.StringIO()):
+            results = scorer.score(chunk, current=(bundle, version), **options)
+        results.to_csv(output, mode='a', header=rows_done == 0, index=False)
+        rows_done += len(chunk)
+        output_bytes = output.stat().st_size
+
+        conn.execute('UPDATE jobs SET rows_done = ?, output_bytes = ? WHERE id = ?',
+                     (rows_done, output_bytes, job['id']))
+        status = conn.execute('SELECT status FROM jobs WHERE id = ?',
+                              (job['id'],)).fetchone()['status']
+        if status == 'cancelled':
+            return 'cancelled'
+        if _more_urgent_waiting(conn, job['priority']):
+            # A cancel may land between the check above and this update
+            yielded = conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL "
+                "WHERE id = ? AND status != 'cancelled'", (job['id'],)).rowcount
+            return 'queued' if yielded else 'cancelled'
+
+    # A cancel during the last chunk wins over completion
+    finished = conn.execute(
+        "UPDATE jobs SET status = 'done', finished = ?, rows_total = ? "
+        "WHERE id = ? AND status != 'cancelled'", (_now(), rows_done, job['id'])).rowcount
+    return 'done' if finished else 'cancelled'
+
+
+def worker_loop(db_path=DEFAULT_DB, exit_when_idle=False, poll_interval=POLL_INTERVAL):
+    """Claim and run jobs until stopped (or until the queue is empty)."""
+    from registry import HotSwapScorer
+
+    name = f"{os.uname().nodename}:{os.getpid()}"
+    conn = connect(db_path)
+    scorers = {}
+
+    def scorer_for(model_type):
+        if model_type not in scorers:
+            scorers[model_type] = HotSwapScorer(model_type)
+        return scorers[model_type]
+
+    while True:
+        job = claim(conn, name)
+        if job is None:
+            if exit_when_idle:
+                break
+            time.sleep(poll_interval)
+            continue
+        try:
+            status = run_job(conn, job, scorer_for)
+            print(f"[{name}] job {job['id']}: {status}", flush=True)
+        except Exception as e:
+            conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished = ? "
+                         "WHERE id = ? AND status != 'cancelled'", (str(e), _now(), job['id']))
+            print(f"[{name}] job {job['id']}: failed ({e})", flush=True)
+    conn.close()
+
+
+def requeue_running(db_path=DEFAULT_DB):
+    """Return jobs left 'running' by a stopped pool to the queue."""
+    conn = connect(db_path)
+    try:
+        return conn.execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running'"
+        ).rowcount
+    finally:
+        conn.close()
+
+
+def run_workers(workers=2, db_path=DEFAULT_DB, exit_when_idle=False):
+    """Start a pool of worker processes and wait for them."""
+    requeued = requeue_running(db_path)
+    if requeued:
+        print(f"✓ Requeued {requeued} interrupted jobs")
+    processes = [multiprocessing.Process(target=worker_loop, args=(db_path, exit_when_idle))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+def cancel(job_id, db_path=DEFAULT_DB):
+    """Cancel a queued or running job (running jobs stop after their chunk)."""
+    conn = connect(db_path)
+    try:
+        return conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished = ? "
+            "WHERE id = ? AND status IN ('queued', 'running')", (_now(), job_id)
+        ).rowcount > 0
+    finally:
+        conn.close()
+
+
+def job_status(job_id=None, db_path=DEFAULT_DB):
+    """Jobs (or one job) as a DataFrame with a progress column."""
+    conn = connect(db_path)
+    try:
+        query = 'SELECT * FROM jobs' + (' WHERE id = ?' if job_id else '') + ' ORDER BY id'
+        jobs = pd.read_sql_query(query, conn, params=(job_id,) if job_id else ())
+    finally:
+        conn.close()
+    names = {v: k for k, v in PRIORITIES.items()}
+    jobs['priority'] = jobs['priority'].map(names)
+    jobs['progress'] = jobs['rows_done'] / jobs['rows_total'].clip(lower=1)
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local priority queue for NeoTImmuML scoring jobs')
+    parser.add_argument('--db', default=str(DEFAULT_DB), help=f'Queue database (default: {DEFAULT_DB})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    submit_parser = commands.add_parser('submit', help='Queue a scoring job')
+    submit_parser.add_argument('input_file', help='CSV file with neoantigen features')
+    submit_parser.add_argument('--priority', choices=list(PRIORITIES), default='normal',
+                               help='Priority class (default: normal)')
+    submit_parser.add_argument('--model', choices=['lightgbm', 'xgboost', 'randomforest'],
+                               default='lightgbm', help='Model (default: lightgbm)')
+    submit_parser.add_argument('--output', help='Result CSV (default: <input>.predictions.csv)')
+    submit_parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                               help=f'Rows per chunk (default: {CHUNK_SIZE:,})')
+    submit_parser.add_argument('--threshold', type=float, default=0.5,
+                               help='Probability threshold for positive class (default: 0.5)')
+
+    work_parser = commands.add_parser('work', help='Run a worker pool')
+    work_parser.add_argument('--workers', type=int, default=2, help='Worker processes (default: 2)')
+    work_parser.add_argument('--exit-when-idle', action='store_true',
+                             help='Stop once the queue is empty')
+
+    status_parser = commands.add_parser('status', help='Show job progress')
+    status_parser.add_argument('job_id', nargs='?', type=int, help='Job id (default: all)')
+
+    cancel_parser = commands.add_parser('cancel', help='Cancel a job')
+    cancel_parser.add_argument('job_id', type=int, help='Job id')
+
+    args = parser.parse_args()
+
+    if args.command == 'submit':
+        try:
+            job_id = submit(args.input_file, args.output, args.priority, args.model,
+                            args.chunk_size, {'threshold': args.threshold}, args.db)
+        except Exception as e:
+            print(f"Error submitting job: {e}")
+            sys.exit(1)
+        print(f"✓ Queued job {job_id} ({args.priority})")
+    elif args.command == 'work':
+        run_workers(args.workers, args.db, args.exit_when_idle)
+    elif args.command == 'status':
+        jobs = job_status(args.job_id, args.db)
+        if jobs.empty:
+            print("No jobs")
+            return
+        for job in jobs.itertuples():
+            print(f"{job.id:>5}  {job.status:10s} {job.priority:12s} "
+                  f"{job.rows_done:>10,}/{job.rows_total or 0:<10,} {job.progress:6.1%}  "
+                  f"{Path(job.output_file).name}"
+                  + (f"  [{job.model_version}]" if job.model_version else "")
+                  + (f"  ({job.error})" if job.error else ""))
+    else:
+        if not cancel(args.job_id, args.db):
+            print(f"Error: job {args.job_id} is not queued or running")
+            sys.exit(1)
+        print(f"✓ Cancelled job {args.job_id}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Peptide-Only Scoring
+===============================
+Scores bare peptide lists (e.g. ../data/Unknown_Peptide_Sequences) that lack
+the 46 TumorAgDB feature columns predict.py requires.
+
+Features are derived from the sequence alone (length, composition, terminal
+and anchor residues, hydrophobicity, charge) plus the HLA allele when given.
+Columns that can be imputed from TumorAgDB (binding ranks, processing and
+expression scores) are looked up by peptide. All feature generation is
+vectorised over a byte-encoded peptide matrix.
+
+Usage:
+    python peptide_score.py --train [--data ../tumordb/tumoragdb_data.csv]
+    python peptide_score.py <peptides_file> [--hla HLA-A*02:01 ...] [--output FILE]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import dump, load
+
+from peptides import encode_sequences
+from schema import DEFAULT_DATA_PATH, LABEL_COLUMN, load_table
+
+
+MODEL_PATH = Path(__file__).parent / 'output' / 'PeptideOnly' / 'model.joblib'
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+KYTE_DOOLITTLE = {
+    'A': 1.8, 'C': 2.5, 'D': -3.5, 'E': -3.5, 'F': 2.8, 'G': -0.4, 'H': -3.2,
+    'I': 4.5, 'K': -3.9, 'L': 3.8, 'M': 1.9, 'N': -3.5, 'P': -1.6, 'Q': -3.5,
+    'R': -4.5, 'S': -0.8, 'T': -0.7, 'V': 4.2, 'W': 0.9, 'Y': -1.3
+}
+CHARGE = {'K': 1.0, 'R': 1.0, 'H': 0.1, 'D': -1.0, 'E': -1.0}
+
+# TumorAgDB columns that describe the peptide itself and can be imputed by lookup
+IMPUTED_COLUMNS = [
+    'mutantRankNetMHCpan', 'mutantRankPRIME', 'mutRankStab', 'tapScore',
+    'mutNetChopScoreCt', 'mutBindingScore', 'gtexAllTissuesExpressionMean',
+]
+
+# Residue positions with their own one-hot block (negative = from C-terminus)
+POSITIONS = [0, 1, 2, -2, -1]
+
+# Fraction of training rows whose imputed columns are hidden, so the model also
+# learns to score peptides that are not in TumorAgDB
+IMPUTE_DROPOUT = 0.5
+
+# Allele label for rows without an allele (its own LightGBM category)
+UNKNOWN_ALLELE = 'unknown'
+
+# Byte -> residue index lookup (20 = unknown, 21 = padding)
+_INDEX = np.full(256, 20, dtype=np.int8)
+_INDEX[0] = 21
+for _i, _aa in enumerate(AMINO_ACIDS):
+    _INDEX[ord(_aa)] = _i
+_HYDRO = np.array([KYTE_DOOLITTLE[aa] for aa in AMINO_ACIDS] + [0.0, 0.0], dtype=np.float32)
+_CHARGE = np.array([CHARGE.get(aa, 0.0) for aa in AMINO_ACIDS] + [0.0, 0.0], dtype=np.float32)
+
+
+def feature_names():
+    """Names of the columns produced by peptide_features."""
+    names = ['length', 'hydrophobicity', 'net_charge', 'unknown_residues']
+    names += [f'count_{aa}' for aa in AMINO_ACIDS]
+    names += [f'pos{p}_{aa}' for p in POSITIONS for aa in AMINO_ACIDS]
+    return names + ['allele_code'] + IMPUTED_COLUMNS
+
+
+def encode_residues(peptides):
+    """
+    Encode peptides as a padded matrix of residue indices.
+
+    Returns:
+        (int8 index matrix, lengths)
+    """
+    peptides = [str(p).strip().upper() for p in peptides]
+    lengths = np.fromiter(map(len, peptides), dtype=np.int64, count=len(peptides))
+    width = int(lengths.max()) if len(lengths) else 1
+    return _INDEX[encode_sequences(peptides, width)], lengths
+
+
+def peptide_features(peptides, alleles=None, allele_vocab=None, lookup=None):
+    """
+    Build the peptide-only feature matrix.
+
+    Args:
+        peptides: Sequence of peptide strings
+        alleles: Optional sequence of HLA alleles (one per peptide); when
+            omitted every peptide gets the UNKNOWN_ALLELE code
+        allele_vocab: Allele vocabulary fixed at training time
+        lookup: DataFrame of IMPUTED_COLUMNS indexed by peptide
+
+    Returns:
+        float32 numpy array of shape (n, len(feature_names()))
+    """
+    idx, lengths = encode_residues(peptides)
+    n = len(lengths)
+    safe_length = np.maximum(lengths, 1)
+
+    onehot = idx[:, :, None] == np.arange(20, dtype=np.int8)
+    counts = onehot.sum(axis=1, dtype=np.float32)
+
+    blocks = [
+        lengths[:, None].astype(np.float32),
+        (_HYDRO[idx].sum(axis=1) / safe_length)[:, None],
+        _CHARGE[idx].sum(axis=1)[:, None],
+        (idx == 20).sum(axis=1, dtype=np.float32)[:, None],
+        counts,
+    ]
+
+    rows = np.arange(n)
+    for position in POSITIONS:
+        column = position if position >= 0 else lengths + position
+        column = np.clip(column, 0, idx.shape[1] - 1)
+        blocks.append(onehot[rows, column].astype(np.float32))
+
+    # Allele as a LightGBM categorical code; alleles outside the vocabulary are
+    # NaN, missing ones (or alleles=None) share the UNKNOWN_ALLELE code
+    codes = np.full(n, -1, dtype=np.int64)
+    if allele_vocab is not None:
+        if alleles is None:
+            alleles = [None] * n
+        codes = pd.Index(allele_vocab).get_indexer(allele_labels(alleles))
+    codes = codes.astype(np.float32)
+    codes[codes < 0] = np.nan
+    blocks.append(codes[:, None])
+
+    if lookup is not None:
+        found = lookup.index.get_indexer(pd.Series(peptides).astype(str).str.upper())
+        imputed = lookup.to_numpy(dtype=np.float32)[np.maximum(found, 0)]
+        imputed[found < 0] = np.nan
+    else:
+        imputed = np.full((n, len(IMPUTED_COLUMNS)), np.nan, dtype=np.float32)
+    blocks.append(imputed)
+
+    return np.hstack(blocks).astype(np.float32, copy=False)
+
+
+def allele_labels(alleles):
+    """Alleles as strings, with missing values mapped to UNKNOWN_ALLELE."""
+    return pd.Series(alleles, dtype=object).fillna(UNKNOWN_ALLELE).astype(str)
+
+
+def build_lookup(data):
+    """Median of each imputable column per peptide in a TumorAgDB table."""
+    columns = [c for c in IMPUTED_COLUMNS if c in data.columns]
+    numeric = data[columns].apply(pd.to_numeric, errors='coerce')
+    numeric['peptide'] = data['peptide'].astype(str).str.upper()
+    lookup = numeric.groupby('peptide').median()
+    return lookup.reindex(columns=IMPUTED_COLUMNS).astype(np.float32)
+
+
+def train_peptide_model(data, random_state=42):
+    """
+    Train the reduced-feature model on a TumorAgDB table.
+
+    Args:
+        data: DataFrame with peptide, mhcAllele and immunogenicity columns
+        random_state: Seed for LightGBM and imputation dropout
+
+    Returns:
+        bundle dict with model, allele vocabulary, lookup table and feature names
+    """
+    from lightgbm import LGBMClassifier
+
+    data = data.dropna(subset=['peptide', LABEL_COLUMN])
+    alleles = allele_labels(data['mhcAllele'])
+    allele_vocab = sorted(alleles.unique())
+    lookup = build_lookup(data)
+
+    X = peptide_features(data['peptide'].tolist(), alleles.tolist(), allele_vocab, lookup)
+    y = data[LABEL_COLUMN].astype(int).to_numpy()
+
+    rng = np.random.default_rng(random_state)
+    hidden = rng.random(len(X)) < IMPUTE_DROPOUT
+    X[np.ix_(hidden, np.arange(X.shape[1] - len(IMPUTED_COLUMNS), X.shape[1]))] = np.nan
+
+    names = feature_names()
+    model = LGBMClassifier(
+        n_estimators=100,
+        learning_rate=0.1,
+        num_leaves=15,
+        min_child_samples=50,
+        subsample=0.8,
+        subsample_freq=1,
+        colsample_bytree=0.8,
+        random_state=random_state,
+        verbose=-1
+    )
+    model.fit(pd.DataFrame(X, columns=names), y,
+              categorical_feature=['allele_code'])
+
+    return {'model': model, 'allele_vocab': allele_vocab, 'lookup': lookup,
+            'feature_names': names}
+
+
+def score_peptides(bundle, peptides, alleles=None, batch_size=100_000):
+    """
+    Score peptides with the peptide-only model.
+
+    Args:
+        bundle: Output of train_peptide_model (or loaded from MODEL_PATH)
+        peptides: Sequence of peptide strings
+        alleles: Optional sequence of HLA alleles (one per peptide)
+        batch_size: Peptides featurised and scored per batch
+
+    Returns:
+        numpy array of positive-class probabilities
+    """
+    model = bundle['model']
+    probabilities = np.empty(len(peptides), dtype=np.float64)
+    for start in range(0, len(peptides), batch_size):
+        stop = start + batch_size
+        batch_alleles = list(alleles[start:stop]) if alleles is not None else None
+        X = peptide_features(list(peptides[start:stop]), batch_alleles,
+                             bundle['allele_vocab'], bundle['lookup'])
+        probabilities[start:stop] = model.predict_proba(
+            pd.DataFrame(X, columns=bundle['feature_names']))[:, 1]
+    return probabilities
+
+
+def read_peptides(path):
+    """
+    Read a peptide list: a header line plus one peptide per line, or a CSV
+    with a 'peptide' column (and optional 'mhcAllele').
+
+    Returns:
+        DataFrame with a peptide column (and mhcAllele when present)
+    """
+    data = pd.read_csv(path, dtype=str)
+    if 'peptide' not in data.columns:
+        data = data.rename(columns={data.columns[0]: 'peptide'})
+    data['peptide'] = data['peptide'].str.strip().str.upper()
+    return data.dropna(subset=['peptide'])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Score bare peptide lists with the peptide-only NeoTImmuML model'
+    )
+    parser.add_argument('input_file', nargs='?', help='Peptide list or CSV with a peptide column')
+    parser.add_argument('--hla', action='append',
+                        help='HLA allele to score against (repeatable, e.g. HLA-A*02:01)')
+    parser.add_argument('--output', default='peptide_predictions.csv',
+                        help='Output CSV file (default: peptide_predictions.csv)')
+    parser.add_argument('--train', action='store_true',
+                        help='Train the peptide-only model instead of scoring')
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH,
+                        help=f'Training data for --train (default: {DEFAULT_DATA_PATH})')
+
+    args = parser.parse_args()
+
+    if args.train:
+        print(f"\nTraining peptide-only model on {args.data}...")
+        data = load_table(args.data)
+        bundle = train_peptide_model(data)
+        MODEL_PATH.parent.mkdir(parents=True, exist_ok=True)
+        dump(bundle, MODEL_PATH)
+        print(f"✓ Trained on {len(data):,} samples, {len(bundle['feature_names'])} features")
+        print(f"✓ Saved model to: {MODEL_PATH}")
+        return
+
+    if not args.input_file:
+        parser.error('input_file is required unless --train is given')
+    if not MODEL_PATH.exists():
+        print(f"Error: model not found: {MODEL_PATH} (run with --train first)")
+        sys.exit(1)
+
+    bundle = load(MODEL_PATH)
+    data = read_peptides(args.input_file)
+    print(f"✓ Loaded {len(data):,} peptides")
+
+    if args.hla:
+        # One row per peptide x requested allele
+        data = data.drop(columns=['mhcAllele'], errors='ignore').merge(
+            pd.DataFrame({'mhcAllele': args.hla}), how='cross')
+
+    alleles = data['mhcAllele'].tolist() if 'mhcAllele' in data.columns else None
+
+    start = time.perf_counter()
+    data['prob_positive'] = score_peptides(bundle, data['peptide'].tolist(), alleles)
+    elapsed = time.perf_counter() - start
+    data['prediction'] = (data['prob_positive'] >= 0.5).astype(int)
+    print(f"✓ Scored {len(data):,} rows in {elapsed:.2f}s "
+          f"({len(data) / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    data.to_csv(args.output, index=False)
+    print(f"✓ Saved predictions to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
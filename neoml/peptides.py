@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Candidate Peptide Generation
+=======================================
+Generates every mutant 8-11-mer that spans a protein-level variant, together
+with the matched wild-type window and the mutation position inside the peptide.
+Only substitutions have a matched wild-type window; windows across an
+insertion, deletion or frameshift get an empty wt_peptide.
+
+Windows are cut with NumPy stride tricks over byte-encoded sequences, so all
+variants of a given peptide length are generated in one vectorised step.
+
+Inputs:
+- Protein FASTA (e.g. the reference proteome)
+- Variant CSV with columns: protein_id, position (1-based), ref, alt, type
+  - type: missense/SNV, insertion, deletion or frameshift/FSS
+  - for frameshifts, alt is the novel translated tail (stops at '*')
+
+Usage:
+    python peptides.py <proteins.fasta> <variants.csv> [--output candidates.csv]
+                       [--min-length 8] [--max-length 11]
+"""
+
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+MIN_LENGTH = 8
+MAX_LENGTH = 11
+
+# Variant type aliases, normalised to the TumorAgDB 'type' vocabulary
+VARIANT_TYPES = {
+    'missense': 'SNV',
+    'snv': 'SNV',
+    'insertion': 'INSERTION',
+    'inframe_insertion': 'INSERTION',
+    'deletion': 'DELETION',
+    'inframe_deletion': 'DELETION',
+    'frameshift': 'FSS',
+    'fss': 'FSS',
+}
+
+def read_fasta(path):
+    """
+    Read a protein FASTA file.
+
+    Records are keyed by the first token of the header. UniProt style headers
+    (sp|P04637|P53_HUMAN) are also reachable by their accession.
+
+    Args:
+        path: Path to FASTA file
+
+    Returns:
+        dict mapping protein id -> sequence
+    """
+    proteins = {}
+    name, chunks = None, []
+
+    def flush():
+        if name is not None:
+            sequence = ''.join(chunks).upper()
+            proteins[name] = sequence
+            parts = name.split('|')
+            if len(parts) >= 2:
+                proteins.setdefault(parts[1], sequence)
+
+    with open(path) as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('>'):
+                flush()
+                name, chunks = line[1:].split()[0], []
+            else:
+                chunks.append(line)
+    flush()
+    return proteins
+
+
+def encode_sequences(sequences, width):
+    """
+    Pack sequences into a zero-padded uint8 matrix.
+
+    Args:
+        sequences: List of ASCII sequences, none longer than width
+        width: Number of columns
+
+    Returns:
+        uint8 array of shape (len(sequences), width)
+    """
+    if not sequences:
+        return np.zeros((0, width), dtype=np.uint8)
+    buffer = ''.join(s.ljust(width, '\0') for s in sequences).encode('ascii')
+    return np.frombuffer(buffer, dtype=np.uint8).reshape(len(sequences), width)
+
+
+def decode_windows(windows):
+    """
+    Turn an (n, k) uint8 array into a list of k-length strings.
+
+    Args:
+        windows: uint8 array of encoded peptides
+
+    Returns:
+        numpy array of str
+    """
+    k = windows.shape[1]
+    return np.ascontiguousarray(windows).view(f'S{k}').ravel().astype(str)
+
+
+def _variant_segments(proteins, variants, flank):
+    """
+    Cut mutant and wild-type sequence segments around every variant.
+
+    Only the flanks that can contribute to a window of at most flank+1 residues
+    are kept, which bounds the width of the encoded matrices.
+
+    Returns:
+        DataFrame with one row per usable variant
+    """
+    rows = []
+    for idx, v in enumerate(variants.itertuples(index=False)):
+        protein = proteins.get(str(v.protein_id))
+        vtype = VARIANT_TYPES.get(str(v.type).lower())
+        if protein is None or vtype is None:
+            continue
+
+        p0 = int(v.position) - 1
+        ref = '' if pd.isna(v.ref) or v.ref == '-' else str(v.ref).upper()
+        alt = '' if pd.isna(v.alt) or v.alt == '-' else str(v.alt).upper()
+        alt = alt.split('*')[0]
+
+        if p0 < 0 or p0 + len(ref) > len(protein):
+            continue
+        if ref and protein[p0:p0 + len(ref)] != ref:
+            # Reference mismatch: variant called against another isoform
+            continue
+
+        left = protein[max(0, p0 - flank):p0]
+        if vtype == 'FSS':
+            right = ''
+        else:
+            right = protein[p0 + len(ref):p0 + len(ref) + flank]
+        if not alt and (not left or not right):
+            # Deletion at a protein terminus: no new junction, only wild type
+            continue
+        mutant = left + alt + right
+        # The wild type lines up with the mutant residue for residue only when
+        # the variant keeps the length; windows across an insertion, deletion
+        # or frameshift have no wild-type counterpart (empty segment -> '')
+        if vtype != 'FSS' and len(ref) == len(alt):
+            wild_type = left + ref + right
+        else:
+            wild_type = ''
+
+        mut_start = len(left)
+        mut_end = len(left) + len(alt)
+        junction = not alt
+        if junction:
+            # Deletion: the new junction (left[-1], right[0]) is the mutated
+            # site, and a window must span both residues
+            mut_start, mut_end = len(left) - 1, len(left) + 1
+
+        rows.append((idx, str(v.protein_id), vtype, mutant, wild_type, mut_start, mut_end,
+                     junction))
+
+    return pd.DataFrame(rows, columns=['variant_id', 'protein_id', 'type', 'mutant',
+                                       'wild_type', 'mut_start', 'mut_end', 'junction'])
+
+
+def generate_windows(proteins, variants, min_length=MIN_LENGTH, max_length=MAX_LENGTH):
+    """
+    Generate mutant and matched wild-type windows spanning each variant.
+
+    Args:
+        proteins: dict mapping protein id -> sequence (see read_fasta)
+        variants: DataFrame with protein_id, position, ref, alt, type
+        min_length: Shortest peptide length
+        max_length: Longest peptide length
+
+    Returns:
+        DataFrame with variant_id, protein_id, type, lengthOfPeptide, peptide,
+        wt_peptide and pepMutStart (1-based mutation position in the peptide)
+    """
+    segments = _variant_segments(proteins, variants, flank=max_length - 1)
+    columns = ['variant_id', 'protein_id', 'type', 'lengthOfPeptide',
+               'peptide', 'wt_peptide', 'pepMutStart']
+    if segments.empty:
+        return pd.DataFrame(columns=columns)
+
+    mutant_len = segments['mutant'].str.len().to_numpy()
+    wt_len = segments['wild_type'].str.len().to_numpy()
+    mut_start = segments['mut_start'].to_numpy()
+    mut_end = segments['mut_end'].to_numpy()
+    junction = segments['junction'].to_numpy(dtype=bool)[:, None]
+
+    width = int(max(mutant_len.max(), wt_len.max(), max_length))
+    mutant = encode_sequences(segments['mutant'].tolist(), width)
+    wild_type = encode_sequences(segments['wild_type'].tolist(), width)
+
+    frames = []
+    for k in range(min_length, max_length + 1):
+        # (n_variants, n_starts, k) strided views, no copy
+        mut_windows = sliding_window_view(mutant, k, axis=1)
+        wt_windows = sliding_window_view(wild_type, k, axis=1)
+        starts = np.arange(mut_windows.shape[1])[None, :]
+
+        # Substitutions and insertions: overlap the mutated residues;
+        # deletions: contain the whole junction
+        overlaps = (starts < mut_end[:, None]) & (starts + k > mut_start[:, None])
+        contains = (starts <= mut_start[:, None]) & (starts + k >= mut_end[:, None])
+        valid = ((starts + k <= mutant_len[:, None])
+                 & np.where(junction, contains, overlaps))
+        var_idx, start = np.nonzero(valid)
+        if not len(var_idx):
+            continue
+
+        peptides = decode_windows(mut_windows[var_idx, start])
+        wt_peptides = decode_windows(wt_windows[var_idx, start])
+        # Windows running past the end of the wild-type segment have no match
+        wt_peptides[start + k > wt_len[var_idx]] = ''
+
+        frames.append(pd.DataFrame({
+            'variant_id': segments['variant_id'].to_numpy()[var_idx],
+            'protein_id': segments['protein_id'].to_numpy()[var_idx],
+            'type': segments['type'].to_numpy()[var_idx],
+            'lengthOfPeptide': k,
+            'peptide': peptides,
+            'wt_peptide': wt_peptides,
+            'pepMutStart': np.maximum(mut_start[var_idx] - start, 0) + 1,
+        }))
+
+    if not frames:
+        return pd.DataFrame(columns=columns)
+
+    windows = pd.concat(frames, ignore_index=True)
+    # A window identical to wild type carries no neoepitope
+    windows = windows[windows['peptide'] != windows['wt_peptide']]
+    return windows.sort_values(['variant_id', 'lengthOfPeptide'], kind='stable').reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate mutant/wild-type peptide windows from protein variants'
+    )
+    parser.add_argument('fasta', help='Protein FASTA file')
+    parser.add_argument('variants', help='CSV with protein_id, position, ref, alt, type')
+    parser.add_argument('--output', default='candidates.csv',
+                        help='Output CSV file (default: candidates.csv)')
+    parser.add_argument('--min-length', type=int, default=MIN_LENGTH,
+                        help=f'Shortest peptide length (default: {MIN_LENGTH})')
+    parser.add_argument('--max-length', type=int, default=MAX_LENGTH,
+                        help=f'Longest peptide length (default: {MAX_LENGTH})')
+
+    args = parser.parse_args()
+
+    try:
+        proteins = read_fasta(args.fasta)
+        variants = pd.read_csv(args.variants)
+    except Exception as e:
+        print(f"Error loading inputs: {e}")
+        sys.exit(1)
+    print(f"✓ Loaded {len(proteins):,} proteins and {len(variants):,} variants")
+
+    windows = generate_windows(proteins, variants, args.min_length, args.max_length)
+    print(f"✓ Generated {len(windows):,} peptides from "
+          f"{windows['variant_id'].nunique():,} variants")
+
+    windows.to_csv(args.output, index=False)
+    print(f"✓ Saved candidates to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
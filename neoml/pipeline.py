@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Pipeline Runner
+==========================
+Runs the scrape -> train -> predict chain as a small DAG of stages with
+content-hash caching.
+
+Each stage declares its command, input files (its data plus the script and
+every local module it imports) and output files. A stage's fingerprint is the
+sha256 of its command and the content hashes of its inputs; it is skipped
+when the fingerprint matches the last successful run and its outputs still
+have the recorded hashes. Stages depend on the stages producing their inputs, so a change to
+one input reruns only what lies downstream of it, and stages whose
+dependencies are done run in parallel (--jobs).
+
+Stages (scripts run in this directory; relative data paths are taken from
+the current directory, like the other scripts):
+    scrape   ../tumordb/scrape.py -> ../tumordb/tumoragdb_data.csv
+             (remote source: runs only when the CSV is missing or with --force scrape)
+    train    train_models.py -> output/registry/CURRENT
+    binding  binding.py --build -> output/Binding/pssm.joblib
+    peptide  peptide_score.py --train -> output/PeptideOnly/model.joblib
+    predict  predict.py <--predict-input> -> <--predict-output> (after train)
+
+File hashes are cached by size and modification time in
+output/pipeline_state.json; stage logs go to logs/pipeline/<stage>.log.
+
+Usage:
+    python pipeline.py [STAGE ...] [--predict-input data.csv] [--jobs 3]
+                       [--force STAGE ...] [--dry-run]
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+
+from binding import MODEL_PATH as BINDING_MODEL_PATH
+from peptide_score import MODEL_PATH as PEPTIDE_MODEL_PATH
+from registry import REGISTRY_DIR
+from schema import DEFAULT_DATA_PATH
+
+
+BASE_DIR = Path(__file__).parent
+STATE_PATH = BASE_DIR / 'output' / 'pipeline_state.json'
+LOG_DIR = BASE_DIR / 'logs' / 'pipeline'
+
+JOBS = 3
+
+
+class Stage:
+    """One pipeline step: a command with declared input and output files"""
+
+    def __init__(self, name, command, inputs, outputs, external=False):
+        self.name = name
+        self.command = [str(part) for part in command]
+        self.inputs = [Path(path).resolve() for path in inputs]
+        self.outputs = [Path(path).resolve() for path in outputs]
+        # External stages fetch remote data their inputs cannot describe; they
+        # run only when an output is missing or when forced
+        self.external = external
+
+    def __repr__(self):
+        return f"Stage({self.name!r})"
+
+
+def local_modules(script):
+    """
+    A script and every module of its directory it imports, transitively.
+
+    Imports inside functions count too, so lazily imported modules are part
+    of the fingerprint (erring towards reruns over stale outputs).
+    """
+    script = Path(script).resolve()
+    found, pending = set(), [script]
+    while pending:
+        path = pending.pop()
+        if path in found or not path.exists():
+            continue
+        found.add(path)
+        for node in ast.walk(ast.parse(path.read_text(), str(path))):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            pending.extend(path.parent / f"{name.split('.')[0]}.py" for name in names)
+    return sorted(found)
+
+
+def default_stages(data_path=DEFAULT_DATA_PATH, predict_input=None,
+                   predict_output='predictions.csv', model='lightgbm'):
+    """
+    The standard stage list.
+
+    Args:
+        data_path: TumorAgDB table written by scrape and read by training
+        predict_input: Table to score (None leaves out the predict stage)
+        predict_output: Predictions file
+        model: Model used by the predict stage
+
+    Returns:
+        list of Stage
+    """
+    python = sys.executable
+    data_path = Path(data_path).resolve()
+    # train_models.py and predict.py both use the default registry
+    current = REGISTRY_DIR / 'CURRENT'
+    scraper = BASE_DIR.parent / 'tumordb' / 'scrape.py'
+    stages = [
+        Stage('scrape', [python, scraper, '--output', data_path],
+              [scraper], [data_path], external=True),
+        Stage('train', [python, 'train_models.py', '--data', data_path],
+              [*local_modules(BASE_DIR / 'train_models.py'), data_path], [current]),
+        Stage('binding', [python, 'binding.py', '--build', '--data', data_path],
+              [*local_modules(BASE_DIR / 'binding.py'), data_path], [BINDING_MODEL_PATH]),
+        Stage('peptide', [python, 'peptide_score.py', '--train', '--data', data_path],
+              [*local_modules(BASE_DIR / 'peptide_score.py'), data_path], [PEPTIDE_MODEL_PATH]),
+    ]
+    if predict_input:
+        predict_input, predict_output = Path(predict_input).resolve(), Path(predict_output).resolve()
+        stages.append(Stage(
+            'predict',
+            [python, 'predict.py', predict_input, '--model', model, '--output', predict_output],
+            [*local_modules(BASE_DIR / 'predict.py'), predict_input, current],
+            [predict_output]))
+    return stages
+
+
+def dependencies(stages):
+    """Map each stage name to the names of the stages producing its inputs."""
+    producers = {path: stage.name for stage in stages for path in stage.outputs}
+    return {stage.name: sorted({producers[path] for path in stage.inputs
+                                if path in producers} - {stage.name})
+            for stage in stages}
+
+
+def upstream(names, deps):
+    """The given stages plus everything they depend on."""
+    selected, pending = set(), list(names)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(deps[name])
+    return selected
+
+
+class FileHashes:
+    """sha256 of files and directories, cached by size and mtime"""
+
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else {}
+
+    def __call__(self, path):
+        path = Path(path)
+        if path.is_dir():
+            digest = hashlib.sha256()
+            for child in sorted(p for p in path.rglob('*') if p.is_file()):
+                digest.update(f"{child.relative_to(path).as_posix()}\0{self(child)}\n".encode())
+            return digest.hexdigest()
+        if not path.exists():
+            return None
+
+        stat = path.stat()
+        key = str(path)
+        cached = self.cache.get(key)
+        if cached and cached['bytes'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached['sha256']
+        digest = hashlib.sha256()
+        with open(path, 'rb') as handle:
+            for block in iter(lambda: handle.read(1 << 20), b''):
+                digest.update(block)
+        self.cache[key] = {'bytes': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                           'sha256': digest.hexdigest()}
+        return digest.hexdigest()
+
+
+def fingerprint(stage, file_hash):
+    """
+    Content fingerprint of a stage: its command and the hashes of its inputs.
+
+    Raises:
+        FileNotFoundError: if an input does not exist
+    """
+    digest = hashlib.sha256('\0'.join(stage.command).encode())
+    for path in sorted(stage.inputs):
+        value = file_hash(path)
+        if value is None:
+            raise FileNotFoundError(f"{stage.name}: missing input {path}")
+        digest.update(f"\n{path}\0{value}".encode())
+    return digest.hexdigest()
+
+
+def is_current(stage, record, file_hash, key):
+    """True if the last successful run had this fingerprint and its outputs are intact."""
+    if stage.external:
+        return all(path.exists() for path in stage.outputs)
+    if not record or record.get('fingerprint') != key:
+        return False
+    return all(file_hash(path) == record['outputs'].get(str(path)) for path in stage.outputs)
+
+
+def load_state(path=STATE_PATH):
+    if Path(path).exists():
+        with open(path) as handle:
+            return json.load(handle)
+    return {'stages': {}, 'files': {}}
+
+
+def save_state(state, path=STATE_PATH):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}")
+    with open(tmp, 'w') as handle:
+        json.dump(state, handle, indent=2)
+    os.replace(tmp, path)
+
+
+def run_command(stage, log_dir=LOG_DIR):
+    """Run a stage's command from BASE_DIR, logging its output; returns (code, seconds)."""
+    log_dir = Path(log_dir)
+    log_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    with open(log_dir / f"{stage.name}.log", 'w') as log:
+        code = subprocess.run(stage.command, cwd=BASE_DIR, stdout=log,
+                              stderr=subprocess.STDOUT).returncode
+    return code, time.perf_counter() - start
+
+
+def run_pipeline(stages, targets=None, force=(), jobs=JOBS, dry_run=False,
+                 state_path=STATE_PATH, log_dir=LOG_DIR):
+    """
+    Run the stages needed for targets, skipping up-to-date ones.
+
+    A stage is checked only once its dependencies have finished, so it sees
+    the outputs they just wrote. Stages downstream of a failure are skipped.
+
+    Args:
+        stages: List of Stage
+        targets: Stage names to bring up to date (default: all)
+        force: Stage names to run even if up to date
+        jobs: Maximum stages running at once
+        dry_run: Report what would run without running it (stages after one
+            that would run are reported as pending)
+
+    Returns:
+        dict stage name -> 'cached' | 'ran' | 'failed' | 'skipped' | 'pending'
+    """
+    deps = dependencies(stages)
+    by_name = {stage.name: stage for stage in stages}
+    unknown = (set(targets or ()) | set(force)) - set(by_name)
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+    selected = upstream(targets or by_name, deps)
+
+    state = load_state(state_path)
+    file_hash = FileHashes(state['files'])
+    status, running = {}, {}
+
+    def running_names():
+        return {name for name, _ in running.values()}
+
+    def ready():
+        return [name for name in by_name if name in selected and name not in status
+                and name not in running_names() and all(d in status for d in deps[name])]
+
+    def schedule(name, pool):
+        """Decide whether a ready stage is cached, skipped or run."""
+        stage = by_name[name]
+        upstream_status = {status[d] for d in deps[name]}
+        if upstream_status & {'failed', 'skipped'}:
+            status[name] = 'skipped'
+            print(f"  - {name}: skipped (upstream failed)")
+            return
+        if dry_run and upstream_status & {'pending'}:
+            status[name] = 'pending'
+            print(f"  · {name}: pending (upstream would run)")
+            return
+        try:
+            key = fingerprint(stage, file_hash)
+        except FileNotFoundError as e:
+            if not stage.external:
+                status[name] = 'failed'
+                print(f"  ✗ {e}")
+                return
+            key = None
+        record = state['stages'].get(name)
+        if name not in force and is_current(stage, record, file_hash, key):
+            status[name] = 'cached'
+            print(f"  ✓ {name}: up to date")
+            return
+        if dry_run:
+            status[name] = 'pending'
+            print(f"  · {name}: would run ({' '.join(stage.command[1:])})")
+            return
+        print(f"  ▶ {name}: running ({' '.join(stage.command[1:])})", flush=True)
+        # Record the fingerprint the command starts from: if an input changes
+        # while it runs, the next run sees a different one and reruns the stage
+        running[pool.submit(run_command, stage, log_dir)] = (name, key)
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        while True:
+            batch = ready()
+            while batch:
+                for name in batch:
+                    schedule(name, pool)
+                batch = ready()
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, key = running.pop(future)
+                stage = by_name[name]
+                code, seconds = future.result()
+                missing = [str(path) for path in stage.outputs if not path.exists()]
+                if code != 0 or missing:
+                    status[name] = 'failed'
+                    reason = f"exit code {code}" if code else f"missing {', '.join(missing)}"
+                    print(f"  ✗ {name}: failed after {seconds:.1f}s ({reason}, "
+                          f"see {Path(log_dir) / (name + '.log')})")
+                    continue
+                status[name] = 'ran'
+                state['stages'][name] = {
+                    'fingerprint': key,
+                    'outputs': {str(path): file_hash(path) for path in stage.outputs},
+                    'finished': datetime.now(timezone.utc).isoformat(),
+                    'seconds': round(seconds, 3),
+                }
+                save_state(state, state_path)
+                print(f"  ✓ {name}: done in {seconds:.1f}s")
+
+    if not dry_run:
+        save_state(state, state_path)
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the scrape -> train -> predict pipeline, skipping up-to-date stages'
+    )
+    parser.add_argument('stages', nargs='*',
+                        help='Stages to bring up to date, with their upstream stages '
+                             '(default: all)')
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH,
+                        help=f'TumorAgDB table (default: {DEFAULT_DATA_PATH})')
+    parser.add_argument('--predict-input',
+                        help='Table to score; adds the predict stage')
+    parser.add_argument('--predict-output', default='predictions.csv',
+                        help='Predictions file (default: predictions.csv)')
+    parser.add_argument('--model', choices=['lightgbm', 'xgboost', 'randomforest'],
+                        default='lightgbm', help='Model for the predict stage (default: lightgbm)')
+    parser.add_argument('--jobs', type=int, default=JOBS,
+                        help=f'Stages run in parallel (default: {JOBS})')
+    parser.add_argument('--force', nargs='+', default=[], metavar='STAGE',
+                        help='Run these stages even if up to date (e.g. --force scrape)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Show which stages would run')
+    args = parser.parse_args()
+
+    stages = default_stages(args.data, args.predict_input, args.predict_output, args.model)
+    deps = dependencies(stages)
+
+    print("=" * 70)
+    print("NEOTIMMUML - PIPELINE")
+    print("=" * 70)
+    for stage in stages:
+        after = f" (after {', '.join(deps[stage.name])})" if deps[stage.name] else ""
+        print(f"  {stage.name}{after}")
+    print()
+
+    start = time.perf_counter()
+    try:
+        status = run_pipeline(stages, args.stages or None, args.force, args.jobs, args.dry_run)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    counts = {value: list(status.values()).count(value) for value in sorted(set(status.values()))}
+    mark = '✗' if 'failed' in counts else '✓'
+    print(f"\n{mark} Pipeline finished in {time.perf_counter() - start:.1f}s: "
+          + ", ".join(f"{n} {value}" for value, n in counts.items()))
+    if 'failed' in counts:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,30 +8,67 @@ Requirements:
 - output/encoder.joblib (feature encoder)
 - output/LightGBM/model.joblib (or XGBoost/RandomForest)
 - Input data with same 46 features as training data
+- output/<Model>/calibration.joblib (optional, written by train_models.py)
+- output/feature_selection.joblib (written by train_models.py --select; when
+  present only the kept columns are encoded)
+
+Artifacts are read from the promoted registry version
+(output/registry/versions/<version>/, see registry.py) when one exists,
+otherwise from output/ directly.
+
+When a calibration bundle exists, prob_positive is the calibrated score
+(prob_raw keeps the model output) and operating points are looked up in the
+precomputed precision/recall table.
+
+With --top-k N the input is read and scored in chunks and only the N
+best-scoring rows (per --group-by value, e.g. patient or HLA allele) are kept
+in a bounded heap and written, together with the usual summary statistics,
+so memory and output size do not grow with the input.
 
 Usage:
     python predict.py <input_csv> [--model lightgbm|xgboost|randomforest]
+                      [--threshold T | --target-precision P | --target-recall R]
+                      [--uncalibrated] [--version VERSION]
+                      [--top-k N [--group-by COLUMN] [--chunk-size ROWS]]
+                      [--metrics metrics.jsonl] [--profile cprofile|pyspy]
 """
 
 import pandas as pd
 import numpy as np
 from joblib import load
 import argparse
+import heapq
+import io
 import sys
+from contextlib import redirect_stdout
 from pathlib import Path
 
+from calibration import choose_threshold
+from encoding import (check_drift, encode_features, merge_drift, print_drift_summary,
+                      save_drift_report)
+from instrumentation import Instrumentation, PROFILERS
+from registry import MODEL_DIRS, artifact_dir
+
+
+# Rows scored per chunk with --top-k
+CHUNK_SIZE = 100_000
+
+HIGH_CONFIDENCE = 0.9
 
-def load_model_and_encoder(model_type='lightgbm'):
+
+def load_model_and_encoder(model_type='lightgbm', base_path=None):
     """
     Load the feature encoder and trained model.
 
     Args:
         model_type: One of 'lightgbm', 'xgboost', or 'randomforest'
+        base_path: Artifact directory (default: the promoted registry
+            version, or output/ when nothing has been promoted)
 
     Returns:
         encoder, model
     """
-    base_path = Path(__file__).parent / 'output'
+    base_path = Path(base_path) if base_path else artifact_dir()
 
     # Load encoder (required for all models)
     encoder_path = base_path / 'encoder.joblib'
@@ -42,16 +79,10 @@ def load_model_and_encoder(model_type='lightgbm'):
     print(f"✓ Loaded encoder from {encoder_path}")
 
     # Load model
-    model_map = {
-        'lightgbm': 'LightGBM',
-        'xgboost': 'XGBoost',
-        'randomforest': 'RandomForest'
-    }
-
-    if model_type not in model_map:
+    if model_type not in MODEL_DIRS:
         raise ValueError(f"Invalid model type: {model_type}")
 
-    model_path = base_path / model_map[model_type] / 'model.joblib'
+    model_path = base_path / MODEL_DIRS[model_type] / 'model.joblib'
     if not model_path.exists():
         raise FileNotFoundError(f"Model not found: {model_path}")
 
@@ -61,7 +92,47 @@ def load_model_and_encoder(model_type='lightgbm'):
     return encoder, model
 
 
-def predict_immunogenicity(data, encoder, model):
+def load_feature_selection(base_path=None):
+    """
+    Load the kept column indices written by train_models.py --select.
+
+    Args:
+        base_path: Artifact directory (see load_model_and_encoder)
+
+    Returns:
+        sorted int array, or None if the models use the full feature space
+    """
+    path = (Path(base_path) if base_path else artifact_dir()) / 'feature_selection.joblib'
+    if not path.exists():
+        return None
+    selection = load(path)
+    print(f"✓ Loaded feature selection ({selection['method']}): "
+          f"{len(selection['keep']):,} of {selection['n_features']:,} columns")
+    return selection['keep']
+
+
+def load_calibration(model_type='lightgbm', base_path=None):
+    """
+    Load the calibration bundle written by train_models.py.
+
+    Args:
+        model_type: One of 'lightgbm', 'xgboost', or 'randomforest'
+        base_path: Artifact directory (see load_model_and_encoder)
+
+    Returns:
+        calibration dict, or None if the model has no calibration bundle
+    """
+    base_path = Path(base_path) if base_path else artifact_dir()
+    path = base_path / MODEL_DIRS[model_type] / 'calibration.joblib'
+    if not path.exists():
+        return None
+    calibration = load(path)
+    print(f"✓ Loaded {calibration['method']} calibration from {path}")
+    return calibration
+
+
+def predict_immunogenicity(data, encoder, model, instrumentation=None, max_unknown_rate=None,
+                           threshold=0.5, calibration=None, keep=None):
     """
     Predict immunogenicity for neoantigen samples.
 
@@ -69,35 +140,218 @@ def predict_immunogenicity(data, encoder, model):
         data: DataFrame with neoantigen features (same columns as training)
         encoder: Fitted OneHotEncoder
         model: Trained classification model
+        instrumentation: Optional Instrumentation for stage metrics
+        max_unknown_rate: Reject the batch if more than this fraction of
+            feature values were unseen in training (None disables)
+        threshold: Decision threshold applied to prob_positive
+        calibration: Optional calibration bundle; prob_positive is then the
+            calibrated score and prob_raw the model output
+        keep: Kept column indices from feature selection (see
+            load_feature_selection); required if the model was trained on them
 
     Returns:
-        DataFrame with predictions and probabilities
+        DataFrame with predictions and probabilities; the drift report is
+        attached as results.attrs['drift']
+
+    Raises:
+        ValueError: if the batch exceeds max_unknown_rate
     """
+    instr = instrumentation or Instrumentation()
+
     # Encode features to sparse matrix (262k features)
     print(f"\nEncoding {len(data):,} samples...")
-    X_encoded = encoder.transform(data.astype(str))
+    with instr.stage('encode', rows=len(data)) as record:
+        # Drift statistics are collected in the same pass as the encoding
+        X_encoded, drift = encode_features(data, encoder, keep)
+        record.update(nnz=int(X_encoded.nnz), n_features=int(X_encoded.shape[1]),
+                      unknown_rate=drift['unknown_rate'])
     print(f"✓ Encoded to {X_encoded.shape[1]:,} features (sparse format)")
     print(f"  Memory efficiency: {X_encoded.nnz / (X_encoded.shape[0] * X_encoded.shape[1]) * 100:.2f}% non-zero")
+    print_drift_summary(drift)
+    check_drift(drift, max_unknown_rate)
 
     # Make predictions
     print("\nMaking predictions...")
-    predictions = model.predict(X_encoded)
-    probabilities = model.predict_proba(X_encoded)
+    with instr.stage('predict', rows=len(data)):
+        raw = model.predict_proba(X_encoded)[:, 1]
+        positive = calibration['calibrator'].predict(raw) if calibration else raw
 
     # Create results DataFrame
     results = pd.DataFrame({
-        'prediction': predictions,
-        'prob_negative': probabilities[:, 0],
-        'prob_positive': probabilities[:, 1],
-        'confidence': np.max(probabilities, axis=1)
+        'prediction': (positive >= threshold).astype(int),
+        'prob_negative': 1 - positive,
+        'prob_positive': positive,
+        'confidence': np.maximum(positive, 1 - positive)
     })
+    if calibration:
+        results['prob_raw'] = raw
 
     # Add original data
     results = pd.concat([data.reset_index(drop=True), results], axis=1)
+    results.attrs['drift'] = drift
 
     return results
 
 
+def summary_stats(results):
+    """Additive summary counts of a scored batch (see print_summary)."""
+    positive = results['prediction'] == 1
+    high = results['confidence'] >= HIGH_CONFIDENCE
+    return {
+        'rows': len(results),
+        'positive': int(positive.sum()),
+        'confidence_sum': float(results['confidence'].sum()),
+        'confidence_min': float(results['confidence'].min()),
+        'confidence_max': float(results['confidence'].max()),
+        'high_positive': int((positive & high).sum()),
+        'high_negative': int((~positive & high).sum()),
+    }
+
+
+def merge_stats(total, stats):
+    """Combine two summary_stats dicts (total may be None)."""
+    if total is None:
+        return dict(stats)
+    merged = {key: total[key] + stats[key] for key in
+              ('rows', 'positive', 'confidence_sum', 'high_positive', 'high_negative')}
+    merged['confidence_min'] = min(total['confidence_min'], stats['confidence_min'])
+    merged['confidence_max'] = max(total['confidence_max'], stats['confidence_max'])
+    return merged
+
+
+def print_summary(stats):
+    """Print the prediction summary."""
+    n = max(stats['rows'], 1)
+    negative = stats['rows'] - stats['positive']
+    print(f"\nTotal samples:      {stats['rows']:,}")
+    print(f"Predicted positive: {stats['positive']:,} ({stats['positive']/n*100:.1f}%)")
+    print(f"Predicted negative: {negative:,} ({negative/n*100:.1f}%)")
+    print(f"\nAverage confidence: {stats['confidence_sum'] / n:.3f}")
+    print(f"Min confidence:     {stats['confidence_min']:.3f}")
+    print(f"Max confidence:     {stats['confidence_max']:.3f}")
+
+    print(f"\nHigh confidence (≥{HIGH_CONFIDENCE}):")
+    print(f"  Positive: {stats['high_positive']:,} ({stats['high_positive']/n*100:.1f}%)")
+    print(f"  Negative: {stats['high_negative']:,} ({stats['high_negative']/n*100:.1f}%)")
+
+
+class TopK:
+    """
+    Bounded per-group top-k of scored rows.
+
+    Each group has a min-heap of at most k (score, -row) keys, so ties go to
+    the earlier row. A chunk is first cut against every group's current k-th
+    score in one vectorised comparison and trimmed to k rows per group, so
+    once the heaps are full almost no row reaches Python. Only rows still in
+    a heap are retained.
+    """
+
+    def __init__(self, k, group_by=None, score_column='prob_positive'):
+        self.k = k
+        self.group_by = group_by
+        self.score_column = score_column
+        self.heaps = {}
+        self.rows = None
+        self.seen = 0
+
+    def _keys(self, chunk):
+        if self.group_by is None:
+            return np.zeros(len(chunk), dtype=object)
+        keys = chunk[self.group_by].astype(object)
+        return keys.where(keys.notna(), '<missing>').to_numpy()
+
+    def update(self, chunk):
+        """Offer a scored chunk (rows are numbered in arrival order)."""
+        row = np.arange(self.seen, self.seen + len(chunk))
+        self.seen += len(chunk)
+        scores = chunk[self.score_column].to_numpy(dtype=np.float64)
+        keys = self._keys(chunk)
+
+        # Rows later in the input lose ties, so only a strictly higher score
+        # than a full heap's minimum can enter it
+        codes, uniques = pd.factorize(keys)
+        floor = np.array([self.heaps[g][0][0] if len(self.heaps.get(g, ())) >= self.k
+                          else -np.inf for g in uniques])
+        candidates = np.flatnonzero(scores > floor[codes])
+        if not len(candidates):
+            return
+        order = np.lexsort((row[candidates], -scores[candidates], codes[candidates]))
+        candidates = candidates[order]
+        first = np.r_[0, np.flatnonzero(np.diff(codes[candidates])) + 1]
+        rank = np.arange(len(candidates)) - np.repeat(first, np.diff(np.r_[first, len(candidates)]))
+        candidates = candidates[rank < self.k]
+
+        entered = []
+        for i in candidates:
+            heap = self.heaps.setdefault(keys[i], [])
+            item = (scores[i], -row[i])
+            if len(heap) < self.k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+            else:
+                continue
+            entered.append(i)
+
+        kept = chunk.iloc[entered].assign(row=row[entered])
+        self.rows = kept if self.rows is None else pd.concat([self.rows, kept])
+        alive = {-negative_row for heap in self.heaps.values() for _, negative_row in heap}
+        self.rows = self.rows[self.rows['row'].isin(alive)]
+
+    def result(self):
+        """Shortlist sorted by group and rank, with 'row' and 'rank' columns."""
+        if self.rows is None:
+            return pd.DataFrame()
+        columns = [self.group_by] if self.group_by else []
+        shortlist = self.rows.sort_values([self.score_column, 'row'], ascending=[False, True])
+        if columns:
+            shortlist = shortlist.sort_values(columns, kind='stable')
+            shortlist['rank'] = shortlist.groupby(columns, dropna=False).cumcount() + 1
+        else:
+            shortlist['rank'] = np.arange(1, len(shortlist) + 1)
+        return shortlist.reset_index(drop=True)
+
+
+def predict_top_k(input_file, encoder, model, k, group_by=None, chunk_size=CHUNK_SIZE,
+                  max_unknown_rate=None, threshold=0.5, calibration=None, keep=None):
+    """
+    Score a CSV in chunks, keeping only the k best rows per group.
+
+    Args:
+        input_file: CSV path
+        k: Rows kept per group
+        group_by: Optional grouping column (e.g. patient_id or mhcAllele)
+        chunk_size: Rows read and scored at a time
+        Other arguments as for predict_immunogenicity.
+
+    Returns:
+        (shortlist DataFrame, summary_stats dict over all rows, merged drift report)
+
+    Raises:
+        ValueError: if a chunk exceeds max_unknown_rate
+    """
+    top = TopK(k, group_by)
+    stats, drift = None, None
+    # Group labels are read as text so chunks with and without gaps agree
+    dtype = {group_by: str} if group_by else None
+    for chunk in pd.read_csv(input_file, chunksize=chunk_size, dtype=dtype):
+        if group_by is not None and group_by not in chunk.columns:
+            raise ValueError(f"Group column '{group_by}' not found")
+        with redirect_stdout(io.StringIO()):
+            results = predict_immunogenicity(chunk, encoder, model,
+                                             max_unknown_rate=max_unknown_rate,
+                                             threshold=threshold, calibration=calibration,
+                                             keep=keep)
+        top.update(results)
+        stats = merge_stats(stats, summary_stats(results))
+        drift = merge_drift(drift, results.attrs['drift'])
+        print(f"  {top.seen:,} rows scored", end='\r', flush=True)
+    print()
+    if stats is None:
+        raise ValueError("Input has no rows")
+    return top.result(), stats, drift
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Predict neoantigen immunogenicity using trained models'
@@ -122,63 +376,141 @@ def main():
         default=0.5,
         help='Probability threshold for positive class (default: 0.5)'
     )
+    parser.add_argument(
+        '--target-precision',
+        type=float,
+        help='Use the lowest calibrated threshold reaching this out-of-fold precision'
+    )
+    parser.add_argument(
+        '--target-recall',
+        type=float,
+        help='Use the highest calibrated threshold keeping this out-of-fold recall'
+    )
+    parser.add_argument(
+        '--version',
+        help='Registry version to use (default: the promoted version)'
+    )
+    parser.add_argument(
+        '--uncalibrated',
+        action='store_true',
+        help='Ignore the calibration bundle and use raw model probabilities'
+    )
+    parser.add_argument(
+        '--max-unknown-rate',
+        type=float,
+        help='Reject the batch if more than this fraction of feature values are unseen'
+    )
+    parser.add_argument(
+        '--drift-report',
+        help='Write the input drift report (JSON) to this file'
+    )
+    parser.add_argument(
+        '--top-k',
+        type=int,
+        help='Score in chunks and write only the N highest prob_positive rows'
+    )
+    parser.add_argument(
+        '--group-by',
+        help='With --top-k, keep N rows per value of this column (e.g. patient_id, mhcAllele)'
+    )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=CHUNK_SIZE,
+        help=f'Rows scored per chunk with --top-k (default: {CHUNK_SIZE:,})'
+    )
+    parser.add_argument(
+        '--metrics',
+        help='Append per-stage timing metrics (JSON lines) to this file'
+    )
+    parser.add_argument(
+        '--profile',
+        choices=PROFILERS,
+        help='Profile each stage with cProfile, or print the PID for py-spy'
+    )
 
     args = parser.parse_args()
+    instr = Instrumentation(args.metrics, run='predict', profiler=args.profile)
+
+    if args.group_by and not args.top_k:
+        parser.error('--group-by needs --top-k')
+    if args.top_k is not None and args.top_k < 1:
+        parser.error('--top-k must be positive')
 
     # Load data
     print(f"\n{'='*60}")
     print(f"NeoTImmuML Inference")
     print(f"{'='*60}")
-    print(f"\nLoading data from: {args.input_file}")
 
-    try:
-        data = pd.read_csv(args.input_file)
-    except Exception as e:
-        print(f"Error loading data: {e}")
-        sys.exit(1)
+    if not args.top_k:
+        print(f"\nLoading data from: {args.input_file}")
+        try:
+            with instr.stage('load_data') as record:
+                data = pd.read_csv(args.input_file)
+                record['rows'] = len(data)
+        except Exception as e:
+            print(f"Error loading data: {e}")
+            sys.exit(1)
 
-    print(f"✓ Loaded {len(data):,} samples with {len(data.columns)} columns")
+        print(f"✓ Loaded {len(data):,} samples with {len(data.columns)} columns")
 
     # Load model and encoder
     try:
-        encoder, model = load_model_and_encoder(args.model)
+        with instr.stage('load_model', model=args.model):
+            # Resolve the promoted version once so all artifacts match
+            base_path = artifact_dir(args.version)
+            encoder, model = load_model_and_encoder(args.model, base_path)
+            calibration = None if args.uncalibrated else load_calibration(args.model, base_path)
+            keep = load_feature_selection(base_path)
     except Exception as e:
         print(f"Error loading model: {e}")
         sys.exit(1)
 
+    # Operating point: looked up in the precomputed table, never refitted
+    threshold = args.threshold
+    if args.target_precision is not None or args.target_recall is not None:
+        if calibration is None:
+            print("Error: --target-precision/--target-recall need a calibration bundle "
+                  "(retrain with train_models.py)")
+            sys.exit(1)
+        try:
+            threshold = choose_threshold(calibration['table'], args.target_precision,
+                                         args.target_recall)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    print(f"✓ Decision threshold: {threshold:.3f}"
+          f" ({'calibrated' if calibration else 'raw'} probabilities)")
+
+    if args.top_k:
+        run_top_k(args, instr, encoder, model, threshold, calibration, keep)
+        return
+
     # Make predictions
     try:
-        results = predict_immunogenicity(data, encoder, model)
+        results = predict_immunogenicity(data, encoder, model, instr,
+                                         max_unknown_rate=args.max_unknown_rate,
+                                         threshold=threshold, calibration=calibration,
+                                         keep=keep)
     except Exception as e:
         print(f"Error during prediction: {e}")
         sys.exit(1)
 
+    if args.drift_report:
+        save_drift_report(results.attrs['drift'], args.drift_report)
+        print(f"✓ Saved drift report to: {args.drift_report}")
+
     # Summary statistics
     print(f"\n{'='*60}")
     print("Prediction Summary")
     print(f"{'='*60}")
 
-    num_positive = (results['prediction'] == 1).sum()
-    num_negative = (results['prediction'] == 0).sum()
-
-    print(f"\nTotal samples:      {len(results):,}")
-    print(f"Predicted positive: {num_positive:,} ({num_positive/len(results)*100:.1f}%)")
-    print(f"Predicted negative: {num_negative:,} ({num_negative/len(results)*100:.1f}%)")
-    print(f"\nAverage confidence: {results['confidence'].mean():.3f}")
-    print(f"Min confidence:     {results['confidence'].min():.3f}")
-    print(f"Max confidence:     {results['confidence'].max():.3f}")
-
-    # High confidence predictions
-    high_conf_positive = ((results['prediction'] == 1) & (results['confidence'] >= 0.9)).sum()
-    high_conf_negative = ((results['prediction'] == 0) & (results['confidence'] >= 0.9)).sum()
-
-    print(f"\nHigh confidence (≥0.9):")
-    print(f"  Positive: {high_conf_positive:,} ({high_conf_positive/len(results)*100:.1f}%)")
-    print(f"  Negative: {high_conf_negative:,} ({high_conf_negative/len(results)*100:.1f}%)")
+    print_summary(summary_stats(results))
 
     # Save results
     output_file = args.output or 'predictions.csv'
-    results.to_csv(output_file, index=False)
+    with instr.stage('save', rows=len(results)):
+        results.to_csv(output_file, index=False)
     print(f"\n✓ Saved predictions to: {output_file}")
 
     # Display sample predictions
@@ -193,10 +525,50 @@ def main():
     else:
         print(results.head(10).to_string(index=True))
 
+    instr.summary()
+
     print(f"\n{'='*60}")
     print("Done!")
     print(f"{'='*60}\n")
 
 
+def run_top_k(args, instr, encoder, model, threshold, calibration, keep):
+    """--top-k path of main(): chunked scoring, shortlist and summary only."""
+    scope = f" per {args.group_by}" if args.group_by else ""
+    print(f"\nScoring {args.input_file} in chunks of {args.chunk_size:,} rows, "
+          f"keeping the top {args.top_k:,}{scope}...")
+    try:
+        with instr.stage('score_top_k') as record:
+            shortlist, stats, drift = predict_top_k(
+                args.input_file, encoder, model, args.top_k, args.group_by, args.chunk_size,
+                max_unknown_rate=args.max_unknown_rate, threshold=threshold,
+                calibration=calibration, keep=keep)
+            record.update(rows=stats['rows'], kept=len(shortlist))
+    except Exception as e:
+        print(f"Error during prediction: {e}")
+        sys.exit(1)
+    print_drift_summary(drift)
+
+    if args.drift_report:
+        save_drift_report(drift, args.drift_report)
+        print(f"✓ Saved drift report to: {args.drift_report}")
+
+    print(f"\n{'='*60}")
+    print("Prediction Summary")
+    print(f"{'='*60}")
+    print_summary(stats)
+
+    output_file = args.output or 'predictions_top.csv'
+    with instr.stage('save', rows=len(shortlist)):
+        shortlist.to_csv(output_file, index=False)
+    groups = f" in {shortlist[args.group_by].nunique(dropna=False):,} groups" \
+        if args.group_by and len(shortlist) else ""
+    print(f"\n✓ Saved {len(shortlist):,} top-ranked rows{groups} to: {output_file}")
+
+    display_cols = [c for c in [args.group_by, 'rank', 'row', 'prob_positive', 'confidence'] if c]
+    print(shortlist[display_cols].head(10).to_string(index=False))
+    instr.summary()
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Model Registry
+=========================
+Versioned, content-addressed storage for trained artifacts.
+
+Layout:
+    output/registry/
+    ├── CURRENT                  # promoted version id (replaced atomically)
+    └── versions/
+        └── <version>/           # sha256 of the artifact contents (12 hex)
+            ├── manifest.json    # files + hashes, metrics, training options
+            ├── encoder.joblib
+            ├── feature_selection.joblib
+            └── <Model>/model.joblib, calibration.joblib
+
+train_models.py writes a complete artifact set to a staging directory, which
+is renamed into versions/ in one step and then promoted by replacing CURRENT.
+A version directory is never modified after publishing, so encoder, models
+and metrics of one version always belong together. Readers resolve CURRENT
+once and load everything from that directory.
+
+HotSwapScorer keeps serving the loaded version while a newly promoted one is
+loaded in a background thread, then swaps the reference between batches.
+
+Usage:
+    python registry.py list
+    python registry.py promote <version>
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from joblib import load
+
+
+REGISTRY_DIR = Path(__file__).parent / 'output' / 'registry'
+
+# Legacy in-place artifacts, used when nothing has been promoted
+LEGACY_DIR = Path(__file__).parent / 'output'
+
+MODEL_DIRS = {
+    'lightgbm': 'LightGBM',
+    'xgboost': 'XGBoost',
+    'randomforest': 'RandomForest'
+}
+
+VERSION_LENGTH = 12
+
+
+def staging_dir(registry=REGISTRY_DIR):
+    """Create an empty staging directory inside the registry."""
+    path = Path(registry) / f"staging-{uuid.uuid4().hex[:8]}"
+    path.mkdir(parents=True)
+    return path
+
+
+def _file_hashes(directory):
+    """sha256 and size of every file below directory, keyed by relative path."""
+    files = {}
+    for path in sorted(Path(directory).rglob('*')):
+        if not path.is_file() or path.name == 'manifest.json':
+            continue
+        digest = hashlib.sha256()
+        with open(path, 'rb') as handle:
+            for block in iter(lambda: handle.read(1 << 20), b''):
+                digest.update(block)
+        files[path.relative_to(directory).as_posix()] = {
+            'sha256': digest.hexdigest(), 'bytes': path.stat().st_size}
+    return files
+
+
+def publish(staging, metrics=None, options=None, registry=REGISTRY_DIR):
+    """
+    Turn a staging directory into an immutable registry version.
+
+    The version id is the hash of the file list and contents, so publishing
+    identical artifacts twice yields the same version.
+
+    Args:
+        staging: Directory holding a complete artifact set
+        metrics: Evaluation metrics stored in the manifest
+        options: Training options stored in the manifest
+
+    Returns:
+        version id
+    """
+    staging = Path(staging)
+    files = _file_hashes(staging)
+    digest = hashlib.sha256()
+    for name, info in files.items():
+        digest.update(f"{name}\0{info['sha256']}\n".encode())
+    version = digest.hexdigest()[:VERSION_LENGTH]
+
+    manifest = {
+        'version': version,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'files': files,
+        'models': sorted(key for key, name in MODEL_DIRS.items()
+                         if f"{name}/model.joblib" in files),
+        'metrics': metrics or {},
+        'options': options or {},
+    }
+    with open(staging / 'manifest.json', 'w') as handle:
+        json.dump(manifest, handle, indent=2, default=str)
+
+    target = Path(registry) / 'versions' / version
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if target.exists():
+        shutil.rmtree(staging)
+    else:
+        os.replace(staging, target)
+    return version
+
+
+def promote(version, registry=REGISTRY_DIR):
+    """Atomically point CURRENT at a published version."""
+    registry = Path(registry)
+    if not (registry / 'versions' / version / 'manifest.json').exists():
+        raise ValueError(f"Unknown version: {version}")
+    tmp = registry / f"CURRENT.{uuid.uuid4().hex[:8]}"
+    tmp.write_text(version + '\n')
+    os.replace(tmp, registry / 'CURRENT')
+
+
+def current_version(registry=REGISTRY_DIR):
+    """Promoted version id, or None."""
+    try:
+        return (Path(registry) / 'CURRENT').read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def artifact_dir(version=None, registry=REGISTRY_DIR):
+    """
+    Directory to load artifacts from.
+
+    Args:
+        version: Version id (default: the promoted one)
+
+    Returns:
+        Path of the version directory, or the legacy output/ directory when
+        nothing has been promoted
+    """
+    version = version or current_version(registry)
+    if version is None:
+        return LEGACY_DIR
+    return Path(registry) / 'versions' / version
+
+
+def read_manifest(version, registry=REGISTRY_DIR):
+    """Manifest dict of a version."""
+    with open(Path(registry) / 'versions' / version / 'manifest.json') as handle:
+        return json.load(handle)
+
+
+def list_versions(registry=REGISTRY_DIR):
+    """Manifests of all published versions, oldest first."""
+    versions = Path(registry) / 'versions'
+    if not versions.exists():
+        return []
+    manifests = [read_manifest(p.name, registry) for p in versions.iterdir()
+                 if (p / 'manifest.json').exists()]
+    return sorted(manifests, key=lambda m: m['created'])
+
+
+def load_bundle(directory, model_type='lightgbm'):
+    """
+    Load encoder, model, calibration and feature selection from one directory.
+
+    Returns:
+        dict with encoder, model, calibration (or None), keep (or None) and
+        the directory
+    """
+    directory = Path(directory)
+    model_dir = directory / MODEL_DIRS[model_type]
+    calibration = model_dir / 'calibration.joblib'
+    selection = directory / 'feature_selection.joblib'
+    return {
+        'directory': directory,
+        'encoder': load(directory / 'encoder.joblib'),
+        'model': load(model_dir / 'model.joblib'),
+        'calibration': load(calibration) if calibration.exists() else None,
+        'keep': load(selection)['keep'] if selection.exists() else None,
+    }
+
+
+class HotSwapScorer:
+    """
+    Scores batches with the promoted version and follows promotions.
+
+    CURRENT is checked at most every check_interval seconds. When it changes,
+    the new bundle is loaded in a background thread while batches keep being
+    scored with the old one. Bundle and version live in one (bundle, version)
+    tuple, swapped in a single assignment and read once per batch, so a batch
+    is always scored and labelled with one consistent version.
+    """
+
+    def __init__(self, model_type='lightgbm', registry=REGISTRY_DIR, check_interval=5.0):
+        self.model_type = model_type
+        self.registry = Path(registry)
+        self.check_interval = check_interval
+        version = current_version(self.registry)
+        self.current = (load_bundle(artifact_dir(version, self.registry), model_type), version)
+        self._checked = time.monotonic()
+        self._loading = None
+
+    def _load(self, version):
+        try:
+            bundle = load_bundle(artifact_dir(version, self.registry), self.model_type)
+            self.current = (bundle, version)
+            print(f"✓ Swapped to model version {version}")
+        except Exception as e:
+            print(f"⚠ Could not load version {version}, keeping {self.current[1]}: {e}")
+        finally:
+            self._loading = None
+
+    def refresh(self, wait=False):
+        """Start loading a newly promoted version (wait=True blocks until swapped)."""
+        self._checked = time.monotonic()
+        version = current_version(self.registry)
+        # _load clears self._loading when it finishes, so hold a local reference
+        loader = self._loading
+        if version != self.current[1] and loader is None:
+            loader = threading.Thread(target=self._load, args=(version,), daemon=True)
+            self._loading = loader
+            loader.start()
+        if wait and loader is not None:
+            loader.join()
+
+    def score(self, data, current=None, **kwargs):
+        """
+        Score a DataFrame with the current bundle (see predict.predict_immunogenicity).
+
+        Args:
+            current: Optional (bundle, version) to use instead of the latest
+                one, so a job spanning many batches stays on one version
+
+        Returns:
+            results DataFrame; results.attrs['model_version'] names the version used
+        """
+        from predict import predict_immunogenicity
+
+        if time.monotonic() - self._checked >= self.check_interval:
+            self.refresh()
+        bundle, version = current or self.current
+        results = predict_immunogenicity(data, bundle['encoder'], bundle['model'],
+                                         calibration=bundle['calibration'],
+                                         keep=bundle['keep'], **kwargs)
+        results.attrs['model_version'] = version
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect and promote NeoTImmuML model versions')
+    parser.add_argument('--registry', default=str(REGISTRY_DIR),
+                        help=f'Registry directory (default: {REGISTRY_DIR})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='List published versions')
+    promote_parser = commands.add_parser('promote', help='Promote a version to CURRENT')
+    promote_parser.add_argument('version', help='Version id')
+
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        current = current_version(args.registry)
+        for manifest in list_versions(args.registry):
+            marker = '*' if manifest['version'] == current else ' '
+            auc = {m: round(v['auc'], 4) for m, v in manifest['metrics'].items() if 'auc' in v}
+            print(f"{marker} {manifest['version']}  {manifest['created'][:19]}  "
+                  f"{','.join(manifest['models'])}  AUC {auc}")
+        return
+
+    try:
+        promote(args.version, args.registry)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"✓ Promoted {args.version}")
+
+
+if __name__ == '__main__':
+    main()
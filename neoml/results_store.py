@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Results Store
+========================
+Loads predict.py output into an indexed SQLite table so large runs
+(10^5-10^6 scored candidates) can be browsed page by page.
+
+Sorting, filtering and pagination are pushed down to SQLite; only the rows of
+the requested page are materialised as a DataFrame.
+
+Usage:
+    python results_store.py <predictions_csv> [--db predictions.sqlite]
+"""
+
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+
+TABLE = 'predictions'
+CHUNK_SIZE = 100_000
+
+# Columns indexed for sorting and filtering when present
+INDEXED_COLUMNS = ['prob_positive', 'prediction', 'confidence', 'peptide',
+                   'mhcAllele', 'gene', 'Peptide_Sequence', 'Immunogenicity']
+
+PEPTIDE_COLUMNS = ['peptide', 'Peptide_Sequence']
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _create_indexes(conn, columns):
+    for column in INDEXED_COLUMNS:
+        if column in columns:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {_quote("idx_" + column)} '
+                         f'ON {TABLE} ({_quote(column)})')
+
+
+def build_store(predictions_file, db_path=None, chunksize=CHUNK_SIZE):
+    """
+    Stream a predictions CSV into an indexed SQLite database.
+
+    The database is rebuilt only when the CSV is newer than it.
+
+    Args:
+        predictions_file: Path to predict.py output
+        db_path: SQLite path (default: alongside the CSV, .sqlite suffix)
+        chunksize: Rows per insert batch
+
+    Returns:
+        Path to the SQLite database
+    """
+    predictions_file = Path(predictions_file)
+    db_path = Path(db_path) if db_path else predictions_file.with_suffix('.sqlite')
+
+    if db_path.exists() and db_path.stat().st_mtime >= predictions_file.stat().st_mtime:
+        return db_path
+
+    tmp_path = db_path.with_suffix(db_path.suffix + '.tmp')
+    tmp_path.unlink(missing_ok=True)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        columns = []
+        for chunk in pd.read_csv(predictions_file, chunksize=chunksize):
+            chunk.to_sql(TABLE, conn, if_exists='append', index=False)
+            columns = list(chunk.columns)
+        _create_indexes(conn, columns)
+        conn.commit()
+    finally:
+        conn.close()
+
+    tmp_path.replace(db_path)
+    return db_path
+
+
+class ResultStore:
+    """Paginated, sortable view over scored candidates"""
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.columns = [row[1] for row in self.conn.execute(f'PRAGMA table_info({TABLE})')]
+        self.peptide_column = next((c for c in PEPTIDE_COLUMNS if c in self.columns), None)
+
+    @classmethod
+    def from_frame(cls, frame):
+        """Build an in-memory store from a DataFrame (demo and small runs)."""
+        store = cls.__new__(cls)
+        store.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        frame.to_sql(TABLE, store.conn, index=False)
+        _create_indexes(store.conn, frame.columns)
+        store.columns = list(frame.columns)
+        store.peptide_column = next((c for c in PEPTIDE_COLUMNS if c in store.columns), None)
+        return store
+
+    def _where(self, search=None, min_prob=None):
+        clauses, params = [], []
+        if search and self.peptide_column:
+            # Prefix range keeps the peptide index usable
+            search = search.strip().upper()
+            clauses.append(f'{_quote(self.peptide_column)} >= ? AND {_quote(self.peptide_column)} < ?')
+            params += [search, search + '\uffff']
+        if min_prob is not None and 'prob_positive' in self.columns:
+            clauses.append('prob_positive >= ?')
+            params.append(float(min_prob))
+        where = (' WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        return where, params
+
+    def count(self, search=None, min_prob=None):
+        """Number of rows matching the filters."""
+        where, params = self._where(search, min_prob)
+        return self.conn.execute(f'SELECT COUNT(*) FROM {TABLE}{where}', params).fetchone()[0]
+
+    def page(self, page=1, page_size=50, sort_by=None, descending=True,
+             search=None, min_prob=None):
+        """
+        Materialise one page of results.
+
+        Args:
+            page: 1-based page number
+            page_size: Rows per page
+            sort_by: Column to sort by (must exist in the store)
+            descending: Sort direction
+            search: Peptide prefix filter
+            min_prob: Minimum prob_positive
+
+        Returns:
+            DataFrame with a leading row_id column
+        """
+        where, params = self._where(search, min_prob)
+        order = ''
+        if sort_by in self.columns:
+            order = f' ORDER BY {_quote(sort_by)} {"DESC" if descending else "ASC"}'
+        offset = max(int(page) - 1, 0) * int(page_size)
+        query = (f'SELECT rowid AS row_id, * FROM {TABLE}{where}{order} '
+                 f'LIMIT ? OFFSET ?')
+        return pd.read_sql_query(query, self.conn, params=params + [int(page_size), offset])
+
+
+def open_store(predictions_file, db_path=None):
+    """Build (if needed) and open the store for a predictions CSV."""
+    return ResultStore(build_store(predictions_file, db_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index predict.py output for paginated browsing')
+    parser.add_argument('predictions_file', help='Predictions CSV from predict.py')
+    parser.add_argument('--db', help='SQLite output path (default: <predictions>.sqlite)')
+
+    args = parser.parse_args()
+
+    try:
+        db_path = build_store(args.predictions_file, args.db)
+    except Exception as e:
+        print(f"Error building store: {e}")
+        sys.exit(1)
+
+    store = ResultStore(db_path)
+    print(f"✓ Indexed {store.count():,} rows into {db_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+TumorAgDB Schema
+================
+Column layout of ../tumordb/tumoragdb_data.csv as consumed by the NeoTImmuML
+encoder (the 46 columns after the two leading identifier columns), and the
+compact dtypes the training loader declares for them.
+"""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_DATA_PATH = "../tumordb/tumoragdb_data.csv"
+
+LABEL_COLUMN = 'immunogenicity'
+
+# Peptide/HLA pair identifying a record across datasets
+KEY_COLUMNS = ['peptide', 'mhcAllele']
+
+TUMORAGDB_COLUMNS = [
+    'hlaFrequency', 'lengthOfPeptide', 'lymphocyteStimulation', 'mhcAllele',
+    'mhcType', 'type', 'sample', 'peptide', 'peptideType', 'proteinIRI',
+    'reference', 'species', 'startPositionInAntigen', 'tissue', 'bigType2',
+    'responseType', 'bigType', 'dataSource', 'geneSymbol', 'iedbId', 'dataset',
+    'chromosome', 'genomicCoord', 'ref', 'alt', 'gene', 'aaMutant', 'aaWt',
+    'wtSeq', 'pepMutStart', 'tumorContent', 'mutantRank', 'mutantRankNetMHCpan',
+    'mutantRankPRIME', 'mutRankStab', 'tapScore', 'mutNetChopScoreCt',
+    'mutBindingScore', 'mutAaCoeff', 'daiNetMHC', 'daiMixMHC', 'daiNetStab',
+    'rnaseqTPM', 'gtexAllTissuesExpressionMean', 'bestWTMatchScoreI',
+    'immunogenicity',
+]
+
+# Model inputs: the label is part of the table layout but must never be a feature
+FEATURE_COLUMNS = [c for c in TUMORAGDB_COLUMNS if c != LABEL_COLUMN]
+
+# Measured columns; everything else (including numeric-looking identifiers such
+# as iedbId, reference or genomicCoord) is a pandas categorical
+FLOAT_COLUMNS = [
+    'tumorContent', 'mutantRank', 'mutantRankNetMHCpan', 'mutantRankPRIME',
+    'mutRankStab', 'tapScore', 'mutNetChopScoreCt', 'mutBindingScore', 'mutAaCoeff',
+    'daiNetMHC', 'daiMixMHC', 'daiNetStab', 'rnaseqTPM',
+    'gtexAllTissuesExpressionMean',
+]
+
+# Integer-valued columns with missing values (nullable pandas integers)
+INT_COLUMNS = {
+    'pepMutStart': 'Int8',
+    'lengthOfPeptide': 'Int16',
+    'bestWTMatchScoreI': 'Int16',
+}
+
+COLUMN_DTYPES = {
+    column: ('float32' if column in FLOAT_COLUMNS
+             else INT_COLUMNS.get(column, 'category'))
+    for column in FEATURE_COLUMNS
+}
+
+
+def load_table(path, **kwargs):
+    """
+    Read a CSV or Parquet training table.
+
+    Args:
+        path: File path (.parquet is read with pyarrow, anything else as CSV)
+        **kwargs: Passed through to the pandas reader
+
+    Returns:
+        DataFrame
+    """
+    if str(path).endswith('.parquet'):
+        return pd.read_parquet(path, **kwargs)
+    return pd.read_csv(path, **kwargs)
+
+
+def apply_schema(frame, copy=True):
+    """
+    Cast the TumorAgDB columns of a DataFrame to their compact dtypes.
+
+    Categorical columns that arrive as numbers keep their pandas string form
+    (e.g. 10024226.0 -> '10024226.0'); the label becomes uint8. Columns not in
+    the schema are left unchanged.
+
+    Args:
+        frame: DataFrame (e.g. from pd.read_csv or Parquet)
+        copy: Convert a shallow copy instead of the given frame
+
+    Returns:
+        DataFrame with converted columns
+    """
+    if copy:
+        frame = frame.copy(deep=False)
+    for column, dtype in COLUMN_DTYPES.items():
+        if column not in frame.columns or frame[column].dtype == dtype:
+            continue
+        values = frame[column]
+        if dtype == 'category':
+            if values.dtype != object and not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype(str).where(values.notna())
+            frame[column] = values.astype('category')
+        else:
+            frame[column] = _to_numeric(values, dtype)
+    if LABEL_COLUMN in frame.columns:
+        frame[LABEL_COLUMN] = frame[LABEL_COLUMN].astype(np.uint8)
+    return frame
+
+
+def _to_numeric(values, dtype):
+    numeric = pd.to_numeric(values, errors='coerce').astype('float32')
+    if dtype == 'float32':
+        return numeric
+    try:
+        return numeric.astype(dtype)
+    except (TypeError, ValueError):
+        # Non-integral values: keep float32 rather than truncate
+        return numeric
+
+
+def load_tumoragdb(path):
+    """
+    Load a TumorAgDB table with compact dtypes declared up front.
+
+    CSV files are parsed straight into categoricals and float32, so the
+    object-string copy of the table is never built; Parquet tables are
+    converted with apply_schema.
+
+    Args:
+        path: CSV or Parquet file
+
+    Returns:
+        DataFrame with categorical, float32, nullable-integer and uint8 columns
+    """
+    if str(path).endswith('.parquet'):
+        return apply_schema(pd.read_parquet(path))
+    header = pd.read_csv(path, nrows=0).columns
+    dtypes = {c: ('float32' if d in INT_COLUMNS.values() else d)
+              for c, d in COLUMN_DTYPES.items() if c in header}
+    frame = pd.read_csv(path, dtype=dtypes)
+    return apply_schema(frame, copy=False)
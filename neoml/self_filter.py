@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Self-Proteome Filter
+===============================
+Flags candidate peptides that also occur in the normal proteome (Pitfall 2 in
+docs/neoantigen_qualification_guide.md: T cells against self peptides are
+deleted by central tolerance).
+
+Every 8-11-mer of a reference proteome FASTA is packed into one uint64
+(5 bits per residue, peptide length in the top bits), deduplicated and stored
+as a sorted array in a .npy file. The index is built once; at query time it
+is memory-mapped, and a candidate batch is packed the same way and looked up
+with a single np.searchsorted, so only the touched pages are read. The human
+proteome (~11M residues) gives roughly 40M distinct k-mers, ~330 MB on disk.
+
+Usage:
+    python self_filter.py --build <proteome.fasta> [--index FILE]
+    python self_filter.py <candidates_csv> [--index FILE] [--output FILE]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from peptides import MAX_LENGTH, MIN_LENGTH, encode_sequences, read_fasta
+
+
+INDEX_PATH = Path(__file__).parent / 'output' / 'SelfProteome' / 'kmers.npy'
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+BITS_PER_RESIDUE = 5
+LENGTH_SHIFT = BITS_PER_RESIDUE * MAX_LENGTH
+
+# Residue codes 1-20; 0 marks padding, separators and non-standard residues
+_CODES = np.zeros(256, dtype=np.uint64)
+for _code, _aa in enumerate(AMINO_ACIDS, start=1):
+    _CODES[ord(_aa)] = _code
+
+
+def pack_windows(codes, length):
+    """
+    Pack every length-k window of a residue code array into uint64 keys.
+
+    Args:
+        codes: uint64 array of residue codes
+        length: k-mer length
+
+    Returns:
+        (keys, valid) - valid is False for windows containing a 0 code
+    """
+    windows = sliding_window_view(codes, length)
+    keys = np.full(len(windows), length, dtype=np.uint64) << np.uint64(LENGTH_SHIFT)
+    valid = np.ones(len(windows), dtype=bool)
+    for position in range(length):
+        column = windows[:, position]
+        valid &= column != 0
+        keys |= column << np.uint64(BITS_PER_RESIDUE * position)
+    return keys, valid
+
+
+def pack_peptides(peptides):
+    """
+    Pack peptides into the index key space.
+
+    Returns:
+        (keys, valid) - valid is False for peptides outside 8-11 residues or
+        with non-standard residues
+    """
+    peptides = [str(p).strip().upper() for p in peptides]
+    lengths = np.fromiter(map(len, peptides), dtype=np.int64, count=len(peptides))
+    valid = (lengths >= MIN_LENGTH) & (lengths <= MAX_LENGTH)
+    codes = _CODES[encode_sequences([p if ok else '' for p, ok in zip(peptides, valid)],
+                                    MAX_LENGTH)]
+
+    keys = lengths.astype(np.uint64) << np.uint64(LENGTH_SHIFT)
+    for position in range(MAX_LENGTH):
+        column = codes[:, position]
+        valid &= (column != 0) | (position >= lengths)
+        keys |= column << np.uint64(BITS_PER_RESIDUE * position)
+    return keys, valid
+
+
+def build_index(fasta_path, index_path=INDEX_PATH, min_length=MIN_LENGTH,
+                max_length=MAX_LENGTH):
+    """
+    Build the sorted k-mer index of a proteome FASTA.
+
+    Args:
+        fasta_path: Reference proteome FASTA
+        index_path: Output .npy file (a .json with counts is written next to it)
+
+    Returns:
+        metadata dict
+    """
+    # read_fasta also keys UniProt records by accession; index each sequence once
+    sequences = list(dict.fromkeys(read_fasta(fasta_path).values()))
+    joined = '\0'.join(sequences).encode('ascii', errors='replace')
+    codes = _CODES[np.frombuffer(joined, dtype=np.uint8)]
+
+    # The length sits in the top bits, so sorted per-length blocks concatenate
+    # into one sorted array
+    keys = [np.zeros(0, dtype=np.uint64)]
+    for length in range(min_length, max_length + 1):
+        if len(codes) < length:
+            continue
+        packed, valid = pack_windows(codes, length)
+        packed = packed[valid]
+        packed.sort()
+        keys.append(packed[np.concatenate(([True], packed[1:] != packed[:-1]))])
+    keys = np.concatenate(keys)
+
+    index_path = Path(index_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(index_path, keys)
+
+    metadata = {
+        'fasta': str(fasta_path),
+        'proteins': len(sequences),
+        'residues': int(sum(map(len, sequences))),
+        'kmers': int(len(keys)),
+        'lengths': [min_length, max_length],
+    }
+    with open(index_path.with_suffix('.json'), 'w') as handle:
+        json.dump(metadata, handle, indent=2)
+    return metadata
+
+
+class SelfIndex:
+    """Memory-mapped sorted k-mer index with vectorised membership tests"""
+
+    def __init__(self, path=INDEX_PATH):
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"Self-proteome index not found: {path} "
+                                    "(run self_filter.py --build <proteome.fasta>)")
+        self.keys = np.load(path, mmap_mode='r')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def contains(self, peptides):
+        """
+        Test which peptides occur in the reference proteome.
+
+        Returns:
+            Boolean numpy array (False for peptides that cannot be indexed)
+        """
+        keys, valid = pack_peptides(peptides)
+        if not len(self.keys):
+            return np.zeros(len(keys), dtype=bool)
+        positions = np.searchsorted(self.keys, keys)
+        found = np.asarray(self.keys[np.minimum(positions, len(self.keys) - 1)]) == keys
+        return found & valid
+
+
+def add_self_column(data, index, peptide_column='peptide'):
+    """
+    Add an 'in_self_proteome' column (True when the peptide is a self k-mer).
+
+    Returns:
+        DataFrame copy with the new column
+    """
+    data = data.copy()
+    data['in_self_proteome'] = index.contains(data[peptide_column].astype(str).tolist())
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Flag candidate peptides that occur in the normal proteome'
+    )
+    parser.add_argument('input_file',
+                        help='Candidate CSV with a peptide column (or FASTA with --build)')
+    parser.add_argument('--build', action='store_true',
+                        help='Build the index from the FASTA given as input_file')
+    parser.add_argument('--index', default=str(INDEX_PATH),
+                        help=f'Index file (default: {INDEX_PATH})')
+    parser.add_argument('--output', default='self_filtered.csv',
+                        help='Output CSV file (default: self_filtered.csv)')
+    parser.add_argument('--drop', action='store_true',
+                        help='Drop self peptides instead of only flagging them')
+
+    args = parser.parse_args()
+
+    if args.build:
+        print(f"\nIndexing {args.input_file}...")
+        start = time.perf_counter()
+        metadata = build_index(args.input_file, args.index)
+        print(f"✓ {metadata['proteins']:,} proteins, {metadata['residues']:,} residues")
+        print(f"✓ {metadata['kmers']:,} distinct {MIN_LENGTH}-{MAX_LENGTH}-mers "
+              f"in {time.perf_counter() - start:.1f}s")
+        print(f"✓ Saved index to: {args.index}")
+        return
+
+    try:
+        index = SelfIndex(args.index)
+        data = pd.read_csv(args.input_file)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    data = add_self_column(data, index)
+    elapsed = time.perf_counter() - start
+    n_self = int(data['in_self_proteome'].sum())
+    print(f"✓ Checked {len(data):,} peptides against {len(index):,} self k-mers "
+          f"in {elapsed * 1000:.1f} ms")
+    print(f"✓ {n_self:,} candidates occur in the reference proteome")
+
+    if args.drop:
+        data = data[~data['in_self_proteome']]
+    data.to_csv(args.output, index=False)
+    print(f"✓ Saved {len(data):,} candidates to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Splitting
+====================
+Leakage-safe train/test splits and cross-validation folds.
+
+Rows are grouped by peptide sequence, source study or HLA allele, and every
+group is assigned to a fold by hashing its key, so the same peptide (or
+study, or allele) never appears on both sides of a split. Hashing is
+vectorised (pandas' 64-bit object hash) and needs no sort or groupby, so
+assigning 150k+ rows takes milliseconds and is stable across runs and
+dataset versions: a peptide keeps its fold when new rows are added.
+
+leakage_report lists columns whose values alone predict the label, and
+split_overlap measures how many test rows share a value with training rows.
+
+Usage:
+    python splitting.py [--data ../tumordb/tumoragdb_data.csv] [--by peptide]
+"""
+
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from schema import DEFAULT_DATA_PATH, FEATURE_COLUMNS, LABEL_COLUMN, load_table
+
+
+# Group name -> column holding the group key
+GROUPS = {
+    'peptide': 'peptide',
+    'study': 'reference',
+    'hla': 'mhcAllele',
+}
+
+SPLIT_CHOICES = ['random'] + list(GROUPS)
+
+# Hash buckets used to turn a test fraction into a group assignment
+BUCKETS = 10_000
+
+
+def group_keys(data, by):
+    """
+    Normalised group key per row.
+
+    Args:
+        data: DataFrame
+        by: Group name (see GROUPS) or column name
+
+    Returns:
+        string Series ('' for missing keys)
+    """
+    column = GROUPS.get(by, by)
+    if column not in data.columns:
+        raise ValueError(f"Cannot group by '{by}': column '{column}' not in data")
+    return data[column].astype(str).str.strip().str.upper().where(data[column].notna(), '')
+
+
+def group_hash(data, by, seed=42):
+    """
+    Stable 64-bit hash of each row's group key.
+
+    Args:
+        data: DataFrame
+        by: Group name or column name ('random' hashes the row position)
+        seed: Changes the assignment of groups to folds
+
+    Returns:
+        uint64 numpy array
+    """
+    if by == 'random':
+        keys = pd.Series(np.arange(len(data)))
+    else:
+        keys = group_keys(data, by)
+    hash_key = f"{seed:016d}"[-16:]
+    return pd.util.hash_pandas_object(keys, index=False, hash_key=hash_key).to_numpy()
+
+
+def group_folds(data, by='peptide', n_folds=5, seed=42):
+    """
+    Assign every row to one of n_folds folds by group.
+
+    Returns:
+        int64 numpy array of fold numbers
+    """
+    return (group_hash(data, by, seed) % np.uint64(n_folds)).astype(np.int64)
+
+
+def fold_splits(folds):
+    """
+    (train_idx, valid_idx) pairs for each fold number.
+
+    Args:
+        folds: Fold number per row (from group_folds)
+
+    Yields:
+        (train indices, validation indices)
+    """
+    folds = np.asarray(folds)
+    for fold in np.unique(folds):
+        valid = folds == fold
+        yield np.flatnonzero(~valid), np.flatnonzero(valid)
+
+
+def group_train_test_split(data, by='peptide', test_size=0.2, seed=42):
+    """
+    Split rows into train and test sets without sharing groups.
+
+    The test set holds roughly test_size of the rows; with few large groups
+    (e.g. by study) the realised fraction can differ noticeably.
+
+    Returns:
+        (train indices, test indices)
+    """
+    bucket = group_hash(data, by, seed) % np.uint64(BUCKETS)
+    test = bucket < np.uint64(round(test_size * BUCKETS))
+    return np.flatnonzero(~test), np.flatnonzero(test)
+
+
+def leakage_report(data, label=LABEL_COLUMN, columns=None):
+    """
+    Rank columns by how well their values alone predict the label.
+
+    For each column, every distinct value (missing counts as a value) is
+    mapped to its majority label; purity is the fraction of rows that lookup
+    classifies correctly. repeated is the fraction of rows whose value occurs
+    more than once - a column with purity 1.0 and high repeated predicts the
+    label by lookup, while a unique-per-row identifier is pure only trivially.
+
+    Args:
+        data: DataFrame with a binary label column
+        label: Label column name
+        columns: Columns to check (default: all feature columns present)
+
+    Returns:
+        DataFrame sorted by descending purity, with a 'perfect' flag
+    """
+    y = data[label].to_numpy().astype(np.int64)
+    if columns is None:
+        columns = [c for c in FEATURE_COLUMNS if c in data.columns]
+    baseline = max(y.mean(), 1 - y.mean()) if len(y) else 0.0
+
+    rows = []
+    for column in columns:
+        codes, uniques = pd.factorize(data[column], use_na_sentinel=False)
+        # counts[value, label]
+        counts = np.bincount(codes * 2 + y, minlength=2 * len(uniques)).reshape(-1, 2)
+        per_value = counts.sum(axis=1)
+        purity = counts.max(axis=1).sum() / max(len(y), 1)
+        repeated = per_value[per_value > 1].sum() / max(len(y), 1)
+        rows.append({
+            'column': column,
+            'n_values': len(uniques),
+            'purity': float(purity),
+            'repeated': float(repeated),
+            'lift': float(purity - baseline),
+        })
+
+    report = pd.DataFrame(rows, columns=['column', 'n_values', 'purity', 'repeated', 'lift'])
+    report['perfect'] = (report['purity'] >= 1.0) & (report['repeated'] > 0)
+    return report.sort_values(['purity', 'repeated'], ascending=False).reset_index(drop=True)
+
+
+def split_overlap(data, train_idx, test_idx, by=('peptide', 'study', 'hla')):
+    """
+    Fraction of test rows whose group key also occurs in the training rows.
+
+    Returns:
+        dict group name -> overlap fraction (groups missing from data skipped)
+    """
+    overlap = {}
+    for name in by:
+        if GROUPS.get(name, name) not in data.columns:
+            continue
+        keys = group_keys(data, name)
+        train_keys = pd.Index(keys.iloc[train_idx].unique())
+        seen = train_keys.get_indexer(keys.iloc[test_idx]) >= 0
+        overlap[name] = float(seen.mean()) if len(seen) else 0.0
+    return overlap
+
+
+def print_leakage_report(report, top=10):
+    """Print the columns that predict the label best."""
+    print(f"  {'Column':28s} {'Values':>9s} {'Purity':>8s} {'Repeated':>9s}")
+    for row in report.head(top).itertuples():
+        flag = "  ⚠ perfect" if row.perfect else ""
+        print(f"  {row.column:28s} {row.n_values:>9,} {row.purity:>8.3f} {row.repeated:>9.1%}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Report label leakage and group overlap for NeoTImmuML splits'
+    )
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH,
+                        help=f'Training data, CSV or Parquet (default: {DEFAULT_DATA_PATH})')
+    parser.add_argument('--by', choices=SPLIT_CHOICES, default='peptide',
+                        help='Grouping used for the split (default: peptide)')
+    parser.add_argument('--test-size', type=float, default=0.2,
+                        help='Test fraction (default: 0.2)')
+    parser.add_argument('--output', help='Write the full leakage report to this CSV')
+
+    args = parser.parse_args()
+
+    try:
+        data = load_table(args.data)
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        sys.exit(1)
+    print(f"✓ Loaded {len(data):,} samples")
+
+    print("\nColumns predicting the label by value lookup:")
+    report = leakage_report(data)
+    print_leakage_report(report)
+    if args.output:
+        report.to_csv(args.output, index=False)
+        print(f"✓ Saved leakage report to: {args.output}")
+
+    train_idx, test_idx = group_train_test_split(data, args.by, args.test_size)
+    print(f"\nSplit by {args.by}: {len(train_idx):,} train / {len(test_idx):,} test")
+    for name, fraction in split_overlap(data, train_idx, test_idx).items():
+        print(f"  Test rows sharing a {name} with train: {fraction:.1%}")
+
+
+if __name__ == '__main__':
+    main()
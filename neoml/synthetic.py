@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Synthetic Data Generator
+===================================
+Seeded, vectorised generator for schema-faithful TumorAgDB tables, used to
+load-test training and scoring without shipping patient data.
+
+Generation is driven by a profile: per-column value distributions, missing
+rates and the class balance. A profile is built either from a real table
+(python synthetic.py --profile-from ../tumordb/tumoragdb_data.csv), or from
+the categories of the shipped encoder when no table is available. Profiles
+built from data never store peptide sequences or values of high-cardinality
+identifier columns: peptides are drawn from the observed length distribution
+and residue composition, and identifiers become synthetic tokens with the
+observed cardinality and frequency shape.
+
+Every column is drawn for a whole chunk with one NumPy call (alias-table
+sampling, categoricals built from codes), so generation runs
+at millions of rows per second; writing is chunked to CSV or Parquet.
+
+Usage:
+    python synthetic.py --profile-from ../tumordb/tumoragdb_data.csv
+    python synthetic.py --rows 5000000 --output synthetic.parquet [--seed 42]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from schema import FLOAT_COLUMNS, INT_COLUMNS, LABEL_COLUMN, TUMORAGDB_COLUMNS, load_tumoragdb
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+PROFILE_PATH = Path(__file__).parent / 'output' / 'synthetic_profile.json'
+ENCODER_PATH = Path(__file__).parent / 'output' / 'encoder.joblib'
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+# Generated from length + composition, never copied from the source table
+SEQUENCE_COLUMNS = ['peptide', 'wtSeq']
+
+# Columns with more distinct values are replaced by synthetic tokens (data
+# profiles) or sampled from quantiles (numeric columns)
+MAX_VALUES = 1000
+
+# Explicit frequencies kept for the most common tokens of high-cardinality columns
+TOP_TOKENS = 100
+
+N_QUANTILES = 201
+
+# Class balance used when the profile has no label statistics (encoder profiles)
+DEFAULT_LABEL_RATE = 0.1
+
+CHUNK_SIZE = 1_000_000
+
+
+def _numeric_column(column):
+    return column in FLOAT_COLUMNS or column in INT_COLUMNS
+
+
+def _values_spec(counts, missing, numeric):
+    """Explicit value/probability spec from value counts."""
+    values = [float(v) for v in counts.index] if numeric else [str(v) for v in counts.index]
+    return {'kind': 'values', 'values': values,
+            'probs': (counts / counts.sum()).round(8).tolist(), 'missing': missing}
+
+
+def profile_from_table(data, max_values=MAX_VALUES):
+    """
+    Build a generation profile from a TumorAgDB table.
+
+    Args:
+        data: DataFrame with the TumorAgDB columns (see schema.load_tumoragdb)
+        max_values: Cardinality above which values are not stored
+
+    Returns:
+        profile dict (JSON-serialisable)
+    """
+    columns = {}
+    for column in TUMORAGDB_COLUMNS:
+        if column == LABEL_COLUMN or column not in data.columns:
+            continue
+        values = data[column]
+        missing = float(values.isna().mean())
+
+        if column in SEQUENCE_COLUMNS:
+            sequences = values.dropna().astype(str)
+            lengths = sequences.str.len().value_counts()
+            residues = pd.Series(list(''.join(sequences.sample(
+                min(len(sequences), 50_000), random_state=0)))).value_counts()
+            composition = residues.reindex(list(AMINO_ACIDS), fill_value=0) + 1
+            columns[column] = {
+                'kind': 'sequence', 'missing': missing,
+                'lengths': [int(v) for v in lengths.index],
+                'length_probs': (lengths / lengths.sum()).round(8).tolist(),
+                'composition': (composition / composition.sum()).round(8).tolist(),
+            }
+            continue
+
+        if _numeric_column(column):
+            numbers = pd.to_numeric(values, errors='coerce').dropna()
+            counts = numbers.value_counts()
+            if len(counts) <= max_values:
+                columns[column] = _values_spec(counts, missing, numeric=True)
+            else:
+                levels = np.linspace(0, 1, N_QUANTILES)
+                columns[column] = {'kind': 'quantiles', 'missing': missing,
+                                   'quantiles': np.quantile(numbers, levels).tolist()}
+            continue
+
+        counts = values.dropna().astype(str).value_counts()
+        if len(counts) <= max_values:
+            columns[column] = _values_spec(counts, missing, numeric=False)
+        else:
+            shares = counts / counts.sum()
+            columns[column] = {'kind': 'tokens', 'missing': missing,
+                               'cardinality': int(len(counts)),
+                               'top_probs': shares.iloc[:TOP_TOKENS].round(8).tolist()}
+
+    label_rate = DEFAULT_LABEL_RATE
+    if LABEL_COLUMN in data.columns:
+        label_rate = float(pd.to_numeric(data[LABEL_COLUMN], errors='coerce').mean())
+    return {'source': 'table', 'n_rows': int(len(data)), 'label_rate': label_rate,
+            'columns': columns}
+
+
+def profile_from_encoder(encoder, label_rate=DEFAULT_LABEL_RATE):
+    """
+    Build a generation profile from a fitted encoder's categories.
+
+    Values are drawn uniformly from the known categories, so generated rows
+    hit the encoder's vocabulary (useful for load-testing the scorer). The
+    encoder holds no frequencies or class balance; label_rate is a default.
+
+    Returns:
+        profile dict
+    """
+    columns = {}
+    for column, categories in zip(encoder.feature_names_in_, encoder.categories_):
+        if column == LABEL_COLUMN:
+            continue
+        series = pd.Series(np.asarray(categories, dtype=object))
+        if _numeric_column(column):
+            present = pd.to_numeric(series, errors='coerce').dropna().unique()
+        else:
+            present = series[series.notna() & (series.astype(str) != 'nan')].astype(str).unique()
+        missing = 0.0 if len(present) == len(series) else 0.05
+        columns[str(column)] = {
+            'kind': 'values', 'missing': missing if len(present) else 1.0,
+            'values': [float(v) for v in present] if _numeric_column(column)
+            else [str(v) for v in present],
+            'probs': None,
+        }
+    return {'source': 'encoder', 'label_rate': label_rate, 'columns': columns}
+
+
+def save_profile(profile, path=PROFILE_PATH):
+    """Write a profile as JSON."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as handle:
+        json.dump(profile, handle)
+
+
+def load_profile(path=PROFILE_PATH, encoder_path=ENCODER_PATH):
+    """
+    Load the saved profile, falling back to one built from the encoder.
+
+    Raises:
+        FileNotFoundError: if neither exists
+    """
+    if Path(path).exists():
+        with open(path) as handle:
+            return json.load(handle)
+    if Path(encoder_path).exists():
+        from joblib import load
+        return profile_from_encoder(load(encoder_path))
+    raise FileNotFoundError(f"No synthetic profile ({path}) or encoder ({encoder_path}); "
+                            "run synthetic.py --profile-from <table>")
+
+
+def alias_table(probs):
+    """
+    Walker alias table for O(1) sampling from a discrete distribution.
+
+    Returns:
+        (threshold float64 array, alias int64 array)
+    """
+    probs = np.asarray(probs, dtype=np.float64)
+    scaled = probs / probs.sum() * len(probs)
+    threshold = np.ones(len(probs))
+    alias = np.arange(len(probs))
+    small = [i for i in range(len(probs)) if scaled[i] < 1.0]
+    large = [i for i in range(len(probs)) if scaled[i] >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        threshold[s], alias[s] = scaled[s], l
+        scaled[l] -= 1.0 - scaled[s]
+        (small if scaled[l] < 1.0 else large).append(l)
+    return threshold, alias
+
+
+class SyntheticGenerator:
+    """Draws chunks of synthetic TumorAgDB rows from a profile"""
+
+    def __init__(self, profile, seed=42):
+        self.profile = profile
+        self.rng = np.random.default_rng(seed)
+        self._tables = {}
+
+    def _sampler(self, column, spec):
+        # Alias table (None for uniform) and category index, built once per column
+        if column not in self._tables:
+            if spec['kind'] == 'tokens':
+                top = np.asarray(spec['top_probs'])
+                rest = max(spec['cardinality'] - len(top), 0)
+                tail = np.full(rest, max(1.0 - top.sum(), 0.0) / max(rest, 1))
+                probs = np.concatenate([top, tail])
+                categories = pd.Index([f"{column}_{i}" for i in range(len(probs))])
+            elif spec['kind'] == 'sequence':
+                probs, categories = None, None
+                self._tables[column + ':length'] = alias_table(spec['length_probs'])
+                self._tables[column + ':residue'] = alias_table(spec['composition'])
+            else:
+                probs = spec.get('probs')
+                categories = pd.Index(spec['values'])
+            self._tables[column] = (None if probs is None else alias_table(probs), categories)
+        return self._tables[column]
+
+    def _codes(self, table, size, n):
+        codes = self.rng.integers(0, size, n)
+        if table is None:
+            return codes
+        threshold, alias = table
+        return np.where(self.rng.random(n) < threshold[codes], codes, alias[codes])
+
+    def _missing(self, spec, n):
+        return self.rng.random(n) < spec['missing'] if spec['missing'] > 0 else None
+
+    def _sequences(self, column, spec, n):
+        self._sampler(column, spec)
+        lengths = np.asarray(spec['lengths'])[self._codes(
+            self._tables[column + ':length'], len(spec['lengths']), n)]
+        width = int(lengths.max()) if n else 1
+        residues = np.frombuffer(AMINO_ACIDS.encode(), dtype=np.uint8)[self._codes(
+            self._tables[column + ':residue'], 20, n * width)].reshape(n, width)
+        residues[np.arange(width)[None, :] >= lengths[:, None]] = 0
+        return residues.view(f'S{width}').ravel().astype(str)
+
+    def generate(self, n_rows):
+        """
+        Generate one chunk.
+
+        Returns:
+            DataFrame in TumorAgDB column order with schema dtypes
+        """
+        columns = {}
+        for column in TUMORAGDB_COLUMNS:
+            spec = self.profile['columns'].get(column)
+            if column == LABEL_COLUMN:
+                columns[column] = (self.rng.random(n_rows)
+                                   < self.profile['label_rate']).astype(np.uint8)
+                continue
+            if spec is None or not spec.get('values', True):
+                columns[column] = np.full(n_rows, np.nan, dtype=np.float32) \
+                    if _numeric_column(column) else pd.Categorical([None] * n_rows)
+                continue
+
+            missing = self._missing(spec, n_rows)
+            if spec['kind'] == 'sequence':
+                values = pd.Series(self._sequences(column, spec, n_rows), dtype=object)
+                if missing is not None:
+                    values[missing] = np.nan
+            elif spec['kind'] == 'quantiles':
+                quantiles = np.asarray(spec['quantiles'])
+                values = np.interp(self.rng.random(n_rows),
+                                   np.linspace(0, 1, len(quantiles)), quantiles)
+                if missing is not None:
+                    values[missing] = np.nan
+            else:
+                table, categories = self._sampler(column, spec)
+                codes = self._codes(table, len(categories), n_rows)
+                if _numeric_column(column):
+                    values = np.asarray(categories, dtype=np.float64)[codes]
+                    if missing is not None:
+                        values[missing] = np.nan
+                else:
+                    if missing is not None:
+                        codes[missing] = -1
+                    values = pd.Categorical.from_codes(codes, categories=categories)
+
+            if _numeric_column(column):
+                values = pd.Series(values, dtype='float32')
+                if column in INT_COLUMNS:
+                    values = values.round().astype(INT_COLUMNS[column])
+            columns[column] = values
+
+        frame = pd.DataFrame({c: (v.to_numpy() if isinstance(v, pd.Series) else v)
+                              for c, v in columns.items()})
+        if 'peptide' in frame.columns and 'lengthOfPeptide' in frame.columns:
+            # Keep the length column consistent with the generated peptides
+            lengths = frame['peptide'].str.len()
+            frame['lengthOfPeptide'] = lengths.where(lengths.notna(),
+                                                     frame['lengthOfPeptide']).astype('Int16')
+        return frame
+
+
+def write_synthetic(generator, n_rows, path, chunk_size=CHUNK_SIZE):
+    """
+    Generate n_rows in chunks and write them to CSV or Parquet.
+
+    Returns:
+        dict with rows, generate_seconds and write_seconds
+    """
+    path = Path(path)
+    parquet = path.suffix == '.parquet'
+    if parquet and not HAS_PYARROW:
+        raise ImportError("pyarrow is required for Parquet output (pip install pyarrow)")
+
+    writer = None
+    generate_seconds = write_seconds = 0.0
+    for start in range(0, n_rows, chunk_size):
+        t0 = time.perf_counter()
+        chunk = generator.generate(min(chunk_size, n_rows - start))
+        t1 = time.perf_counter()
+        if parquet:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+        else:
+            chunk.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+        generate_seconds += t1 - t0
+        write_seconds += time.perf_counter() - t1
+    if writer is not None:
+        writer.close()
+    return {'rows': n_rows, 'generate_seconds': generate_seconds,
+            'write_seconds': write_seconds}
+
+
+def demo_predictions(n_rows=1000, seed=42):
+    """
+    Synthetic scored candidates for demos (e.g. the marimo app without a
+    predictions.csv): generated rows plus prediction columns.
+    """
+    frame = SyntheticGenerator(load_profile(), seed).generate(n_rows)
+    rng = np.random.default_rng(seed)
+    positive = rng.beta(1.0, 4.0, n_rows)
+    frame['prediction'] = (positive >= 0.5).astype(int)
+    frame['prob_negative'] = 1 - positive
+    frame['prob_positive'] = positive
+    frame['confidence'] = np.maximum(positive, 1 - positive)
+    return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate synthetic TumorAgDB-schema data for load testing'
+    )
+    parser.add_argument('--rows', type=int, default=100_000,
+                        help='Number of rows to generate (default: 100000)')
+    parser.add_argument('--output', default='synthetic.csv',
+                        help='Output file, .csv or .parquet (default: synthetic.csv)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    parser.add_argument('--profile', default=str(PROFILE_PATH),
+                        help=f'Profile JSON (default: {PROFILE_PATH}; falls back to the encoder)')
+    parser.add_argument('--profile-from',
+                        help='Build the profile from this TumorAgDB table and save it to --profile')
+    parser.add_argument('--label-rate', type=float,
+                        help='Override the positive class rate')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f'Rows generated per chunk (default: {CHUNK_SIZE})')
+
+    args = parser.parse_args()
+
+    if args.profile_from:
+        print(f"\nProfiling {args.profile_from}...")
+        profile = profile_from_table(load_tumoragdb(args.profile_from))
+        save_profile(profile, args.profile)
+        print(f"✓ Profiled {profile['n_rows']:,} rows, {len(profile['columns'])} columns, "
+              f"label rate {profile['label_rate']:.3f}")
+        print(f"✓ Saved profile to: {args.profile}")
+        return
+
+    try:
+        profile = load_profile(args.profile)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if args.label_rate is not None:
+        profile['label_rate'] = args.label_rate
+    print(f"✓ Using {profile['source']} profile, label rate {profile['label_rate']:.3f}")
+
+    try:
+        stats = write_synthetic(SyntheticGenerator(profile, args.seed), args.rows,
+                                args.output, args.chunk_size)
+    except ImportError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"✓ Generated {stats['rows']:,} rows in {stats['generate_seconds']:.2f}s "
+          f"({stats['rows'] / max(stats['generate_seconds'], 1e-9):,.0f} rows/s)")
+    print(f"✓ Wrote {args.output} in {stats['write_seconds']:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
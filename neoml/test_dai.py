@@ -0,0 +1,50 @@
+"""
+Tests for dai.py on peptides.py output.
+
+Run from neoml/:
+    python -m pytest -q test_dai.py
+"""
+
+import numpy as np
+import pandas as pd
+
+from dai import add_dai
+from peptides import generate_windows
+from test_peptides import PROTEIN
+
+
+def residue_sum(peptides, alleles):
+    """Deterministic stand-in score so the test needs no trained model."""
+    return np.array([sum(map(ord, p)) for p in peptides], dtype=np.float64)
+
+
+def candidates():
+    variants = pd.DataFrame({
+        'protein_id': ['P1'] * 4,
+        'position': [5, 12, 12, 12],
+        'ref': ['Y', '-', 'ISF', 'I'],
+        'alt': ['W', 'WW', '-', 'GPRW*'],
+        'type': ['missense', 'insertion', 'deletion', 'frameshift'],
+    })
+    windows = generate_windows({'P1': PROTEIN}, variants)
+    return windows.assign(mhcAllele='HLA-A*02:01')
+
+
+def test_indel_and_frameshift_rows_have_no_dai():
+    scored = add_dai(candidates(), residue_sum)
+    substitution = scored['type'] == 'SNV'
+
+    assert substitution.any() and (~substitution).any()
+    assert scored.loc[substitution, 'dai'].notna().all()
+    assert scored.loc[~substitution, 'dai'].isna().all()
+    assert scored.loc[~substitution, 'ic50'].notna().all()
+
+
+def test_missing_wild_type_survives_a_csv_round_trip(tmp_path):
+    path = tmp_path / 'candidates.csv'
+    candidates().to_csv(path, index=False)
+    data = pd.read_csv(path, dtype={'peptide': str, 'wt_peptide': str})
+
+    scored = add_dai(data, residue_sum)
+
+    assert scored.loc[data['wt_peptide'].isna(), 'dai'].isna().all()
@@ -0,0 +1,58 @@
+"""
+Tests for distributed_training.py on a small LocalCluster.
+
+Run from neoml/:
+    python -m pytest -q test_distributed_training.py
+"""
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+pytest.importorskip('dask.distributed')
+
+from distributed_training import dask_client, fit_lightgbm, fit_xgboost, partition
+
+
+@pytest.fixture(scope='module')
+def client():
+    with dask_client(workers=2) as client:
+        yield client
+
+
+@pytest.fixture(scope='module')
+def training_data():
+    rng = np.random.default_rng(0)
+    X = sparse.random(400, 20, density=0.3, format='csr', random_state=0)
+    y = (X[:, 0].toarray().ravel() + rng.normal(0, 0.05, 400) > 0.1).astype(int)
+    return X, y
+
+
+def test_partition_keeps_every_row(client, training_data):
+    X, y = training_data
+    X_dask, y_dask = partition(client, X, y, partitions=3)
+
+    assert X_dask.numblocks[0] == 3
+    assert (X_dask.compute() != X).nnz == 0
+    assert np.array_equal(y_dask.compute(), y)
+
+
+def test_fits_return_local_models(client, training_data):
+    pytest.importorskip('lightgbm')
+    pytest.importorskip('xgboost')
+    X, y = training_data
+    lightgbm = fit_lightgbm(client, X, y, {'n_estimators': 10, 'verbose': -1})
+    xgboost = fit_xgboost(client, X, y, {'n_estimators': 10, 'verbosity': 0})
+
+    for model in (lightgbm, xgboost):
+        assert type(model).__module__.split('.')[0] in ('lightgbm', 'xgboost')
+        assert model.predict_proba(X).shape == (X.shape[0], 2)
+
+
+def test_cluster_is_closed_when_training_raises():
+    with pytest.raises(RuntimeError):
+        with dask_client(workers=1) as client:
+            raise RuntimeError('training failed')
+
+    assert client.status == 'closed'
+    assert client.cluster.status.name == 'closed'
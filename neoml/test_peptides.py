@@ -0,0 +1,82 @@
+"""
+Tests for peptides.py window generation.
+
+Run from neoml/:
+    python -m pytest -q test_peptides.py
+"""
+
+import pandas as pd
+
+from peptides import generate_windows
+
+PROTEIN = 'MKTAYIAKQRQISFVKSHFSRQLEERLGLIEVQ'
+
+
+def windows_for(position, ref, alt, vtype):
+    variants = pd.DataFrame({'protein_id': ['P1'], 'position': [position],
+                             'ref': [ref], 'alt': [alt], 'type': [vtype]})
+    return generate_windows({'P1': PROTEIN}, variants)
+
+
+def test_deletion_windows_span_the_junction():
+    windows = windows_for(12, 'ISF', '-', 'deletion')
+    mutant = PROTEIN[:11] + PROTEIN[14:]
+
+    assert len(windows)
+    for row in windows.itertuples(index=False):
+        assert row.peptide not in PROTEIN
+        assert row.peptide in mutant
+        # pepMutStart points at the residue left of the junction
+        junction = row.peptide[row.pepMutStart - 1:row.pepMutStart + 1]
+        assert junction == PROTEIN[10] + PROTEIN[14]
+
+
+def test_deletion_windows_have_no_wild_type():
+    windows = windows_for(12, 'ISF', '-', 'deletion')
+
+    assert (windows['wt_peptide'] == '').all()
+
+
+def test_insertion_windows_have_no_wild_type():
+    # Insert WW before I12: ...KQRQ WW ISFV...
+    windows = windows_for(12, '-', 'WW', 'insertion')
+    mutant = PROTEIN[:11] + 'WW' + PROTEIN[11:]
+
+    assert len(windows)
+    assert 'WISFVKSH' in set(windows['peptide'])
+    for row in windows.itertuples(index=False):
+        assert 'W' in row.peptide and row.peptide in mutant
+        assert row.wt_peptide == ''
+
+
+def test_frameshift_windows_have_no_wild_type():
+    windows = windows_for(12, 'I', 'GPRW*', 'frameshift')
+    mutant = PROTEIN[:11] + 'GPRW'
+
+    assert len(windows)
+    for row in windows.itertuples(index=False):
+        assert row.peptide in mutant and row.peptide not in PROTEIN
+        assert row.wt_peptide == ''
+
+
+def test_substitution_wild_type_is_aligned():
+    windows = windows_for(12, 'IS', 'KT', 'missense')
+
+    assert len(windows)
+    for row in windows.itertuples(index=False):
+        start = (PROTEIN[:11] + 'KT' + PROTEIN[13:]).index(row.peptide)
+        assert row.wt_peptide == PROTEIN[start:start + row.lengthOfPeptide]
+
+
+def test_terminal_deletion_emits_nothing():
+    assert windows_for(1, 'M', '-', 'deletion').empty
+    assert windows_for(len(PROTEIN), PROTEIN[-1], '-', 'deletion').empty
+
+
+def test_snv_windows_cover_the_mutation():
+    windows = windows_for(5, 'Y', 'W', 'missense')
+
+    assert set(windows['lengthOfPeptide']) == set(range(8, 12))
+    for row in windows.itertuples(index=False):
+        assert row.peptide[row.pepMutStart - 1] == 'W'
+        assert row.wt_peptide[row.pepMutStart - 1] == 'Y'
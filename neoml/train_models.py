@@ -2,153 +2,401 @@
 """
 Train and save NeoTImmuML models
 """
-import pandas as pd
 import numpy as np
 import warnings
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import OneHotEncoder
 from lightgbm import LGBMClassifier
 from xgboost import XGBClassifier
 from joblib import dump
-from sklearn.metrics import accuracy_score, roc_auc_score, f1_score
-from scipy import sparse
+from sklearn.metrics import accuracy_score, roc_auc_score, f1_score, brier_score_loss
+import argparse
 import os
+from contextlib import nullcontext
+
+from feature_selection import METHODS as SELECTION_METHODS
+from feature_selection import compare, first_pass_model, model_size, select_features, time_predict
+from registry import REGISTRY_DIR, promote, publish, staging_dir
+from distributed_training import BACKENDS, dask_client, fit_lightgbm, fit_xgboost
+from calibration import METHODS, build_calibration, choose_threshold
+from instrumentation import Instrumentation, PROFILERS
+from encoding import SparseCategoryEncoder
+from schema import DEFAULT_DATA_PATH, FEATURE_COLUMNS, LABEL_COLUMN, load_tumoragdb
+from splitting import (SPLIT_CHOICES, fold_splits, group_folds, group_train_test_split,
+                       leakage_report, print_leakage_report, split_overlap)
 
 warnings.filterwarnings("ignore")
 
 def main():
+    parser = argparse.ArgumentParser(description='Train and save NeoTImmuML models')
+    parser.add_argument(
+        '--data',
+        default=DEFAULT_DATA_PATH,
+        help=f'Training data, CSV or Parquet (default: {DEFAULT_DATA_PATH})'
+    )
+    parser.add_argument(
+        '--split-by',
+        choices=SPLIT_CHOICES,
+        default='peptide',
+        help='Group rows by peptide, source study or HLA so no group spans '
+             'train and test; random reproduces the old stratified split (default: peptide)'
+    )
+    parser.add_argument(
+        '--exclude',
+        action='append',
+        default=[],
+        help='Feature column to leave out (repeatable)'
+    )
+    parser.add_argument(
+        '--drop-leaky',
+        action='store_true',
+        help='Leave out every column the leakage report flags as a perfect label predictor'
+    )
+    parser.add_argument(
+        '--select',
+        choices=['none'] + SELECTION_METHODS,
+        default='none',
+        help='Prune encoded columns by training frequency, first-pass LightGBM '
+             'importance or chi2 (default: none, all columns)'
+    )
+    parser.add_argument(
+        '--min-count',
+        type=int,
+        default=4,
+        help='Minimum training occurrences per column for --select frequency (default: 4)'
+    )
+    parser.add_argument(
+        '--chi2-alpha',
+        type=float,
+        default=0.05,
+        help='p-value cut-off for --select chi2 (default: 0.05)'
+    )
+    parser.add_argument(
+        '--compare-full',
+        action='store_true',
+        help='Report size, latency and AUC of a LightGBM on the full vs pruned columns'
+    )
+    parser.add_argument(
+        '--calibration',
+        choices=METHODS,
+        default='isotonic',
+        help='Calibrator fitted on out-of-fold probabilities (default: isotonic)'
+    )
+    parser.add_argument(
+        '--cv-folds',
+        type=int,
+        default=5,
+        help='Folds for out-of-fold probabilities, 0 skips calibration (default: 5)'
+    )
+    parser.add_argument(
+        '--backend',
+        choices=BACKENDS,
+        default='local',
+        help='Train LightGBM/XGBoost in-process or across a Dask cluster (default: local)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=2,
+        help='Worker processes of the local Dask cluster (default: 2)'
+    )
+    parser.add_argument(
+        '--scheduler',
+        help='Address of an existing Dask scheduler instead of a local cluster'
+    )
+    parser.add_argument(
+        '--registry',
+        default=str(REGISTRY_DIR),
+        help=f'Model registry directory (default: {REGISTRY_DIR})'
+    )
+    parser.add_argument(
+        '--no-promote',
+        action='store_true',
+        help='Publish the new version without pointing CURRENT at it'
+    )
+    parser.add_argument(
+        '--no-registry',
+        action='store_true',
+        help='Overwrite the artifacts in output/ in place (legacy layout)'
+    )
+    parser.add_argument(
+        '--metrics',
+        help='Append per-stage timing metrics (JSON lines) to this file'
+    )
+    parser.add_argument(
+        '--profile',
+        choices=PROFILERS,
+        help='Profile each stage with cProfile, or print the PID for py-spy'
+    )
+    args = parser.parse_args()
+    instr = Instrumentation(args.metrics, run='train', profiler=args.profile)
+
     print("="*70)
     print("NEOTIMMUML - TRAINING MODELS")
     print("="*70)
 
     # Load data
     print("\n[1/5] Loading data...")
-    file_path = "../tumordb/tumoragdb_data.csv"
-    data = pd.read_csv(file_path)
-    X = data.iloc[:, 2:]
-    y = data['immunogenicity']
-    print(f"✓ Loaded {len(data):,} samples")
+    with instr.stage('load') as record:
+        # Categoricals, float32/nullable ints and a uint8 label (schema.COLUMN_DTYPES)
+        data = load_tumoragdb(args.data)
+        y = data[LABEL_COLUMN]
+        frame_mb = data.memory_usage(deep=True).sum() / 1e6
+        record.update(rows=len(data), frame_mb=round(frame_mb, 1))
+    print(f"✓ Loaded {len(data):,} samples ({frame_mb:,.1f} MB in memory)")
+
+    # Columns whose values alone give the label away
+    with instr.stage('leakage', rows=len(data)):
+        leakage = leakage_report(data)
+    print("\nLeakage report (label purity by column value):")
+    print_leakage_report(leakage, top=5)
+    excluded = set(args.exclude)
+    if args.drop_leaky:
+        excluded |= set(leakage.loc[leakage['perfect'], 'column'])
+    feature_columns = [c for c in FEATURE_COLUMNS if c not in excluded]
+    if excluded:
+        print(f"✓ Excluded {len(excluded)} columns: {', '.join(sorted(excluded))}")
+    X = data[feature_columns]
 
     # Encode categorical features using sparse matrices to save memory
     print("\n[2/5] Encoding features (sparse)...")
-    # Use OneHotEncoder which creates sparse matrices directly, avoiding dense intermediate
-    encoder = OneHotEncoder(sparse_output=True, handle_unknown='ignore')
-    X_sparse = encoder.fit_transform(X.astype(str))
+    # Built straight from categorical codes and typed values - no string copy
+    encoder = SparseCategoryEncoder()
+    with instr.stage('encode', rows=len(X)) as record:
+        X_sparse = encoder.fit_transform(X)
+        record.update(nnz=int(X_sparse.nnz), n_features=int(X_sparse.shape[1]))
     print(f"✓ Encoded to {X_sparse.shape[1]:,} features (sparse format)")
     print(f"✓ Memory efficiency: {X_sparse.nnz / (X_sparse.shape[0] * X_sparse.shape[1]) * 100:.2f}% non-zero")
     X = X_sparse
 
-    # Train/test split
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
-    print(f"✓ Split: {X_train.shape[0]:,} train / {X_test.shape[0]:,} test")
+    # Train/test split: grouped so a peptide/study/allele never spans both sides
+    if args.split_by == 'random':
+        train_idx, test_idx = train_test_split(
+            np.arange(len(y)), test_size=0.2, random_state=42, stratify=y
+        )
+    else:
+        train_idx, test_idx = group_train_test_split(data, args.split_by, test_size=0.2)
+    X_train, X_test = X[train_idx], X[test_idx]
+    y_train, y_test = y.iloc[train_idx], y.iloc[test_idx]
+    print(f"✓ Split by {args.split_by}: {X_train.shape[0]:,} train / {X_test.shape[0]:,} test")
+    for group, fraction in split_overlap(data, train_idx, test_idx).items():
+        print(f"  Test rows sharing a {group} with train: {fraction:.1%}")
 
     # Set random seed
     random_seed = 42
 
+    # Feature selection on the training rows only
+    keep = None
+    if args.select != 'none':
+        print(f"\n[2b/5] Selecting features ({args.select})...")
+        n_full = X_train.shape[1]
+        full_model = None
+        with instr.stage('select', rows=X_train.shape[0]) as record:
+            if args.select == 'importance' or args.compare_full:
+                full_model = first_pass_model(X_train, y_train, random_seed)
+            keep = select_features(X_train, y_train, args.select, min_count=args.min_count,
+                                   alpha=args.chi2_alpha, model=full_model)
+            record.update(n_features=n_full, kept=len(keep))
+        X_test_full = X_test
+        X_train, X_test = X_train[:, keep], X_test[:, keep]
+        print(f"✓ Kept {len(keep):,} of {n_full:,} columns ({len(keep) / n_full:.1%})")
+
+        if args.compare_full:
+            # Same first-pass configuration on both column sets
+            pruned_model = first_pass_model(X_train, y_train, random_seed)
+            stats = {}
+            for label, model, X_eval in [('full', full_model, X_test_full),
+                                         ('pruned', pruned_model, X_test)]:
+                stats[label] = {
+                    'width': X_eval.shape[1],
+                    'nnz': int(X_eval.nnz),
+                    'model_bytes': model_size(model),
+                    'predict_s': time_predict(model, X_eval),
+                }
+                if len(np.unique(y_test)) > 1:
+                    stats[label]['auc'] = roc_auc_score(y_test, model.predict_proba(X_eval)[:, 1])
+            compare(stats['full'], stats['pruned'])
+
     print("\n[3/5] Training models...")
 
-    # Model 1: Random Forest (now works with sparse matrices)
-    print("  [1/3] Random Forest (100 trees)...", end=" ", flush=True)
-    model_1 = RandomForestClassifier(
-        n_estimators=100,
-        max_depth=10,
-        min_samples_split=2,
-        min_samples_leaf=4,
-        random_state=random_seed,
-        n_jobs=1  # Use 1 job to minimize memory usage
-    )
-    model_1.fit(X_train, y_train)
-    print("✓")
-
-    # Model 2: LightGBM
-    print("  [2/3] LightGBM (100 trees)...", end=" ", flush=True)
-    model_2 = LGBMClassifier(
-        n_estimators=100,
-        learning_rate=0.05,
-        max_depth=7,
-        num_leaves=31,
-        min_child_samples=50,
-        subsample=0.6,
-        colsample_bytree=0.8,
-        reg_lambda=0.01,
-        random_state=random_seed,
-        verbose=-1
-    )
-    model_2.fit(X_train, y_train)
-    print("✓")
-
-    # Model 3: XGBoost
-    print("  [3/3] XGBoost (100 trees)...", end=" ", flush=True)
-    model_3 = XGBClassifier(
-        n_estimators=100,
-        learning_rate=0.05,
-        max_depth=5,
-        min_child_weight=3,
-        subsample=0.6,
-        colsample_bytree=1.0,
-        gamma=0.1,
-        reg_alpha=0.01,
-        reg_lambda=0,
-        random_state=random_seed,
-        eval_metric='logloss',
-        verbosity=0
-    )
-    model_3.fit(X_train, y_train)
-    print("✓")
-
-    # Create output directories
+    # Dask cluster for the boosted models; RandomForest always trains in-process.
+    # The with block shuts the cluster down even if training raises.
+    backend = dask_client(args.workers, args.scheduler) if args.backend == 'dask' else nullcontext()
+    with backend as client:
+        if client is not None:
+            print(f"  Dask backend: {len(client.scheduler_info()['workers'])} workers "
+                  f"({client.dashboard_link})")
+
+        # Model 1: Random Forest (now works with sparse matrices)
+        print("  [1/3] Random Forest (100 trees)...", end=" ", flush=True)
+        model_1 = RandomForestClassifier(
+            n_estimators=100,
+            max_depth=10,
+            min_samples_split=2,
+            min_samples_leaf=4,
+            random_state=random_seed,
+            n_jobs=1  # Use 1 job to minimize memory usage
+        )
+        with instr.stage('fit_randomforest', rows=X_train.shape[0], nnz=int(X_train.nnz)):
+            model_1.fit(X_train, y_train)
+        print("✓")
+
+        # Model 2: LightGBM
+        print("  [2/3] LightGBM (100 trees)...", end=" ", flush=True)
+        model_2 = LGBMClassifier(
+            n_estimators=100,
+            learning_rate=0.05,
+            max_depth=7,
+            num_leaves=31,
+            min_child_samples=50,
+            subsample=0.6,
+            colsample_bytree=0.8,
+            reg_lambda=0.01,
+            random_state=random_seed,
+            verbose=-1
+        )
+        with instr.stage('fit_lightgbm', rows=X_train.shape[0], nnz=int(X_train.nnz),
+                         backend=args.backend):
+            if client is not None:
+                model_2 = fit_lightgbm(client, X_train, y_train, model_2.get_params())
+            else:
+                model_2.fit(X_train, y_train)
+        print("✓")
+
+        # Model 3: XGBoost
+        print("  [3/3] XGBoost (100 trees)...", end=" ", flush=True)
+        model_3 = XGBClassifier(
+            n_estimators=100,
+            learning_rate=0.05,
+            max_depth=5,
+            min_child_weight=3,
+            subsample=0.6,
+            colsample_bytree=1.0,
+            gamma=0.1,
+            reg_alpha=0.01,
+            reg_lambda=0,
+            random_state=random_seed,
+            eval_metric='logloss',
+            verbosity=0
+        )
+        with instr.stage('fit_xgboost', rows=X_train.shape[0], nnz=int(X_train.nnz),
+                         backend=args.backend):
+            if client is not None:
+                model_3 = fit_xgboost(client, X_train, y_train, model_3.get_params())
+            else:
+                model_3.fit(X_train, y_train)
+        print("✓")
+
+    models = {"RandomForest": model_1, "LightGBM": model_2, "XGBoost": model_3}
+
+    # Out-of-fold probabilities on the training split -> calibrator + operating points
+    calibrations = {}
+    if args.cv_folds > 1:
+        print(f"\n[3b/5] Calibrating ({args.calibration}, {args.cv_folds}-fold out-of-fold)...")
+        y_train_values = np.asarray(y_train)
+        train_folds = None
+        if args.split_by != 'random':
+            # Out-of-fold probabilities use the same grouping as the test split
+            train_folds = group_folds(data.iloc[train_idx], args.split_by, args.cv_folds)
+        for name, model in models.items():
+            print(f"  {name}...", end=" ", flush=True)
+            splits = fold_splits(train_folds) if train_folds is not None else None
+            with instr.stage(f'calibrate_{name.lower()}', rows=X_train.shape[0]):
+                calibrations[name] = build_calibration(
+                    model, X_train, y_train_values, method=args.calibration,
+                    folds=args.cv_folds, random_state=random_seed, splits=splits
+                )
+            print("✓")
+
+    # Artifacts go to a fresh registry staging directory (or output/ in place)
     print("\n[4/5] Creating output directories...")
-    os.makedirs("output/RandomForest", exist_ok=True)
-    os.makedirs("output/LightGBM", exist_ok=True)
-    os.makedirs("output/XGBoost", exist_ok=True)
-    print(f"  ✓ output/RandomForest/")
-    print(f"  ✓ output/LightGBM/")
-    print(f"  ✓ output/XGBoost/")
+    out = 'output' if args.no_registry else str(staging_dir(args.registry))
+    for name in models:
+        os.makedirs(os.path.join(out, name), exist_ok=True)
+        print(f"  ✓ {os.path.join(out, name)}/")
 
     # Save models and encoder
     print("\n[5/5] Saving models and encoder...")
-    dump(model_1, 'output/RandomForest/model.joblib')
-    print(f"  ✓ output/RandomForest/model.joblib")
+    with instr.stage('save'):
+        for name, model in models.items():
+            dump(model, os.path.join(out, name, 'model.joblib'))
+            print(f"  ✓ {os.path.join(out, name, 'model.joblib')}")
 
-    dump(model_2, 'output/LightGBM/model.joblib')
-    print(f"  ✓ output/LightGBM/model.joblib")
+        for name, calibration in calibrations.items():
+            dump(calibration, os.path.join(out, name, 'calibration.joblib'))
+            print(f"  ✓ {os.path.join(out, name, 'calibration.joblib')}")
 
-    dump(model_3, 'output/XGBoost/model.joblib')
-    print(f"  ✓ output/XGBoost/model.joblib")
+        # Save encoder for production inference
+        dump(encoder, os.path.join(out, 'encoder.joblib'))
+        print(f"  ✓ {os.path.join(out, 'encoder.joblib')} (required for inference)")
 
-    # Save encoder for production inference
-    dump(encoder, 'output/encoder.joblib')
-    print(f"  ✓ output/encoder.joblib (required for inference)")
+        # Surviving columns; a stale selection would not match the new models
+        selection_path = os.path.join(out, 'feature_selection.joblib')
+        if keep is not None:
+            dump({'method': args.select, 'keep': keep, 'n_features': X_sparse.shape[1]},
+                 selection_path)
+            print(f"  ✓ {selection_path} ({len(keep):,} columns)")
+        elif os.path.exists(selection_path):
+            os.remove(selection_path)
 
     # Quick evaluation
     print("\n[6/6] Evaluating models on test set...")
     print("-"*70)
 
-    for name, model in [("Random Forest", model_1), ("LightGBM", model_2), ("XGBoost", model_3)]:
-        y_pred = model.predict(X_test)
-        y_proba = model.predict_proba(X_test)[:, 1]
+    metrics = {}
+    for name, model in models.items():
+        stage = f"predict_{name.lower()}"
+        with instr.stage(stage, rows=X_test.shape[0], nnz=int(X_test.nnz)):
+            y_raw = model.predict_proba(X_test)[:, 1]
+
+        y_proba, threshold = y_raw, 0.5
+        if name in calibrations:
+            # Calibrated scores at the F1-optimal out-of-fold operating point
+            y_proba = calibrations[name]['calibrator'].predict(y_raw)
+            threshold = choose_threshold(calibrations[name]['table'])
+        y_pred = (y_proba >= threshold).astype(int)
 
         acc = accuracy_score(y_test, y_pred)
-        auc = roc_auc_score(y_test, y_proba)
+        # Ranking metric on raw scores; isotonic steps would only add ties
+        auc = roc_auc_score(y_test, y_raw)
         f1 = f1_score(y_test, y_pred)
+        brier = brier_score_loss(y_test, y_proba)
+        metrics[name] = {'accuracy': acc, 'auc': auc, 'f1': f1, 'brier': brier,
+                         'threshold': threshold}
+
+        print(f"{name:20s}: Acc={acc:.4f} | AUC={auc:.4f} | F1={f1:.4f} | "
+              f"Brier={brier:.4f} | t={threshold:.3f}")
+
+    # Publish the staged artifacts as one immutable version, then promote it
+    if not args.no_registry:
+        with instr.stage('publish'):
+            version = publish(out, metrics, options=vars(args), registry=args.registry)
+            if not args.no_promote:
+                promote(version, args.registry)
+        state = "not promoted" if args.no_promote else "promoted to CURRENT"
+        print(f"\n✓ Published model version {version} ({state})")
+        out = os.path.join(args.registry, 'versions', version)
 
-        print(f"{name:20s}: Acc={acc:.4f} | AUC={auc:.4f} | F1={f1:.4f}")
+    instr.summary()
 
     print("\n" + "="*70)
     print("✓ ALL COMPLETE!")
-    print(f"✓ Models saved in: {os.path.join(os.getcwd(), 'output')}")
+    print(f"✓ Models saved in: {os.path.join(os.getcwd(), out)}")
     print(f"✓ Directory structure:")
-    print(f"    output/")
-    print(f"    ├── encoder.joblib (OneHotEncoder for inference)")
+    print(f"    {out}/")
+    if not args.no_registry:
+        print(f"    ├── manifest.json (file hashes, metrics, options)")
+    print(f"    ├── encoder.joblib (SparseCategoryEncoder for inference)")
+    print(f"    ├── feature_selection.joblib (kept columns, with --select)")
     print(f"    ├── RandomForest/")
-    print(f"    │   └── model.joblib")
+    print(f"    │   ├── model.joblib")
+    print(f"    │   └── calibration.joblib")
     print(f"    ├── LightGBM/")
-    print(f"    │   └── model.joblib")
+    print(f"    │   ├── model.joblib")
+    print(f"    │   └── calibration.joblib")
     print(f"    └── XGBoost/")
-    print(f"        └── model.joblib")
+    print(f"        ├── model.joblib")
+    print(f"        └── calibration.joblib")
     print("="*70)
 
 if __name__ == "__main__":
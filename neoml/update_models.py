@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+NeoTImmuML Warm-Start Update
+============================
+Updates the promoted LightGBM/XGBoost models with newly validated records
+instead of retraining from scratch.
+
+1. The encoder is extended with the categories first seen in the new records;
+   existing categories keep their output columns and new ones are numbered
+   after the last column (encoding.SparseCategoryEncoder.extend). With feature
+   selection, added columns seen at least --min-count times are appended to
+   the kept columns, so the models' existing inputs stay where they were.
+2. The boosters are widened to the new column count (trees only reference
+   the old columns, so their predictions are unchanged) and boosting
+   continues for --rounds rounds on the new records plus a replay sample of
+   the previous training table.
+3. Part of the new records is held out (replayed rows always go to
+   boosting). The calibrator is refitted on one half of it and the models
+   are evaluated on the other half, before and after the update.
+4. The result is published as a new registry version (see registry.py).
+
+RandomForest cannot grow new input columns and is not carried over; retrain
+with train_models.py for it.
+
+Usage:
+    python update_models.py --data new_records.csv [--replay ../tumordb/tumoragdb_data.csv]
+                            [--replay-rows 20000] [--rounds 50] [--base-version V]
+                            [--no-promote]
+"""
+
+import argparse
+import json
+import os
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+from joblib import dump, load
+from lightgbm import Booster as LGBMBooster
+from lightgbm import LGBMClassifier
+from sklearn.metrics import brier_score_loss, roc_auc_score
+from xgboost import Booster as XGBBooster
+from xgboost import XGBClassifier
+
+from calibration import METHODS, choose_threshold, fit_calibrator, operating_points
+from encoding import SparseCategoryEncoder
+from instrumentation import Instrumentation, PROFILERS
+from registry import (REGISTRY_DIR, artifact_dir, current_version, promote, publish,
+                      read_manifest, staging_dir)
+from schema import LABEL_COLUMN, load_tumoragdb
+from splitting import group_train_test_split
+
+warnings.filterwarnings("ignore")
+
+BOOSTED_MODELS = ['LightGBM', 'XGBoost']
+
+ROUNDS = 50
+REPLAY_ROWS = 20_000
+MIN_COUNT = 4
+
+
+def widen_lightgbm(model, n_features):
+    """
+    LightGBM booster of a fitted model, accepting n_features input columns.
+
+    The model text is edited: max_feature_idx, feature names and (unused)
+    feature ranges are extended; the trees are untouched.
+    """
+    text = model.booster_.model_to_string()
+    lines = []
+    for line in text.splitlines():
+        if line.startswith('max_feature_idx='):
+            old = int(line.split('=', 1)[1]) + 1
+            line = f'max_feature_idx={n_features - 1}'
+        elif line.startswith('feature_names='):
+            line += ''.join(f' Column_{i}' for i in range(old, n_features))
+        elif line.startswith('feature_infos='):
+            line += ' none' * (n_features - old)
+        lines.append(line)
+    return LGBMBooster(model_str='\n'.join(lines) + '\n')
+
+
+def widen_xgboost(model, n_features):
+    """XGBoost booster of a fitted model, accepting n_features input columns."""
+    raw = json.loads(bytes(model.get_booster().save_raw('json')))
+    raw['learner']['learner_model_param']['num_feature'] = str(n_features)
+    booster = XGBBooster()
+    booster.load_model(bytearray(json.dumps(raw).encode()))
+    return booster
+
+
+def continue_boosting(model, X, y, rounds=ROUNDS):
+    """
+    Add rounds trees to a fitted LightGBM/XGBoost classifier.
+
+    Args:
+        model: Fitted LGBMClassifier or XGBClassifier
+        X: Update matrix, possibly wider than the model's training matrix
+        y: Labels
+        rounds: Boosting rounds to add
+
+    Returns:
+        new classifier holding the old and the new trees
+    """
+    params = dict(model.get_params(), n_estimators=rounds)
+    if isinstance(model, LGBMClassifier):
+        return LGBMClassifier(**params).fit(X, y, init_model=widen_lightgbm(model, X.shape[1]))
+    if isinstance(model, XGBClassifier):
+        return XGBClassifier(**params).fit(X, y, xgb_model=widen_xgboost(model, X.shape[1]))
+    raise TypeError(f"Cannot warm-start {type(model).__name__}")
+
+
+def replay_sample(path, n_rows=REPLAY_ROWS, random_state=42):
+    """Random sample of the previous training table (None if unavailable)."""
+    if not path or not os.path.exists(path) or n_rows <= 0:
+        return None
+    data = load_tumoragdb(path)
+    return data.sample(min(n_rows, len(data)), random_state=random_state)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Warm-start the promoted boosted models on new validated records'
+    )
+    parser.add_argument('--data', required=True,
+                        help='New labelled records, CSV or Parquet (TumorAgDB columns)')
+    parser.add_argument('--replay',
+                        help='Previous training table to replay a sample of '
+                             '(default: the data the base version was trained on)')
+    parser.add_argument('--replay-rows', type=int, default=REPLAY_ROWS,
+                        help=f'Rows replayed from the previous table (default: {REPLAY_ROWS})')
+    parser.add_argument('--rounds', type=int, default=ROUNDS,
+                        help=f'Boosting rounds added per model (default: {ROUNDS})')
+    parser.add_argument('--min-count', type=int, default=MIN_COUNT,
+                        help='Minimum occurrences for a new column to join the kept columns '
+                             f'(default: {MIN_COUNT})')
+    parser.add_argument('--calibration', choices=METHODS, default='isotonic',
+                        help='Calibrator refitted on the held-out update rows (default: isotonic)')
+    parser.add_argument('--base-version',
+                        help='Registry version to update (default: the promoted one)')
+    parser.add_argument('--registry', default=str(REGISTRY_DIR),
+                        help=f'Model registry directory (default: {REGISTRY_DIR})')
+    parser.add_argument('--no-promote', action='store_true',
+                        help='Publish the new version without pointing CURRENT at it')
+    parser.add_argument('--metrics',
+                        help='Append per-stage timing metrics (JSON lines) to this file')
+    parser.add_argument('--profile', choices=PROFILERS,
+                        help='Profile each stage with cProfile, or print the PID for py-spy')
+    args = parser.parse_args()
+    instr = Instrumentation(args.metrics, run='update', profiler=args.profile)
+
+    print("=" * 70)
+    print("NEOTIMMUML - WARM-START UPDATE")
+    print("=" * 70)
+
+    base_version = args.base_version or current_version(args.registry)
+    if base_version is None:
+        print("Error: no promoted version to update; train one with train_models.py")
+        sys.exit(1)
+    base = artifact_dir(base_version, args.registry)
+    manifest = read_manifest(base_version, args.registry)
+    encoder = load(base / 'encoder.joblib')
+    if not isinstance(encoder, SparseCategoryEncoder):
+        print("Error: the base version's encoder cannot be extended; retrain with train_models.py")
+        sys.exit(1)
+    selection = load(base / 'feature_selection.joblib') \
+        if (base / 'feature_selection.joblib').exists() else None
+    models = {name: load(base / name / 'model.joblib') for name in BOOSTED_MODELS
+              if (base / name / 'model.joblib').exists()}
+    print(f"✓ Base version {base_version}: {', '.join(models)}")
+
+    # New records plus a replay sample of the previous corpus
+    print("\n[1/5] Loading data...")
+    with instr.stage('load') as record:
+        new = load_tumoragdb(args.data)
+        # Chained updates keep replaying the original corpus, not the last batch
+        replay_path = args.replay or manifest['options'].get('replay') \
+            or manifest['options'].get('data')
+        replay = replay_sample(replay_path, args.replay_rows)
+        data = new if replay is None else pd.concat([new, replay], ignore_index=True)
+        data = data.reset_index(drop=True)
+        record.update(rows=len(data), new_rows=len(new))
+    print(f"✓ {len(new):,} new records + {0 if replay is None else len(replay):,} replayed")
+
+    # Extended vocabulary: old columns keep their indices
+    print("\n[2/5] Extending the encoder...")
+    features = list(encoder.feature_names_in_)
+    with instr.stage('encode', rows=len(data)) as record:
+        encoder, added = encoder.extend(new[features])
+        X_full = encoder.transform(data[features])
+        record.update(n_features=int(X_full.shape[1]), added=len(added))
+    print(f"✓ {len(added):,} new columns ({X_full.shape[1]:,} total)")
+
+    keep = None
+    if selection is not None:
+        counts = np.asarray(X_full[:len(new)][:, added].sum(axis=0)).ravel() \
+            if len(added) else np.zeros(0)
+        keep = np.concatenate([selection['keep'], added[counts >= args.min_count]])
+        print(f"✓ Kept {len(keep) - len(selection['keep']):,} new columns "
+              f"(seen >= {args.min_count} times), {len(keep):,} in total")
+    X = X_full[:, keep] if keep is not None else X_full
+    y = data[LABEL_COLUMN].to_numpy()
+
+    # Only new records are held out: replayed rows were seen by the base
+    # trees. Calibrate and evaluate on two halves of the held-out new rows (the
+    # second split needs another seed, the first one fixed the hash buckets)
+    new_idx, holdout_idx = group_train_test_split(data.iloc[:len(new)], 'peptide', test_size=0.3)
+    calib_pos, test_pos = group_train_test_split(data.iloc[holdout_idx].reset_index(drop=True),
+                                                 'peptide', test_size=0.5, seed=43)
+    calib_idx, test_idx = holdout_idx[calib_pos], holdout_idx[test_pos]
+    # Replay rows are all boosted on, except those sharing a held-out peptide
+    replay_idx = np.arange(len(new), len(data))
+    shared = data['peptide'].iloc[replay_idx].isin(data['peptide'].iloc[holdout_idx])
+    train_idx = np.concatenate([new_idx, replay_idx[~shared.to_numpy()]])
+    old_width = selection['keep'].shape[0] if selection is not None else X_full.shape[1] - len(added)
+    print(f"✓ {len(train_idx):,} boosting / {len(calib_idx):,} calibration / "
+          f"{len(test_idx):,} evaluation rows")
+
+    print(f"\n[3/5] Boosting {args.rounds} more rounds...")
+    updated, calibrations, metrics = {}, {}, {}
+    for name, model in models.items():
+        print(f"  {name}...", end=" ", flush=True)
+        with instr.stage(f'fit_{name.lower()}', rows=len(train_idx)):
+            updated[name] = continue_boosting(model, X[train_idx], y[train_idx], args.rounds)
+        print("✓")
+
+        raw = updated[name].predict_proba(X[calib_idx])[:, 1]
+        calibrator = fit_calibrator(raw, y[calib_idx], args.calibration)
+        calibrations[name] = {
+            'method': args.calibration,
+            'calibrator': calibrator,
+            'oof': pd.DataFrame({'prob_raw': raw, 'label': y[calib_idx]}),
+            'table': operating_points(calibrator.predict(raw), y[calib_idx]),
+        }
+
+        before = model.predict_proba(X[test_idx][:, :old_width])[:, 1]
+        after = updated[name].predict_proba(X[test_idx])[:, 1]
+        if len(np.unique(y[test_idx])) > 1:
+            metrics[name] = {
+                'auc_before': roc_auc_score(y[test_idx], before),
+                'auc': roc_auc_score(y[test_idx], after),
+                'brier': brier_score_loss(y[test_idx], calibrator.predict(after)),
+                'threshold': choose_threshold(calibrations[name]['table']),
+            }
+
+    print("\n[4/5] Evaluating on held-out update rows...")
+    print("-" * 70)
+    for name, values in metrics.items():
+        print(f"{name:20s}: AUC {values['auc_before']:.4f} -> {values['auc']:.4f} | "
+              f"Brier={values['brier']:.4f} | t={values['threshold']:.3f}")
+
+    print("\n[5/5] Publishing...")
+    with instr.stage('publish'):
+        out = staging_dir(args.registry)
+        for name, model in updated.items():
+            os.makedirs(out / name, exist_ok=True)
+            dump(model, out / name / 'model.joblib')
+            dump(calibrations[name], out / name / 'calibration.joblib')
+        dump(encoder, out / 'encoder.joblib')
+        if keep is not None:
+            dump({'method': selection['method'], 'keep': keep, 'n_features': X_full.shape[1]},
+                 out / 'feature_selection.joblib')
+        options = dict(vars(args), replay=replay_path, update_of=base_version)
+        version = publish(out, metrics, options=options, registry=args.registry)
+        if not args.no_promote:
+            promote(version, args.registry)
+
+    state = "not promoted" if args.no_promote else "promoted to CURRENT"
+    print(f"✓ Published model version {version} ({state}), updated from {base_version}")
+    instr.summary()
+
+
+if __name__ == '__main__':
+    main()
@@ -8,8 +8,15 @@ app = marimo.App(width="medium")
 def _():
     import marimo as mo
     import random 
+    import sys
     import pandas as pd
-    return mo, pd, random
+    from pathlib import Path
+
+    sys.path.insert(0, str(mo.notebook_dir() / "neoml"))
+    import fastq
+    import results_store
+    import synthetic
+    return Path, fastq, mo, pd, random, results_store, synthetic
 
 
 @app.cell
@@ -28,8 +35,59 @@ def _(mo):
 
 
 @app.cell
-def _(file_uploader):
-    file_uploader
+def _(mo):
+    fastq_path = mo.ui.text(placeholder="/data/run1/tumor_R1.fastq.gz", label="...or a FastQ path on the server (for multi-GB runs):", full_width=True)
+    return (fastq_path,)
+
+
+@app.cell
+def _(fastq_path, file_uploader, mo):
+    mo.vstack([file_uploader, fastq_path])
+    return
+
+
+@app.cell
+def _():
+    # QC jobs already started, by file; outlives re-runs of the cell below
+    qc_started = {}
+    return (qc_started,)
+
+
+@app.cell
+def _(Path, fastq, fastq_path, file_uploader, qc_started):
+    # QC runs in background threads; the status cell below polls the jobs.
+    # Jobs are keyed by file, so editing the path does not restart QC of the
+    # uploads (and re-uploading the same file reuses its job)
+    qc_jobs = []
+    for i in range(len(file_uploader.value)):
+        contents = file_uploader.contents(i)
+        key = ('upload', file_uploader.name(i), len(contents), hash(contents))
+        if key not in qc_started:
+            qc_started[key] = fastq.submit_qc(contents, name=file_uploader.name(i))
+        qc_jobs.append(qc_started[key])
+    if fastq_path.value and Path(fastq_path.value).exists():
+        stat = Path(fastq_path.value).stat()
+        key = ('path', str(Path(fastq_path.value).resolve()), stat.st_size, stat.st_mtime_ns)
+        if key not in qc_started:
+            qc_started[key] = fastq.submit_qc(fastq_path.value)
+        qc_jobs.append(qc_started[key])
+    return (qc_jobs,)
+
+
+@app.cell
+def _(mo, qc_jobs):
+    qc_refresh = mo.ui.refresh(options=["1s", "5s"], default_interval="1s") if qc_jobs else None
+    return (qc_refresh,)
+
+
+@app.cell
+def _(mo, pd, qc_jobs, qc_refresh):
+    qc_refresh
+    mo.vstack([
+        mo.md("### 📊 Read QC"),
+        qc_refresh,
+        mo.ui.table(pd.DataFrame([job.status() for job in qc_jobs]), selection=None),
+    ]) if qc_jobs else mo.md("")
     return
 
 
@@ -48,34 +106,90 @@ def _(mo):
 
 
 @app.cell
-def _(generate_synthetic_peptide_data2):
-    data = generate_synthetic_peptide_data2()
-    return (data,)
+def _(mo):
+    predictions_path = mo.ui.text(value="neoml/predictions.csv", label="Predictions file (from predict.py):", full_width=True)
+    predictions_path
+    return (predictions_path,)
+
+
+@app.cell
+def _(Path, predictions_path, results_store, synthetic):
+    # Real runs go through the indexed SQLite store; without one, fall back to demo data
+    _path = Path(predictions_path.value)
+    if _path.exists():
+        store = results_store.open_store(_path)
+        source_note = f"Scored candidates from `{_path}`"
+    else:
+        store = results_store.ResultStore.from_frame(synthetic.demo_predictions(1000))
+        source_note = f"`{_path}` not found, showing synthetic demo data"
+    return source_note, store
+
+
+@app.cell
+def _(mo, store):
+    _default_sort = "prob_positive" if "prob_positive" in store.columns else store.columns[-1]
+    sort_by = mo.ui.dropdown(options=store.columns, value=_default_sort, label="Sort by")
+    descending = mo.ui.checkbox(value=True, label="Descending")
+    search = mo.ui.text(placeholder="peptide prefix", label="Search")
+    min_prob = mo.ui.slider(0.0, 1.0, step=0.05, value=0.0, label="Min P(immunogenic)")
+    page_size = mo.ui.dropdown(options=["25", "50", "100", "250"], value="50", label="Rows per page")
+    return descending, min_prob, page_size, search, sort_by
+
+
+@app.cell
+def _(min_prob, mo, page_size, search, store):
+    total_rows = store.count(search=search.value, min_prob=min_prob.value)
+    page_count = max(1, -(-total_rows // int(page_size.value)))
+    page = mo.ui.number(start=1, stop=page_count, value=1, label=f"Page (of {page_count:,})")
+    return page, total_rows
 
 
 @app.cell
-def _(data, mo):
-    table = mo.ui.table(data)
+def _(descending, min_prob, mo, page, page_size, search, sort_by, store):
+    # Only the visible page is materialised
+    page_data = store.page(
+        page=page.value,
+        page_size=int(page_size.value),
+        sort_by=sort_by.value,
+        descending=descending.value,
+        search=search.value,
+        min_prob=min_prob.value,
+    )
+    table = mo.ui.table(page_data, pagination=False, selection="single")
     return (table,)
 
 
 @app.cell
-def _(mo, table):
+def _(descending, min_prob, mo, page, page_size, search, sort_by, source_note, table, total_rows):
     mo.vstack([
         mo.md("## **Data Analysis**"),  # Bigger label
+        mo.md(f"{source_note} — {total_rows:,} matching rows"),
+        mo.hstack([search, min_prob, sort_by, descending]),
+        mo.hstack([page, page_size]),
         table
     ])
     return
 
 
 @app.cell
-def _(mo, table):
-    mo.md(f"""
-    The sequence **{table.value["Peptide_Sequence"].values[0]}** exhibits a dominant hydrophobic core typical of transmembrane or cytosolic proteins processed through the MHC-I pathway. Its strong HLA-A*02:01 binding potential makes it a good immunogenic candidate; however, its hydrophobicity poses formulation challenges. Expect aggregation during lyophilization or storage, requiring carrier conjugation (e.g., KLH or PEG) to maintain solubility. Commercial scaling would need optimized solvent systems and purification gradients.
-    """) if table.value["Peptide_Sequence"].values.any() else mo.md("")
-
-
-
+def _(calculate_hydrophobicity2, mo, store, table):
+    # Narrative is built for the selected row only
+    _row = table.value.iloc[0] if len(table.value) else None
+    _peptide = str(_row[store.peptide_column]) if _row is not None and store.peptide_column else ""
+    if _peptide:
+        _allele = _row.get("mhcAllele")
+        _binding = f"{_allele} binding potential" if isinstance(_allele, str) and _allele.strip() \
+            else "binding potential (unknown allele)"
+        _hydro = calculate_hydrophobicity2(_peptide)
+        _score = f" (P(immunogenic) = {_row['prob_positive']:.2f})" if "prob_positive" in _row else ""
+        if _hydro > 0:
+            _body = f"exhibits a dominant hydrophobic core (mean Kyte-Doolittle {_hydro:+.2f}) typical of transmembrane or cytosolic proteins processed through the MHC-I pathway. Its {_binding}{_score} makes it a candidate; however, its hydrophobicity poses formulation challenges. Expect aggregation during lyophilization or storage, requiring carrier conjugation (e.g., KLH or PEG) to maintain solubility. Commercial scaling would need optimized solvent systems and purification gradients."
+        else:
+            _body = f"is predominantly hydrophilic (mean Kyte-Doolittle {_hydro:+.2f}), so it should dissolve readily in aqueous buffers and tolerate lyophilization. Its {_binding}{_score} is the main qualification question; standard solid-phase synthesis and purification should scale without special solvent systems."
+        _narrative = mo.md(f"The sequence **{_peptide}** {_body}")
+    else:
+        _narrative = mo.md("")
+    _narrative
     return
 
 
@@ -114,64 +228,17 @@ def _(pd, random):
 
 
 @app.cell
-def _(pd, random):
-    AMINO_ACIDS2 = 'ACDEFGHIKLMNPQRSTVWY'
+def _():
     KYTE_DOITTLE2 = {
         'A': 1.8, 'C': 2.5, 'D': -3.5, 'E': -3.5, 'F': 2.8, 'G': -0.4, 'H': -3.2,
         'I': 4.5, 'K': -3.9, 'L': 3.8, 'M': 1.9, 'N': -3.5, 'P': -1.6, 'Q': -3.5,
         'R': -4.5, 'S': -0.8, 'T': -0.7, 'V': 4.2, 'W': 0.9, 'Y': -1.3
     }
 
-    # Tissue expression options
-    TISSUES = [
-        'ubiquitous (low level)', 'ubiquitous (low level)', 'ubiquitous (low level)',
-        'thyroid', 'mucosa, keratinocytes', 'mucosa, keratinocytes',
-        'testis, prostate', 'testis, prostate'
-    ]
-
-    def generate_peptide_sequence2(length):
-        """Generate a random peptide sequence of specified length."""
-        return ''.join(random.choice(AMINO_ACIDS2) for _ in range(length))
-
     def calculate_hydrophobicity2(sequence):
         """Calculate average hydrophobicity of a peptide sequence."""
-        return round(sum(KYTE_DOITTLE2[aa] for aa in sequence) / len(sequence), 2)
-
-    def generate_synthetic_peptide_data2(num_sequences=100):
-        """Generate synthetic peptide data with sequences, abundances, immunogenicity, hydrophobicity, and tissue."""
-        data = {
-            'Peptide_Sequence': [],
-            'Abundance': [],
-            'Length': [],
-            'Immunogenicity': [],
-            'Hydrophobicity': [],
-            'Tissue_Expression': []
-        }
-    
-        for _ in range(num_sequences):
-            # Random length between 8 and 11
-            length = random.randint(8, 11)
-            sequence = generate_peptide_sequence2(length)
-            # Generate abundance (log-normal distribution)
-            abundance = round(random.lognormvariate(mu=10, sigma=2), 2)
-            # Immunogenicity: 20% chance of being immunogenic (1), 80% non-immunogenic (0)
-            immunogenicity = random.choices([0, 1], weights=[0.8, 0.2])[0]
-            # Calculate hydrophobicity
-            hydrophobicity = calculate_hydrophobicity2(sequence)
-            # Random tissue from provided list
-            tissue = random.choice(TISSUES)
-        
-            data['Peptide_Sequence'].append(sequence)
-            data['Abundance'].append(abundance)
-            data['Length'].append(length)
-            data['Immunogenicity'].append(immunogenicity)
-            data['Hydrophobicity'].append(hydrophobicity)
-            data['Tissue_Expression'].append(tissue)
-    
-        # Create DataFrame
-        df = pd.DataFrame(data)
-        return df
-    return (generate_synthetic_peptide_data2,)
+        return round(sum(KYTE_DOITTLE2.get(aa, 0.0) for aa in sequence) / len(sequence), 2)
+    return (calculate_hydrophobicity2,)
 
 
 if __name__ == "__main__":